@@ -1,13 +1,55 @@
 import logging
+import re
+import threading
 
 import requests
 
+from . import jsonbackend
+from .httpcache import ResponseCache
+
 log = logging.getLogger(__name__)
 
 
 class APIClient:
-    def __init__(self, api_key):
+    # (URL regex, seconds) couples: GET responses kept during a run
+    CACHE_TTLS = ()
+
+    # (connect, read) timeouts in seconds, default and per URL regex
+    DEFAULT_TIMEOUT = (10, 60)
+    TIMEOUTS = ()
+
+    # URL regexes: hedged GET requests latencies are compared among those
+    # matching the same one (or none)
+    ENDPOINTS = ()
+
+    def __init__(self, api_key, rate_limiter=None, cache=None,
+                 disk_cache=None, hedger=None):
+        """
+        :param rate_limiter: a RateLimiter, possibly shared with other
+            clients, consumed once per request.
+        :param cache: a ResponseCache for GET requests, defaults to one
+            using ``CACHE_TTLS``
+        :param disk_cache: an optional DiskCache, keeping GET responses
+            from a run to the next
+        :param hedger: an optional Hedger, duplicating slow GET requests
+        """
         self.api_key = api_key
+        self.rate_limiter = rate_limiter
+        self.cache = cache or ResponseCache(self.CACHE_TTLS)
+        self.disk_cache = disk_cache
+        self.hedger = hedger
+
+    def timeout(self, url):
+        for pattern, timeout in self.TIMEOUTS:
+            if re.search(pattern, url):
+                return timeout
+        return self.DEFAULT_TIMEOUT
+
+    def endpoint(self, url):
+        for pattern in self.ENDPOINTS:
+            if re.search(pattern, url):
+                return pattern
+        return None
 
     def get_auth_headers(self):
         """ Method to be overloaded by child classes
@@ -18,32 +60,133 @@ class APIClient:
 
     def add_auth_headers(self, kwargs):
         _kwargs = kwargs.copy()
-        headers = kwargs.get('headers', {})
+        headers = dict(kwargs.get('headers', {}))
         headers.update(self.get_auth_headers())
         _kwargs['headers'] = headers
         return _kwargs
 
-    def _req(self, func, *args, **kwargs):
+    def _request(self, func, url, **kwargs):
+        """ Performs the HTTP request, returning the raw response
+        """
         log.debug('HTTP REQUEST {} {} {}'.format(
-            func, args, kwargs))
+            func, url, kwargs))
         kwargs = self.add_auth_headers(kwargs)
-        resp = func(*args, **kwargs)
+        kwargs.setdefault('timeout', self.timeout(url))
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        resp = func(url, **kwargs)
         resp.raise_for_status()
-        ret = resp.json()
+        return resp
+
+    def _req(self, func, url, **kwargs):
+        resp = self._request(func, url, **kwargs)
+        ret = jsonbackend.loads(resp.content)
+        log.debug('HTTP RESPONSE {}'.format(ret))
+        return ret
+
+    def _send_get(self, url, **kwargs):
+        """ GET request, hedged if slow and a hedger is set
+        """
+        if self.hedger is None:
+            return self._request(requests.get, url, **kwargs)
+        return self.hedger.run(
+            lambda: self._request(requests.get, url, **kwargs),
+            self.endpoint(url))
+
+    def get(self, url, **kwargs):
+        return self.cache.get(url, kwargs, lambda: self._get(url, **kwargs))
+
+    def _get(self, url, **kwargs):
+        if self.disk_cache is None:
+            ret = jsonbackend.loads(self._send_get(url, **kwargs).content)
+        else:
+            ret = self._revalidated_get(url, **kwargs)
         log.debug('HTTP RESPONSE {}'.format(ret))
         return ret
 
-    def get(self, *args, **kwargs):
-        return self._req(requests.get, *args, **kwargs)
+    def _revalidated_get(self, url, **kwargs):
+        """ GET through the disk cache
+
+        :return: the decoded response body
+        """
+        key = self.disk_cache.key(url, kwargs)
+        validators = self.disk_cache.validators(key)
+        if validators:
+            resp = self._send_get(url, **dict(kwargs, headers=dict(
+                kwargs.get('headers', {}), **validators)))
+            if resp.status_code == 304:
+                try:
+                    return jsonbackend.loads(self.disk_cache.load(key))
+                except KeyError:
+                    # Evicted meanwhile
+                    resp = self._send_get(url, **kwargs)
+        else:
+            resp = self._send_get(url, **kwargs)
+
+        self.disk_cache.store(
+            key, resp.headers.get('ETag'), resp.headers.get('Last-Modified'),
+            resp.content)
+        return jsonbackend.loads(resp.content)
+
+    def stream_get(self, url, chunk_size=64 * 1024, **kwargs):
+        """ Downloads a (binary) resource chunk by chunk
+
+        :return: a generator of bytes chunks
+        """
+        resp = self._request(requests.get, url, stream=True, **kwargs)
+        with resp:
+            yield from resp.iter_content(chunk_size)
+
+    def stream_list(self, url, key, **kwargs):
+        """ Items of a JSON list resource, parsed while downloaded
+
+        Bypasses the GET caches.
+
+        :param key: key of the list in the JSON object
+        :return: a generator of items
+        """
+        resp = self._request(requests.get, url, stream=True, **kwargs)
+        with resp:
+            resp.raw.decode_content = True
+            yield from jsonbackend.iter_items(resp.raw, key)
+
+    def post(self, url, **kwargs):
+        self.cache.invalidate(url)
+        return self._req(requests.post, url, **kwargs)
+
+    def put(self, url, **kwargs):
+        self.cache.invalidate(url)
+        return self._req(requests.put, url, **kwargs)
 
-    def post(self, *args, **kwargs):
-        return self._req(requests.post, *args, **kwargs)
 
-    def put(self, *args, **kwargs):
-        return self._req(requests.put, *args, **kwargs)
+class CachedMixin:
+    """ Keeps API data fetched once, until explicitly invalidated
+
+    Safe to use from several threads: concurrent accesses to a missing key
+    wait for a single fetch.
+    """
+    def _cached(self, key, fetch):
+        cache = self.__dict__.setdefault('_cache', {})
+        lock = self.__dict__.setdefault('_cache_lock', threading.RLock())
+        with lock:
+            if key not in cache:
+                cache[key] = fetch()
+            return cache[key]
+
+    def invalidate_cache(self, *keys):
+        """ Forget cached data, all of it if no key is given
+
+        Data will be fetched again on next access.
+        """
+        cache = self.__dict__.setdefault('_cache', {})
+        if keys:
+            for i in keys:
+                cache.pop(i, None)
+        else:
+            cache.clear()
 
 
-class Project:
+class Project(CachedMixin):
     def __init__(self, url, client):
         self.public_url = url.strip('/')  # normalize URL
         self.api = client
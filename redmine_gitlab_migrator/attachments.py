@@ -0,0 +1,129 @@
+""" Migration of redmine issues attachments to gitlab uploads
+
+Files are streamed from redmine to gitlab, never held in memory nor written
+to disk. Files with the same content are uploaded only once.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import threading
+
+from .throttle import RateLimiter
+
+log = logging.getLogger(__name__)
+
+
+class AttachmentMigrator:
+    def __init__(self, redmine_client, gitlab_project,
+                 jobs=1, max_rate=None, chunk_size=64 * 1024):
+        """
+        :param redmine_client: a RedmineClient, used to download files
+        :param gitlab_project: the GitlabProject to upload files to
+        :param jobs: number of concurrent transfers
+        :param max_rate: cap on downloaded bytes per second (all transfers)
+        """
+        self.redmine = redmine_client
+        self.gitlab_project = gitlab_project
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.limiter = RateLimiter(max_rate)
+
+        self.transferred_bytes = 0
+        self._lock = threading.Lock()
+
+    def _chunks(self, attachment, hashers=()):
+        """ Downloads attachment content, updating hashers on the way
+        """
+        for chunk in self.redmine.stream_get(
+                attachment['content_url'], chunk_size=self.chunk_size):
+            self.limiter.acquire(len(chunk))
+            for i in hashers:
+                i.update(chunk)
+            with self._lock:
+                self.transferred_bytes += len(chunk)
+            yield chunk
+
+    def compute_digest(self, attachment):
+        """ Downloads attachment content just to hash it
+
+        :rtype: str
+        """
+        hasher = hashlib.sha256()
+        for _ in self._chunks(attachment, [hasher]):
+            pass
+        return hasher.hexdigest()
+
+    def upload(self, attachment):
+        """ Streams an attachment from redmine to gitlab
+
+        :return: the gitlab upload (dict with "alt", "url", "markdown" keys)
+        """
+        upload = self.gitlab_project.upload_file(
+            attachment['filename'], self._chunks(attachment),
+            attachment.get('content_type'))
+        log.info('Attachment {} uploaded'.format(attachment['filename']))
+        return upload
+
+    @staticmethod
+    def dedup_candidates(attachments):
+        """ Attachments that may share content with another one
+
+        Only files having the same size can share their content, other ones
+        do not need to be hashed before upload. Files of a size are not
+        hashed either if redmine knows the digests of them all: redmine
+        digests (MD5 or SHA-256, depending on redmine version) cannot be
+        compared to locally computed ones.
+        """
+        by_size = defaultdict(list)
+        for i in attachments:
+            by_size[i['filesize']].append(i)
+        return [i for same_size in by_size.values() if len(same_size) > 1
+                if not all(i.get('digest') for i in same_size)
+                for i in same_size]
+
+    def migrate(self, issues):
+        """ Uploads all the attachments of given issues
+
+        Runs in two passes: files that may be duplicates are first hashed
+        (streaming them without uploading), then a single copy of each
+        distinct content is uploaded.
+
+        :param issues: list of redmine issues (with their attachments)
+        :return: dict of gitlab uploads, indexed by redmine attachment id
+        """
+        attachments = list({
+            i['id']: i for issue in issues
+            for i in issue.get('attachments', [])}.values())
+
+        candidates = self.dedup_candidates(attachments)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            digests = dict(zip(
+                (i['id'] for i in candidates),
+                executor.map(self.compute_digest, candidates)))
+
+            groups = defaultdict(list)
+            for i in attachments:
+                if i['id'] in digests:
+                    key = ('sha256', digests[i['id']])
+                elif i.get('digest'):
+                    key = ('redmine', i['digest'])
+                else:
+                    key = ('id', i['id'])
+                groups[key].append(i)
+
+            representatives = [i[0] for i in groups.values()]
+            uploads = {}
+            for same_content, upload in zip(
+                    groups.values(),
+                    executor.map(self.upload, representatives)):
+                for i in same_content:
+                    uploads[i['id']] = upload
+
+        log.info(
+            '{} attachments migrated ({} distinct files, {} bytes '
+            'transferred)'.format(
+                len(attachments), len(representatives),
+                self.transferred_bytes))
+        return uploads
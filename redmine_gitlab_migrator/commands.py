@@ -1,13 +1,37 @@
 #!/bin/env python3
 import argparse
+from collections import deque
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import logging
+import os
 import re
+import socket
 import sys
+import time
+
+import requests
 
 from redmine_gitlab_migrator.redmine import RedmineProject, RedmineClient
-from redmine_gitlab_migrator.gitlab import GitlabProject, GitlabClient
-from redmine_gitlab_migrator.converters import convert_issue, convert_version
+from redmine_gitlab_migrator.gitlab import (
+    GitlabProject, GitlabClient, label_color)
+from redmine_gitlab_migrator.converters import (
+    convert_issues, convert_relations, convert_user, convert_version,
+    convert_wiki_page, migrated_issues_index, redmine_id_from_title,
+    user_table, wiki_page_paths)
+from redmine_gitlab_migrator.attachments import AttachmentMigrator
+from redmine_gitlab_migrator.diskcache import DiskCache
+from redmine_gitlab_migrator.hedging import Hedger
 from redmine_gitlab_migrator.logging import setup_module_logging
+from redmine_gitlab_migrator.plan import Plan, PlanError, PlanExecutor, ref
+from redmine_gitlab_migrator.snapshot import (
+    SnapshotValidator, dump_snapshot, load_snapshot, take_snapshot)
+from redmine_gitlab_migrator.throttle import RateLimiter
+from redmine_gitlab_migrator.verify import ParityVerifier
+from redmine_gitlab_migrator import shards
+from redmine_gitlab_migrator.shards import (
+    LeaseKeeper, LeaseLost, ShardQueue)
 from redmine_gitlab_migrator import sql
 
 
@@ -21,9 +45,15 @@ class CommandError(Exception):
     """ An error that will nicely pop up to user and stops program
     """
     def __init__(self, msg):
+        super().__init__(msg)
         self.msg = msg
 
 
+class CheckError(CommandError):
+    """ A pre-flight check failed
+    """
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description=__doc__)
 
@@ -41,15 +71,191 @@ def parse_args():
         'iid', help=perform_migrate_iid.__doc__)
     parser_iid.set_defaults(func=perform_migrate_iid)
 
-    for i in (parser_issues, parser_roadmap):
+    parser_batch = subparsers.add_parser(
+        'batch', help=perform_migrate_batch.__doc__)
+    parser_batch.set_defaults(func=perform_migrate_batch)
+    parser_batch.add_argument(
+        'manifest',
+        help="File listing the projects to migrate, one per line: "
+             "<redmine project url> <gitlab project url>")
+    parser_batch.add_argument(
+        '--projects',
+        required=False, type=int, default=2,
+        help="Number of projects migrated concurrently")
+
+    parser_coordinate = subparsers.add_parser(
+        'coordinate', help=perform_coordinate.__doc__)
+    parser_coordinate.set_defaults(func=perform_coordinate)
+    parser_coordinate.add_argument(
+        '--shard-size',
+        required=False, type=int, default=500,
+        help="Number of issues per shard")
+
+    parser_work = subparsers.add_parser(
+        'work', help=perform_work.__doc__)
+    parser_work.set_defaults(func=perform_work)
+    parser_work.add_argument(
+        '--worker-id',
+        required=False, default=None,
+        help="Worker name, recorded in queue (default: <hostname>-<pid>)")
+
+    parser_plan = subparsers.add_parser(
+        'plan', help=perform_plan.__doc__)
+    parser_plan.set_defaults(func=perform_plan)
+
+    parser_apply = subparsers.add_parser(
+        'apply', help=perform_apply.__doc__)
+    parser_apply.set_defaults(func=perform_apply)
+    parser_apply.add_argument(
+        '--state',
+        required=False, default=None,
+        help="File journaling applied operations, allowing to resume "
+             "(default: <plan>.state)")
+
+    for i in (parser_plan, parser_apply):
+        i.add_argument('plan', help="Plan file (JSON)")
+
+    parser_links = subparsers.add_parser(
+        'links', help=perform_migrate_links.__doc__)
+    parser_links.set_defaults(func=perform_migrate_links)
+    parser_links.add_argument(
+        '--relates-only',
+        required=False, action='store_true', default=False,
+        help="Turn all relations into \"relates to\" links (blocking "
+             "links are not available in gitlab community edition)")
+
+    parser_verify = subparsers.add_parser(
+        'verify', help=perform_verify.__doc__)
+    parser_verify.set_defaults(func=perform_verify)
+    parser_verify.add_argument(
+        '--attachments',
+        required=False, action='store_true', default=False,
+        help="The migration was run with --attachments: links to uploads "
+             "are expected")
+
+    parser_wiki = subparsers.add_parser(
+        'wiki', help=perform_migrate_wiki.__doc__)
+    parser_wiki.set_defaults(func=perform_migrate_wiki)
+
+    for i in (parser_roadmap, parser_links, parser_verify, parser_wiki):
+        i.add_argument(
+            '--jobs',
+            required=False, type=int, default=4,
+            help="Number of concurrent requests")
+        i.add_argument(
+            '--max-requests-per-second',
+            required=False, type=float, default=None,
+            help="Global cap on HTTP requests (redmine and gitlab)")
+
+    parser_users = subparsers.add_parser(
+        'users', help=perform_users.__doc__)
+    parser_users.set_defaults(func=perform_users)
+    parser_users.add_argument(
+        '--block',
+        required=False, action='store_true', default=False,
+        help="Block created accounts. Issues cannot be created on behalf "
+             "of blocked users: block them once issues are migrated.")
+    parser_users.add_argument(
+        '--jobs',
+        required=False, type=int, default=4,
+        help="Number of accounts created concurrently")
+    parser_users.add_argument(
+        '--max-requests-per-second',
+        required=False, type=float, default=None,
+        help="Cap on HTTP requests")
+
+    parser_snapshot = subparsers.add_parser(
+        'snapshot', help=perform_snapshot.__doc__)
+    parser_snapshot.set_defaults(func=perform_snapshot)
+
+    parser_validate = subparsers.add_parser(
+        'validate', help=perform_validate.__doc__)
+    parser_validate.set_defaults(func=perform_validate)
+    parser_validate.add_argument(
+        '--debug',
+        required=False, action='store_true', default=False,
+        help="More output")
+
+    for i in (parser_snapshot, parser_validate, parser_users):
+        i.add_argument(
+            'snapshot', help="Snapshot file (JSON, gzipped if ending in .gz)")
+    parser_users.add_argument(
+        'users_index',
+        help="File to write the login -> gitlab user id mapping to (JSON)")
+
+    parser_plan.add_argument(
+        '--processes',
+        required=False, type=int, default=1,
+        help="Number of processes used to convert issues")
+
+    for i in (parser_issues, parser_batch, parser_work, parser_plan,
+              parser_verify):
+        i.add_argument(
+            '--timeline',
+            required=False, choices=('issue', 'author'), default=None,
+            help="Keep the redmine history of properties changes (status, "
+                 "assignee, version...), folded into one note per issue, or "
+                 "per run of changes by the same author (default: dropped)")
+
+    for i in (parser_issues, parser_batch, parser_work, parser_plan,
+              parser_verify, parser_validate, parser_wiki):
+        i.add_argument(
+            '--no-textile',
+            dest='textile', required=False, action='store_false',
+            default=True,
+            help="Keep redmine texts as is, for redmine instances using "
+                 "markdown (default: converted from textile to markdown)")
+
+    parser_apply.add_argument(
+        '--jobs',
+        required=False, type=int, default=1,
+        help="Number of concurrent requests. Issues are still created in "
+             "plan order, to keep iids ordered.")
+
+    parser_apply.add_argument(
+        '--max-requests-per-second',
+        required=False, type=float, default=None,
+        help="Cap on HTTP requests")
+
+    for i in (parser_coordinate, parser_work):
+        i.add_argument(
+            'queue',
+            help="Shards queue file (SQLite), shared by coordinator and "
+                 "workers")
+        i.add_argument(
+            '--lease-duration',
+            required=False, type=int, default=300,
+            help="Seconds after which a silent worker is considered dead "
+                 "and its shard re-dispatched")
+        i.add_argument(
+            '--poll-interval',
+            required=False, type=int, default=10,
+            help="Seconds between two looks at the queue")
+
+    for i in (parser_issues, parser_roadmap, parser_coordinate, parser_work,
+              parser_plan, parser_snapshot, parser_verify, parser_links,
+              parser_wiki):
         i.add_argument('redmine_project_url')
+
+    for i in (parser_issues, parser_roadmap, parser_batch,
+              parser_coordinate, parser_work, parser_plan, parser_snapshot,
+              parser_verify, parser_links,
+              parser_wiki):
         i.add_argument(
             '--redmine-key',
             required=True,
             help="Redmine administrator API key")
 
-    for i in (parser_issues, parser_roadmap, parser_iid):
+    for i in (parser_issues, parser_roadmap, parser_iid,
+              parser_coordinate, parser_work, parser_plan, parser_snapshot,
+              parser_verify, parser_links,
+              parser_wiki):
         i.add_argument('gitlab_project_url')
+
+    for i in (parser_issues, parser_roadmap, parser_iid, parser_batch,
+              parser_coordinate, parser_work, parser_plan, parser_apply,
+              parser_snapshot, parser_verify, parser_links, parser_users,
+              parser_wiki):
         i.add_argument(
             '--gitlab-key',
             required=True,
@@ -65,20 +271,108 @@ def parse_args():
             required=False, action='store_true', default=False,
             help="More output")
 
+    for i in (parser_issues, parser_batch, parser_work):
+        i.add_argument(
+            '--jobs',
+            required=False, type=int, default=1,
+            help="Number of issues filled concurrently. When greater than "
+                 "1, placeholder issues are first created sequentially in "
+                 "redmine order, to keep iids ordered.")
+
+        i.add_argument(
+            '--attachments',
+            required=False, action='store_true', default=False,
+            help="Also migrate issues attachments, as gitlab uploads")
+
+        i.add_argument(
+            '--attachments-max-rate',
+            required=False, type=int, default=None, metavar='BYTES_PER_SEC',
+            help="Cap on attachments transfer rate (default: no cap)")
+
+        i.add_argument(
+            '--processes',
+            required=False, type=int, default=1,
+            help="Number of processes used to convert issues (mainly markup "
+                 "conversion, which is CPU-bound)")
+
+        i.add_argument(
+            '--redmine-includes',
+            required=False, type=includes_list, default=None,
+            help="Comma-separated associated data to fetch with each "
+                 "redmine issue, among {} (default: what the enabled "
+                 "features need). attachments are always fetched with "
+                 "--attachments.".format(
+                     ', '.join(RedmineProject.ISSUE_INCLUDES)))
+
+        i.add_argument(
+            '--max-requests-per-second',
+            required=False, type=float, default=None,
+            help="Global cap on HTTP requests (redmine and gitlab)")
+
+        i.add_argument(
+            '--hedge',
+            required=False, action='store_true', default=False,
+            help="Send again the GET requests slower than 95%% of recent "
+                 "ones, using the first answer")
+
+        i.add_argument(
+            '--gitlab-users-index',
+            required=False, default=None, metavar='PATH',
+            help="Gitlab users mapping written by the \"users\" command, "
+                 "used instead of listing gitlab users")
+
+        i.add_argument(
+            '--stream-json',
+            required=False, action='store_true', default=False,
+            help="Parse redmine issues lists while downloading them, "
+                 "instead of whole pages (needs ijson)")
+
+        i.add_argument(
+            '--redmine-http-cache',
+            required=False, default=None, metavar='PATH',
+            help="File keeping redmine responses from a run to the next: "
+                 "unchanged ones are not transferred again")
+
+        i.add_argument(
+            '--redmine-http-cache-size',
+            required=False, type=int, default=512, metavar='MB',
+            help="Cap on --redmine-http-cache size (default: 512)")
+
     return parser.parse_args()
 
 
+def includes_list(value):
+    includes = [i.strip() for i in value.split(',') if i.strip()]
+    unknown = set(includes) - set(RedmineProject.ISSUE_INCLUDES)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            'unknown include(s): {}'.format(', '.join(sorted(unknown))))
+    return includes
+
+
+def issue_includes(args):
+    """ Redmine issue associated data required by the enabled features
+    """
+    if args.redmine_includes is not None:
+        includes = list(args.redmine_includes)
+    else:
+        includes = ['journals', 'relations']
+    # Needed whatever --redmine-includes says
+    if args.attachments and 'attachments' not in includes:
+        includes.append('attachments')
+    return includes
+
+
 def check(func, message, redmine_project, gitlab_project):
     ret = func(redmine_project, gitlab_project)
     if ret:
         log.info('{}... OK'.format(message))
     else:
-        log.error('{}... FAILED'.format(message))
-        exit(1)
+        raise CheckError('{}... FAILED'.format(message))
 
 
-def check_users(redmine_project, gitlab_project):
-    users = redmine_project.get_participants()
+def check_users(redmine_project, gitlab_project, issues=None):
+    users = redmine_project.get_participants(issues)
     # Filter out anonymous user
     nicks = [i['login'] for i in users if i['login'] != '']
     log.info('Project users are: {}'.format(', '.join(nicks) + ' '))
@@ -87,64 +381,321 @@ def check_users(redmine_project, gitlab_project):
 
 
 def check_no_issue(redmine_project, gitlab_project):
-    return len(gitlab_project.get_issues()) == 0
+    return gitlab_project.count_issues() == 0
 
 
 def check_no_milestone(redmine_project, gitlab_project):
-    return len(gitlab_project.get_milestones()) == 0
+    return gitlab_project.count_milestones() == 0
 
 
 def check_origin_milestone(redmine_project, gitlab_project):
     return len(redmine_project.get_versions()) > 0
 
 
+def redmine_client(args, limiter):
+    """ RedmineClient of the issues commands, with their HTTP options
+    """
+    disk_cache = None
+    if args.redmine_http_cache:
+        disk_cache = DiskCache(
+            args.redmine_http_cache,
+            max_bytes=args.redmine_http_cache_size * 1024 * 1024)
+    return RedmineClient(
+        args.redmine_key, limiter, disk_cache=disk_cache,
+        hedger=Hedger() if args.hedge else None,
+        stream_lists=args.stream_json)
+
+
+def gitlab_client(args, limiter):
+    """ GitlabClient of the issues commands, with their HTTP options
+    """
+    return GitlabClient(
+        args.gitlab_key, limiter, hedger=Hedger() if args.hedge else None)
+
+
 def perform_migrate_issues(args):
-    redmine = RedmineClient(args.redmine_key)
-    gitlab = GitlabClient(args.gitlab_key)
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = redmine_client(args, limiter)
+    gitlab = gitlab_client(args, limiter)
 
     redmine_project = RedmineProject(args.redmine_project_url, redmine)
     gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
 
+    report = migrate_issues(args, redmine_project, gitlab_project)
+    log.info('{} issues, {} notes'.format(report['issues'], report['notes']))
+    log_http_stats(redmine=redmine, gitlab=gitlab)
+
+
+def log_http_stats(**clients):
+    """ Run summary of GET requests answered without an HTTP call, and
+    of hedged ones
+    """
+    for name, client in sorted(clients.items()):
+        log.info('{} GET cache: {hits} hits, {misses} misses, {coalesced} '
+                 'merged into in-flight requests'.format(
+                     name, **client.cache.stats()))
+        if client.disk_cache is not None:
+            log.info('{} disk cache: {revalidated} unchanged responses '
+                     '({saved_bytes} bytes not transferred), {stored} '
+                     'stored'.format(name, **client.disk_cache.stats()))
+        if client.hedger is not None:
+            log.info('{} hedging: {hedged} of {requests} GET requests sent '
+                     'twice, {hedge_wins} answered first by the duplicate'
+                     .format(name, **client.hedger.stats()))
+
+
+def migrate_issues(args, redmine_project, gitlab_project, issue_ids=None,
+                   skip_migrated=False, before_write=None):
+    """ Migrate issues of a single project
+
+    :param issue_ids: migrate only those redmine issues (a shard of the
+        migration), allowing other issues to pre-exist in gitlab.
+    :param skip_migrated: do not migrate again issues already found in
+        gitlab (ex: shard retried after a failure), finish them instead
+    :param before_write: called before each issue creation, may raise to
+        stop the migration
+    :return: a report dict, with "issues" and "notes" counts
+    """
+    redmine_project.issue_includes = issue_includes(args)
+    redmine_project.journal_details = bool(args.timeline)
     gitlab_instance = gitlab_project.get_instance()
+    if args.gitlab_users_index:
+        gitlab_instance.set_users_index(
+            read_users_index(args.gitlab_users_index))
+
+    if issue_ids is None:
+        issues = redmine_project.get_all_issues()
+        checks = [
+            (check_users, 'Required users presence'),
+            (check_no_issue, 'Project has no pre-existing issue'),
+        ]
+    else:
+        issues = redmine_project.get_issues(issue_ids)
+        checks = [
+            (partial(check_users, issues=issues), 'Required users presence'),
+        ]
+
+    # Issues of an interrupted migration, by redmine id
+    migrated = {}
+    if skip_migrated:
+        for i in gitlab_project.iter_issues():
+            redmine_id = redmine_id_from_title(i['title'])
+            if redmine_id is not None:
+                migrated[redmine_id] = i
 
     gitlab_users_index = gitlab_instance.get_users_index()
-    redmine_users_index = redmine_project.get_users_index()
+    redmine_users_index = redmine_project.get_users_index(issues)
 
-    checks = [
-        (check_users, 'Required users presence'),
-        (check_no_issue, 'Project has no pre-existing issue'),
-    ]
     for i in checks:
         check(
             *i, redmine_project=redmine_project, gitlab_project=gitlab_project)
 
-    # Get issues
-
-    issues = redmine_project.get_all_issues()
     milestones_index = gitlab_project.get_milestones_index()
-    issues_data = (
-        convert_issue(
-            i, redmine_users_index, gitlab_users_index, milestones_index)
-        for i in issues)
 
-    for data, meta in issues_data:
+    if args.jobs > 1 and not args.check:
+        # Keep redmine ordering on iids
+        issues = sorted(issues, key=lambda i: i['id'])
+
+    uploads = {}
+    if args.attachments:
         if args.check:
-            milestone_id = data.get('milestone_id', None)
-            if milestone_id:
-                try:
-                    gitlab_project.get_milestone_by_id(milestone_id)
-                except ValueError:
-                    raise CommandError(
-                        "issue \"{}\" points to unknown milestone_id \"{}\". "
-                        "Check that you already migrated roadmaps".format(
-                            data['title'], milestone_id))
-
-            log.info('Would create issue "{}" and {} notes.'.format(
-                data['title'],
-                len(meta['notes'])))
+            attachments = {
+                a['id']: a for i in issues for a in i.get('attachments', [])}
+            log.info('Would migrate {} attachments ({} bytes).'.format(
+                len(attachments),
+                sum(i.get('filesize') or 0 for i in attachments.values())))
         else:
-            created = gitlab_project.create_issue(data, meta)
-            log.info('#{iid} {title}'.format(**created))
+            uploads = AttachmentMigrator(
+                redmine_project.api, gitlab_project,
+                jobs=args.jobs, max_rate=args.attachments_max_rate,
+            ).migrate(issues)
+
+    # Create all labels beforehand, so that issue creation only refers to
+    # existing ones.
+    labels = {i['tracker']['name'] for i in issues}
+    if args.check:
+        missing = labels - set(gitlab_project.get_labels_index())
+        log.info('Would create labels: {}'.format(
+            ', '.join(sorted(missing)) + ' '))
+    else:
+        for label in gitlab_project.ensure_labels(labels):
+            log.info('Label {}'.format(label['name']))
+
+    # Issues are converted one chunk at a time, as they are created
+    field_values = None
+    if args.timeline:
+        field_values = redmine_project.get_field_values()
+    convert = partial(
+        convert_issues_data, args,
+        redmine_users_index=redmine_users_index,
+        gitlab_users_index=gitlab_users_index,
+        milestones_index=milestones_index, uploads=uploads,
+        field_values=field_values)
+
+    report = {'issues': 0, 'notes': 0}
+    all_issues = issues
+
+    def counted(issues_data):
+        for data, meta in issues_data:
+            report['issues'] += 1
+            report['notes'] += len(meta['notes'])
+            yield data, meta
+
+    if migrated and not args.check:
+        # Interrupted ones are completed, others are kept as is
+        unfinished = [i for i in issues if i['id'] in migrated]
+        issues = [i for i in issues if i['id'] not in migrated]
+        log.info('{} issues already migrated, checked'.format(
+            len(unfinished)))
+        finish_issues(
+            gitlab_project,
+            ((migrated[issue['id']], data, meta) for issue, (data, meta) in
+             zip(unfinished, counted(convert(unfinished)))),
+            args.jobs, before_write)
+
+    issues_data = counted(convert(issues))
+    if args.jobs > 1 and not args.check:
+        create_issues_concurrently(
+            gitlab_project, issues_data, args.jobs, before_write)
+    else:
+        for data, meta in issues_data:
+            if args.check:
+                milestone_id = data.get('milestone_id', None)
+                if milestone_id:
+                    try:
+                        gitlab_project.get_milestone_by_id(milestone_id)
+                    except ValueError:
+                        raise CommandError(
+                            "issue \"{}\" points to unknown milestone_id "
+                            "\"{}\". Check that you already migrated "
+                            "roadmaps".format(data['title'], milestone_id))
+
+                log.info('Would create issue "{}" and {} notes.'.format(
+                    data['title'],
+                    len(meta['notes'])))
+            else:
+                if before_write is not None:
+                    before_write()
+                created = gitlab_project.create_issue(data, meta)
+                log.info('#{iid} {title}'.format(**created))
+
+    if args.timeline:
+        report.update(timeline_stats(all_issues, report['notes']))
+        log_timeline_stats(report)
+    return report
+
+
+def _bounded_map(executor, func, iterable, ahead):
+    """ Same as executor.map(), but consuming the iterable as results are
+    used: at most ``ahead`` calls are submitted beyond the awaited one
+    """
+    pending = deque()
+    for i in iterable:
+        pending.append(executor.submit(func, i))
+        if len(pending) > ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def convert_issues_data(args, issues, redmine_users_index, gitlab_users_index,
+                        milestones_index, uploads=None, field_values=None):
+    """ Convert issues lazily, on several processes if asked to
+
+    Issues are converted by chunks, a few chunks ahead of the consumer of
+    the conversions.
+
+    :param field_values: see :meth:`RedmineProject.get_field_values`, for
+        timeline notes
+    :return: iterator of (data, meta) couples, as returned by convert_issue
+    """
+    convert = partial(
+        convert_issues,
+        redmine_user_index=redmine_users_index,
+        gitlab_user_index=gitlab_users_index,
+        gitlab_milestones_index=milestones_index,
+        uploads=uploads,
+        users=user_table(redmine_users_index, gitlab_users_index),
+        textile=args.textile,
+        timeline=args.timeline,
+        field_values=field_values)
+    chunks = (issues[i:i + 64] for i in range(0, len(issues), 64))
+    if args.processes > 1:
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            for chunk in _bounded_map(
+                    executor, convert, chunks, args.processes * 2):
+                yield from chunk
+    else:
+        for chunk in chunks:
+            yield from convert(chunk)
+
+
+def timeline_stats(issues, notes):
+    """ Counts of the journal entries without text (properties changes),
+    and of the timeline notes they were folded into
+
+    :param notes: count of all notes created for the issues
+    """
+    history = comments = 0
+    for issue in issues:
+        for entry in issue['journals']:
+            if entry.get('notes'):
+                comments += 1
+            elif entry.get('details'):
+                history += 1
+    return {'history': history, 'timeline_notes': notes - comments}
+
+
+def log_timeline_stats(stats):
+    log.info('Timeline: {history} history entries folded into '
+             '{timeline_notes} notes ({saved} note requests saved)'.format(
+                 saved=stats['history'] - stats['timeline_notes'], **stats))
+
+
+def create_issues_concurrently(gitlab_project, issues_data, jobs,
+                               before_write=None):
+    """ Create issues, keeping iid order but filling them concurrently
+
+    Placeholder issues (title and author only) are created one by one, so
+    that iids are allocated in order. Meanwhile, descriptions, notes and
+    states of the reserved ones are filled concurrently.
+
+    :param issues_data: iterable of (data, meta) couples, consumed as
+        issues are created
+    :param before_write: called before each issue creation or filling
+    """
+    def reserve():
+        for data, meta in issues_data:
+            if before_write is not None:
+                before_write()
+            placeholder = gitlab_project.reserve_issue(data, meta)
+            log.info('#{iid} {title} (reserved)'.format(**placeholder))
+            yield placeholder, data, meta
+
+    def fill(args):
+        if before_write is not None:
+            before_write()
+        return gitlab_project.fill_issue(*args)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for filled in _bounded_map(executor, fill, reserve(), jobs * 2):
+            log.info('#{iid} {title}'.format(**filled))
+
+
+def finish_issues(gitlab_project, issues, jobs, before_write=None):
+    """ Complete issues whose migration was interrupted
+
+    :param issues: iterable of (gitlab issue, data, meta) tuples
+    :param before_write: called before each issue completion
+    """
+    def finish(args):
+        if before_write is not None:
+            before_write()
+        return gitlab_project.finish_issue(*args)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for finished in _bounded_map(executor, finish, issues, jobs * 2):
+            log.info('#{iid} {title} (checked)'.format(**finished))
 
 
 def perform_migrate_iid(args):
@@ -195,9 +746,564 @@ def perform_migrate_iid(args):
                 'Invalid output from postgres command: "{}"'.format(output))
 
 
-def perform_migrate_roadmap(args):
+def read_manifest(path):
+    """ Read a batch manifest
+
+    One project per line: redmine project URL and gitlab project URL,
+    separated by whitespace. Empty lines and "#" comments are ignored.
+
+    :return: list of (redmine project url, gitlab project url) couples
+    """
+    projects = []
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise CommandError(
+                    '{}:{}: expected "<redmine project url> <gitlab project '
+                    'url>"'.format(path, n))
+            projects.append(tuple(fields))
+    return projects
+
+
+def perform_migrate_batch(args):
+    """ Migrate issues of several projects, listed in a manifest
+
+    Projects share HTTP clients (and their request budget) and users data.
+    """
+    projects = read_manifest(args.manifest)
+
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = redmine_client(args, limiter)
+    gitlab = gitlab_client(args, limiter)
+    # Users data is shared among projects of the same instance
+    redmine_instances, gitlab_instances = {}, {}
+
+    pairs = []
+    for redmine_url, gitlab_url in projects:
+        redmine_project = RedmineProject(redmine_url, redmine)
+        redmine_project.instance = redmine_instances.setdefault(
+            redmine_project.instance_url, redmine_project.get_instance())
+        gitlab_project = GitlabProject(gitlab_url, gitlab)
+        gitlab_project.instance = gitlab_instances.setdefault(
+            gitlab_project.instance_url, gitlab_project.get_instance())
+        pairs.append((redmine_project, gitlab_project))
+
+    def migrate(pair):
+        redmine_project, gitlab_project = pair
+        try:
+            return migrate_issues(args, redmine_project, gitlab_project)
+        except Exception as e:
+            log.error('{}: {}'.format(redmine_project.public_url, e))
+            return {'error': str(e) or e.__class__.__name__}
+
+    with ThreadPoolExecutor(max_workers=args.projects) as executor:
+        reports = list(executor.map(migrate, pairs))
+
+    log.info('Batch report:')
+    for (redmine_url, gitlab_url), report in zip(projects, reports):
+        if 'error' in report:
+            log.error('{} -> {}: FAILED ({})'.format(
+                redmine_url, gitlab_url, report['error']))
+        else:
+            log.info('{} -> {}: {} issues, {} notes'.format(
+                redmine_url, gitlab_url, report['issues'], report['notes']))
+    log_http_stats(redmine=redmine, gitlab=gitlab)
+
+    if any('error' in i for i in reports):
+        raise CommandError('{} project(s) failed'.format(
+            sum('error' in i for i in reports)))
+
+
+def perform_coordinate(args):
+    """ Split issues migration in shards, and watch workers process them
+    """
+    redmine = RedmineClient(args.redmine_key)
+    gitlab = GitlabClient(args.gitlab_key)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    if args.check:
+        check(check_no_issue, 'Project has no pre-existing issue',
+              redmine_project, gitlab_project)
+        issue_ids = redmine_project.get_issue_ids()
+        log.info('Would split {} issues in {} shards'.format(
+            len(issue_ids), -(-len(issue_ids) // args.shard_size)))
+        return
+
+    queue = ShardQueue(args.queue, lease_duration=args.lease_duration)
+    if not any(queue.progress().values()):
+        check(check_no_issue, 'Project has no pre-existing issue',
+              redmine_project, gitlab_project)
+        issue_ids = sorted(redmine_project.get_issue_ids())
+        count = queue.create(issue_ids, args.shard_size)
+        log.info('{} issues split in {} shards'.format(
+            len(issue_ids), count))
+    else:
+        log.info('Resuming with existing queue {}'.format(args.queue))
+
+    while True:
+        for i in queue.expire_leases():
+            log.warning('Lease expired on shard {}, re-dispatching'.format(i))
+        progress = queue.progress()
+        log.info('Shards: {pending} pending, {leased} in progress, '
+                 '{done} done, {failed} failed'.format(**progress))
+        if not (progress[shards.PENDING] or progress[shards.LEASED]):
+            break
+        time.sleep(args.poll_interval)
+
+    issues = notes = 0
+    for shard_id, state, report in queue.reports():
+        if state == shards.DONE:
+            issues += report['issues']
+            notes += report['notes']
+        else:
+            log.error('Shard {} failed: {}'.format(shard_id, report['error']))
+    log.info('Migrated {} issues and {} notes'.format(issues, notes))
+    if progress[shards.FAILED]:
+        raise CommandError('{} shard(s) failed'.format(
+            progress[shards.FAILED]))
+
+
+def perform_work(args):
+    """ Process shards of an issues migration, until none is left
+    """
+    if args.check:
+        raise CommandError(
+            'workers cannot --check, use "issues --check" instead')
+
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = redmine_client(args, limiter)
+    gitlab = gitlab_client(args, limiter)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    queue = ShardQueue(args.queue, lease_duration=args.lease_duration)
+    worker = args.worker_id or '{}-{}'.format(
+        socket.gethostname(), os.getpid())
+
+    while True:
+        claimed = queue.claim(worker)
+        if claimed is None:
+            progress = queue.progress()
+            if not progress[shards.LEASED]:
+                break
+            # Other workers may die, leaving shards to re-dispatch
+            time.sleep(args.poll_interval)
+            continue
+
+        shard_id, issue_ids = claimed
+        log.info('Shard {} ({} issues) claimed by {}'.format(
+            shard_id, len(issue_ids), worker))
+        try:
+            with LeaseKeeper(queue, shard_id, worker) as lease:
+                # A previous attempt may have migrated some issues
+                report = migrate_issues(
+                    args, redmine_project, gitlab_project, issue_ids,
+                    skip_migrated=queue.attempts(shard_id) > 1,
+                    before_write=lease.check)
+        except LeaseLost as e:
+            # The shard belongs to another worker now
+            log.error(e)
+        except Exception as e:
+            log.error('Shard {} failed: {}'.format(shard_id, e))
+            queue.fail(shard_id, worker, str(e) or e.__class__.__name__)
+        else:
+            if not queue.complete(shard_id, worker, report):
+                log.error('Shard {} done after its lease was lost, its '
+                          'report is dropped'.format(shard_id))
+    log.info('No shard left, {} stops'.format(worker))
+    log_http_stats(redmine=redmine, gitlab=gitlab)
+
+
+# Attachments are not planned: their upload URLs are only known once
+# uploaded.
+PLAN_ISSUE_INCLUDES = ('journals', 'relations')
+
+
+def build_plan(args, redmine_project, gitlab_project):
+    """ Build the plan of a roadmap and issues migration
+
+    Versions already migrated (milestone with same title) are not planned
+    again. Issues are created in redmine order, as placeholders holding
+    only their title, then filled; notes of an issue are created in order.
+
+    :rtype: Plan
+    """
+    plan = Plan(
+        gitlab_project.public_url,
+        redmine_project_url=redmine_project.public_url)
+
+    # Roadmap
+    milestones_index = dict(gitlab_project.get_milestones_index())
+    for version in redmine_project.get_versions():
+        data, meta = convert_version(version)
+        if data['title'] in milestones_index:
+            continue
+        op_id = 'milestone-{}'.format(version['id'])
+        plan.add(op_id, 'milestone', 'POST', ['milestones'], data)
+        if meta['must_close']:
+            plan.add(
+                '{}-close'.format(op_id), 'milestone_close', 'PUT',
+                ['milestones', ref(op_id)], {'state_event': 'close'})
+        milestones_index[data['title']] = {'id': ref(op_id)}
+
+    # Issues
+    redmine_project.issue_includes = PLAN_ISSUE_INCLUDES
+    redmine_project.journal_details = bool(args.timeline)
+    issues = sorted(redmine_project.get_all_issues(), key=lambda i: i['id'])
+    check(partial(check_users, issues=issues), 'Required users presence',
+          redmine_project, gitlab_project)
+    field_values = None
+    if args.timeline:
+        field_values = redmine_project.get_field_values()
+    issues_data = convert_issues_data(
+        args, issues,
+        redmine_project.get_users_index(),
+        gitlab_project.get_instance().get_users_index(),
+        milestones_index, field_values=field_values)
+
+    labels = sorted({i['tracker']['name'] for i in issues})
+    existing_labels = gitlab_project.get_labels_index()
+    for label in labels:
+        if label not in existing_labels:
+            plan.add('label-{}'.format(label), 'label', 'POST', ['labels'],
+                     {'name': label, 'color': label_color(label)})
+
+    previous = None
+    notes = 0
+    for issue, (data, meta) in zip(issues, issues_data):
+        notes += len(meta['notes'])
+        op_id = 'issue-{}'.format(issue['id'])
+        # Chained, to allocate iids in order
+        plan.add(op_id, 'issue', 'POST', ['issues'], {'title': data['title']},
+                 meta['sudo_user'], depends_on=[previous] if previous else [])
+        previous = op_id
+
+        update = {k: v for k, v in data.items() if k != 'title'}
+        # Closed after its notes, as on direct migration
+        close_with_update = meta['must_close'] and not meta['notes']
+        if close_with_update:
+            update['state_event'] = 'close'
+        if update:
+            plan.add(
+                '{}-fill'.format(op_id), 'issue_fill', 'PUT',
+                ['issues', ref(op_id)], update,
+                depends_on=['label-{}'.format(i)
+                            for i in data.get('labels', [])
+                            if i not in existing_labels])
+
+        previous_note = None
+        for n, (note_data, note_meta) in enumerate(meta['notes']):
+            note_id = '{}-note-{}'.format(op_id, n)
+            plan.add(
+                note_id, 'note', 'POST', ['issues', ref(op_id), 'notes'],
+                note_data, note_meta['sudo_user'],
+                depends_on=[previous_note] if previous_note else [])
+            previous_note = note_id
+
+        if meta['must_close'] and not close_with_update:
+            plan.add(
+                '{}-close'.format(op_id), 'issue_close', 'PUT',
+                ['issues', ref(op_id)], {'state_event': 'close'},
+                depends_on=[previous_note] + (
+                    ['{}-fill'.format(op_id)] if update else []))
+
+    if args.timeline:
+        log_timeline_stats(timeline_stats(issues, notes))
+    return plan
+
+
+def log_plan_stats(plan):
+    stats = plan.stats()
+    log.info('{} requests ({}), {} bytes to upload'.format(
+        stats['requests'],
+        ', '.join('{} {}'.format(v, k) for k, v in sorted(
+            stats['requests_by_kind'].items())),
+        stats['bytes']))
+
+
+def perform_plan(args):
+    """ Write the plan of a roadmap and issues migration to a file
+    """
+    redmine = RedmineClient(args.redmine_key)
+    gitlab = GitlabClient(args.gitlab_key)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    plan = build_plan(args, redmine_project, gitlab_project)
+    log_plan_stats(plan)
+    if not args.check:
+        plan.dump(args.plan)
+        log.info('Plan written to {}'.format(args.plan))
+
+
+def perform_apply(args):
+    """ Apply a migration plan, written by the "plan" command
+    """
+    plan = Plan.load(args.plan)
+    log_plan_stats(plan)
+
+    limiter = RateLimiter(args.max_requests_per_second)
+    gitlab = GitlabClient(args.gitlab_key, limiter)
+    gitlab_project = GitlabProject(plan.gitlab_project_url, gitlab)
+
+    executor = PlanExecutor(
+        plan, gitlab_project, jobs=args.jobs,
+        state_path=args.state or '{}.state'.format(args.plan))
+    if not executor.load_state():
+        check(check_no_issue, 'Project has no pre-existing issue',
+              None, gitlab_project)
+    if args.check:
+        return
+
+    try:
+        done = executor.run()
+    except PlanError as e:
+        raise CommandError(
+            '{} (run the same command again to resume)'.format(e))
+    log.info('Plan applied ({} operations performed)'.format(done))
+
+
+def perform_snapshot(args):
+    """ Save the redmine and gitlab data read by an issues migration
+    """
     redmine = RedmineClient(args.redmine_key)
     gitlab = GitlabClient(args.gitlab_key)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    snapshot = take_snapshot(redmine_project, gitlab_project)
+    log.info('{} issues in snapshot'.format(
+        len(snapshot['redmine']['issues'])))
+    if not args.check:
+        dump_snapshot(snapshot, args.snapshot)
+        log.info('Snapshot written to {}'.format(args.snapshot))
+
+
+def read_users_index(path):
+    """ Read a users index file, as written by the "users" command
+
+    :return: dict of gitlab users (with "id" and "username"), by login
+    """
+    with open(path) as f:
+        return {login: {'id': user_id, 'username': login}
+                for login, user_id in json.load(f).items()}
+
+
+def create_gitlab_user(gitlab_instance, redmine_user, block=False):
+    """ Create the gitlab account of a redmine user
+
+    :return: the created user, None on failure
+    """
+    try:
+        user = gitlab_instance.create_user(convert_user(redmine_user))
+        if block:
+            gitlab_instance.block_user(user['id'])
+    except requests.HTTPError as e:
+        log.error('User {} not created: {}'.format(redmine_user['login'], e))
+        return None
+    log.info('User {} created'.format(user['username']))
+    return user
+
+
+def perform_users(args):
+    """ Create the gitlab accounts of the redmine participants found in a
+    snapshot, and write the users index
+    """
+    snapshot = load_snapshot(args.snapshot)
+    limiter = RateLimiter(args.max_requests_per_second)
+    gitlab = GitlabClient(args.gitlab_key, limiter)
+    gitlab_instance = GitlabProject(
+        snapshot['gitlab']['project_url'], gitlab).get_instance()
+
+    existing = gitlab_instance.get_users_index()
+    # The anonymous user has no login
+    redmine_users = [i for i in snapshot['redmine']['users'] if i['login']]
+    missing = [i for i in redmine_users if i['login'] not in existing]
+    no_mail = [i for i in missing if not i.get('mail')]
+    for i in no_mail:
+        log.error('User {} has no email in redmine, it cannot be '
+                  'created'.format(i['login']))
+    missing = [i for i in missing if i.get('mail')]
+    log.info('{} redmine users, {} to create in gitlab'.format(
+        len(redmine_users), len(missing)))
+    if args.check:
+        return
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        created = list(executor.map(
+            partial(create_gitlab_user, gitlab_instance, block=args.block),
+            missing))
+
+    index = {login: user['id'] for login, user in existing.items()}
+    index.update((i['username'], i['id']) for i in created if i)
+    users_index = {i['login']: index[i['login']]
+                   for i in redmine_users if i['login'] in index}
+    with open(args.users_index, 'w') as f:
+        json.dump(users_index, f, indent=1, sort_keys=True)
+    log.info('{} users written to {}'.format(
+        len(users_index), args.users_index))
+
+    failed = len(redmine_users) - len(users_index)
+    if failed:
+        raise CommandError('{} user(s) missing in gitlab'.format(failed))
+
+
+def perform_validate(args):
+    """ Check an issues migration from a snapshot, without network access
+    """
+    problems = SnapshotValidator(
+        load_snapshot(args.snapshot), textile=args.textile).validate()
+    if problems:
+        raise CheckError('{} problem(s) found'.format(len(problems)))
+
+
+def create_issue_link(gitlab_project, link):
+    """ Create a link, unless it already exists
+
+    :return: True if created
+    """
+    source, link_type, target = link
+    try:
+        gitlab_project.create_issue_link(
+            source['iid'], target['project_id'], target['iid'], link_type)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 409:
+            return False
+        raise
+    return True
+
+
+def perform_migrate_links(args):
+    """ Turn redmine issues relations into gitlab issue links, once issues
+    are migrated
+    """
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = RedmineClient(args.redmine_key, limiter)
+    gitlab = GitlabClient(args.gitlab_key, limiter)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    # Relations come with issues list, no need for details
+    redmine_project.issue_includes = ('relations',)
+    issues = redmine_project.get_all_issues()
+    # Links are created through API v4, issues are listed with it too
+    gitlab_issues_index = migrated_issues_index(
+        list(gitlab_project.iter_issues(v4=True)))
+
+    links, unresolved = convert_relations(
+        issues, gitlab_issues_index, link_types=not args.relates_only)
+    for i in unresolved:
+        log.warning('Relation {relation_type} from #{issue_id} to '
+                    '#{issue_to_id} skipped: issue not migrated'.format(
+                        **{k: i[k] for k in (
+                            'relation_type', 'issue_id', 'issue_to_id')}))
+    if args.check:
+        log.info('Would create {} issue links'.format(len(links)))
+        return
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        created = sum(executor.map(
+            partial(create_issue_link, gitlab_project), links))
+    log.info('{} issue links created ({} already existing)'.format(
+        created, len(links) - created))
+
+
+def migrate_wiki_page(redmine_project, gitlab_project, paths, existing,
+                      title, textile=True):
+    """ Fetch, convert and write a wiki page
+
+    :param existing: slugs of the pages already in gitlab, updated instead
+        of created
+    :param textile: convert the page content from textile to markdown
+    :return: True on success
+    """
+    try:
+        data = convert_wiki_page(
+            redmine_project.get_wiki_page(title), paths, textile)
+        if data['title'] in existing:
+            gitlab_project.update_wiki_page(data['title'], data)
+        else:
+            gitlab_project.create_wiki_page(data)
+    except requests.HTTPError as e:
+        log.error('Wiki page {} not migrated: {}'.format(title, e))
+        return False
+    log.info('Wiki page {} migrated'.format(data['title']))
+    return True
+
+
+def perform_migrate_wiki(args):
+    """ Migrate the last version of the wiki pages
+    """
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = RedmineClient(args.redmine_key, limiter)
+    gitlab = GitlabClient(args.gitlab_key, limiter)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    paths = wiki_page_paths(redmine_project.get_wiki_index())
+    existing = {i['slug'] for i in gitlab_project.get_wiki_pages()}
+    if args.check:
+        log.info('Would migrate {} wiki pages ({} already in gitlab)'.format(
+            len(paths), len(existing & set(paths.values()))))
+        return
+
+    # Each page is fetched, converted and written by the same worker, at
+    # most --jobs pages are in memory
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        migrated = sum(executor.map(
+            partial(migrate_wiki_page, redmine_project, gitlab_project,
+                    paths, existing, textile=args.textile),
+            paths))
+    log.info('{} wiki pages migrated'.format(migrated))
+    if migrated < len(paths):
+        raise CommandError('{} wiki page(s) not migrated'.format(
+            len(paths) - migrated))
+
+
+def perform_verify(args):
+    """ Compare migrated gitlab issues with their redmine originals
+    """
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = RedmineClient(args.redmine_key, limiter)
+    gitlab = GitlabClient(args.gitlab_key, limiter)
+    redmine_project = RedmineProject(args.redmine_project_url, redmine)
+    gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
+
+    if args.check:
+        log.info('Would verify {} issues'.format(
+            len(redmine_project.get_issue_ids())))
+        return
+
+    report = ParityVerifier(
+        redmine_project, gitlab_project, jobs=args.jobs,
+        timeline=args.timeline, textile=args.textile,
+        attachments=args.attachments).run()
+    for i in report['missing']:
+        log.error('Redmine issue #{} is missing in gitlab'.format(i))
+    for i in report['unexpected']:
+        log.error('Gitlab issue for redmine #{} has no original'.format(i))
+    for redmine_id, fields in sorted(report['mismatches'].items()):
+        log.error('Redmine issue #{} differs in gitlab: {}'.format(
+            redmine_id, ', '.join(fields)))
+
+    failed = (len(report['missing']) + len(report['unexpected']) +
+              len(report['mismatches']))
+    log.info('{} issues verified, {} identical'.format(
+        report['checked'],
+        report['checked'] - len(report['missing']) -
+        len(report['mismatches'])))
+    if failed:
+        raise CheckError('{} issue(s) differ'.format(failed))
+
+
+def perform_migrate_roadmap(args):
+    limiter = RateLimiter(args.max_requests_per_second)
+    redmine = RedmineClient(args.redmine_key, limiter)
+    gitlab = GitlabClient(args.gitlab_key, limiter)
 
     redmine_project = RedmineProject(args.redmine_project_url, redmine)
     gitlab_project = GitlabProject(args.gitlab_project_url, gitlab)
@@ -212,14 +1318,18 @@ def perform_migrate_roadmap(args):
             gitlab_project=gitlab_project)
 
     versions = redmine_project.get_versions()
-    versions_data = (convert_version(i) for i in versions)
+    versions_data = [convert_version(i) for i in versions]
 
-    for data, meta in versions_data:
-        if args.check:
+    if args.check:
+        for data, meta in versions_data:
             log.info("Would create version {}".format(data))
-        else:
-            created = gitlab_project.create_milestone(data, meta)
-            log.info("Version {}".format(created['title']))
+        return
+
+    created = gitlab_project.create_milestones(versions_data, jobs=args.jobs)
+    for i in created:
+        log.info("Version {}".format(i['title']))
+    log.info('{} milestones created, {} closed'.format(
+        len(created), sum(meta['must_close'] for _, meta in versions_data)))
 
 
 def main():
@@ -236,6 +1346,10 @@ def main():
         try:
             args.func(args)
 
+        except CheckError as e:
+            log.error(e)
+            exit(1)
+
         except CommandError as e:
             log.error(e)
             exit(12)
@@ -1,7 +1,10 @@
 """ Convert Redmine objects to gitlab's
 """
 
+import base64
 import logging
+import os
+import re
 
 
 log = logging.getLogger(__name__)
@@ -13,40 +16,324 @@ def redmine_uid_to_login(redmine_id, redmine_user_index):
     return redmine_user_index[redmine_id]['login']
 
 
-def redmine_uid_to_gitlab_uid(redmine_id,
-                              redmine_user_index, gitlab_user_index):
-    username = redmine_uid_to_login(redmine_id, redmine_user_index)
-    return gitlab_user_index[username]['id']
+def user_table(redmine_user_index, gitlab_user_index, user_ids=None):
+    """ Translation table of redmine user ids to (login, gitlab user id)
 
+    Users missing from the redmine index (ex: anonymous) have no entry,
+    those missing from gitlab have a None gitlab id.
 
-def convert_notes(redmine_issue_journals, redmine_user_index):
+    :param user_ids: restrict the table to those users
+    :rtype: dict
+    """
+    if user_ids is None:
+        user_ids = redmine_user_index
+    table = {}
+    for uid in user_ids:
+        user = redmine_user_index.get(uid)
+        if user is not None:
+            gitlab_user = gitlab_user_index.get(user['login'])
+            table[uid] = (user['login'], gitlab_user and gitlab_user['id'])
+    return table
+
+
+# Markup
+#
+# Each pattern is applied in a single pass over the text: alternatives are
+# merged in one regex, starting with a literal char (lookbehinds come after
+# it), so that the regex engine can quickly skip plain text.
+
+# Blocks where no conversion should happen
+TEXTILE_PRE_RE = re.compile(
+    r'(<pre[^>]*>.*?</pre>)', re.DOTALL | re.IGNORECASE)
+TEXTILE_PRE_CONTENT_RE = re.compile(
+    r'<pre[^>]*>\s*(?:<code(?:\s+class="(?P<lang>[\w+-]*)")?[^>]*>)?'
+    r'(?P<code>.*?)(?:</code>)?\s*</pre>', re.DOTALL | re.IGNORECASE)
+
+TEXTILE_BLOCK_RE = re.compile(
+    r'^(?:(?P<ul>\*+)|(?P<ol>#+)|h(?P<heading>[1-6])\.|(?P<quote>bq)\.'
+    r'|(?P<paragraph>p)\.)[ \t]+', re.MULTILINE)
+
+TEXTILE_TABLE_HEADER_RE = re.compile(
+    r'^(\|(?:_\.[^|\n]*\|)+)[ \t]*$', re.MULTILINE)
+
+TEXTILE_INLINE_RE = re.compile(
+    # Elements whose content is kept as is
+    r'(?P<image>!(?<![\w!]!)(?:[<>=]|\{[^}\n]*\})*'
+    r'(?P<image_src>[^\s!(){}<>=][^\s!()]*)(?:\((?P<image_alt>[^)\n]*)\))?!'
+    r'(?!\w))'
+    r'|(?P<link>"(?P<link_text>[^"\n]+)":'
+    r'(?P<link_url>(?:\w+://|/|#)[^\s<>"]*[^\s<>".,;:!?)]))'
+    r'|(?P<code>@(?<![\w@]@)(?P<code_text>[^@\n]+)@(?![\w@]))'
+    r'|(?P<url>(?:https?|ftp)://[^\s<>"]*[^\s<>".,;:!?)])'
+    # Phrase modifiers, whose content is converted too
+    r'|\*(?<![\w*]\*)(?P<bold>[^\s*](?:[^*\n]*[^\s*])?)\*(?![\w*])'
+    r'|_(?<![\w_]_)(?P<italic>[^\s_](?:[^_\n]*[^\s_])?)_(?![\w_])'
+    r'|-(?<![\w-]-)(?P<strike>[^\s-](?:[^-\n]*[^\s-])?)-(?![\w-])')
+
+
+def _convert_textile_pre(block):
+    m = TEXTILE_PRE_CONTENT_RE.match(block)
+    return '```{}\n{}\n```'.format(
+        m.group('lang') or '', m.group('code').strip('\n'))
+
+
+def _convert_textile_block(m):
+    if m.group('ul'):
+        return '  ' * (len(m.group('ul')) - 1) + '* '
+    elif m.group('ol'):
+        return '   ' * (len(m.group('ol')) - 1) + '1. '
+    elif m.group('heading'):
+        return '#' * int(m.group('heading')) + ' '
+    elif m.group('quote'):
+        return '> '
+    else:
+        return ''
+
+
+def _convert_textile_table_header(m):
+    # markdown needs a separator line after header
+    header = m.group(1)
+    return '{}\n|{}'.format(
+        header.replace('_.', ''), '---|' * (header.count('|') - 1))
+
+
+def _convert_textile_inline(m):
+    group = m.lastgroup
+    if group == 'image':
+        return '![{}]({})'.format(
+            m.group('image_alt') or '', m.group('image_src'))
+    elif group == 'link':
+        return '[{}]({})'.format(m.group('link_text'), m.group('link_url'))
+    elif group == 'code':
+        return '`{}`'.format(m.group('code_text'))
+    elif group == 'url':
+        return m.group(0)
+    elif group == 'bold':
+        return '**{}**'.format(_convert_textile_spans(m.group('bold')))
+    elif group == 'italic':
+        return '*{}*'.format(_convert_textile_spans(m.group('italic')))
+    else:
+        return '~~{}~~'.format(_convert_textile_spans(m.group('strike')))
+
+
+def _convert_textile_spans(text):
+    return TEXTILE_INLINE_RE.sub(_convert_textile_inline, text)
+
+
+def _convert_textile_text(text):
+    text = TEXTILE_BLOCK_RE.sub(_convert_textile_block, text)
+    text = TEXTILE_TABLE_HEADER_RE.sub(_convert_textile_table_header, text)
+    return _convert_textile_spans(text)
+
+
+def textile_to_markdown(text):
+    """ Convert redmine textile markup to gitlab markdown
+
+    Handles the commonly used subset of textile: headings, quotes, lists,
+    table headers, bold/italic/strike, inline code, code blocks, links and
+    images. Anything else is left untouched.
+
+    :type text: str
+    :rtype: str
+    """
+    if not text:
+        return text
+    blocks = TEXTILE_PRE_RE.split(text)
+    # Odd items are the <pre> blocks, whose fences must stand on their own
+    # lines
+    converted = []
+    for n, block in enumerate(blocks):
+        if not n % 2:
+            converted.append(_convert_textile_text(block))
+            continue
+        if converted[-1] and not converted[-1].endswith('\n'):
+            converted.append('\n')
+        converted.append(_convert_textile_pre(block))
+        if blocks[n + 1] and not blocks[n + 1].startswith('\n'):
+            converted.append('\n')
+    return ''.join(converted)
+
+
+def convert_attachment_links(text, attachment_links, used=None):
+    """ Replace references to redmine attachments by gitlab upload links
+
+    Handles ``attachment:filename``, ``attachment:"filename"`` and inline
+    images, either in textile (``!filename!``) or already converted to
+    markdown (``![alt](filename)``).
+
+    :param attachment_links: dict of gitlab markdown links, by filename
+    :param used: if given, a set completed with the replaced filenames
+    :return: the modified text
+    """
+    for filename, markdown in attachment_links.items():
+        escaped = re.escape(filename)
+        text, count = re.subn(
+            r'attachment:"{0}"|attachment:{0}(?![\w.-])'
+            r'|!(?:[<>=]|\{{[^}}]*\}})*{0}(?:\([^)]*\))?!'
+            r'|!\[[^\]\n]*\]\({0}\)'.format(escaped),
+            lambda m: markdown, text)
+        if count and used is not None:
+            used.add(filename)
+    return text
+
+
+def convert_notes(redmine_issue_journals, redmine_user_index,
+                  attachment_links=None, used_attachments=None, textile=True,
+                  timeline=None, field_values=None):
     """ Convert a list of redmine journal entries to gitlab notes
 
-    Filters out the empty notes (ex: bare status change)
+    Filters out the empty notes (ex: bare status change), unless they are
+    folded into timeline notes.
     Adds metadata as comment
 
     :param redmine_issue_journals: list of redmine "journals"
+    :param attachment_links: dict of gitlab markdown links, by filename
+    :param used_attachments: if given, a set completed with the filenames of
+        the attachments referenced by notes
+    :param textile: convert notes from textile to markdown
+    :param timeline: fold entries without text (properties changes) into a
+        single note per issue ("issue"), or per run of consecutive entries
+        by the same author ("author"). None to drop them.
+    :param field_values: names of properties values, see
+        :func:`format_detail`
     :return: yielded couple ``data``, ``meta``. ``data`` is the API payload for
         an issue note and meta a dict (containing, at the moment, only a
         "sudo_user" key).
     """
-
-    for entry in redmine_issue_journals:
+    users = user_table(redmine_user_index, {}, {
+        i['user']['id'] for i in redmine_issue_journals})
+    unknown = []
+    yield from _convert_notes(
+        redmine_issue_journals, users, attachment_links, used_attachments,
+        textile, unknown, None, timeline, field_values or {})
+    _log_unknown_users(unknown)
+
+
+def _convert_notes(journals, users, attachment_links, used_attachments,
+                   textile, unknown, issue_id, timeline, field_values):
+    # Notes of unknown users are listed in unknown
+    notes = []
+    # Entries without text, waiting for their timeline note
+    run = []
+
+    def add_note(body, redmine_user, by_admin=False):
+        user = None
+        if not by_admin:
+            user = users.get(redmine_user['id'])
+            if user is None:
+                # In some cases you have anonymous notes, which do not
+                # exist in gitlab.
+                unknown.append(('note', issue_id, redmine_user))
+        notes.append(({'body': body}, {'sudo_user': user and user[0]}))
+
+    def flush_run():
+        if run:
+            add_note(timeline_body(run, users, field_values), run[0]['user'],
+                     by_admin=timeline == 'issue')
+            del run[:]
+
+    for entry in journals:
         journal_notes = entry.get('notes', '')
         if len(journal_notes) > 0:
+            if timeline == 'author':
+                flush_run()
+            if textile:
+                journal_notes = textile_to_markdown(journal_notes)
+            if attachment_links:
+                journal_notes = convert_attachment_links(
+                    journal_notes, attachment_links, used_attachments)
             body = "{}\n\n*(from redmine: written on {})*".format(
                 journal_notes, entry['created_on'][:10])
-            try:
-                author = redmine_uid_to_login(
-                    entry['user']['id'], redmine_user_index)
-            except KeyError:
-                # In some cases you have anonymous notes, which do not exist in
-                # gitlab.
-                log.warning(
-                    'Redmine user {} is unknown, attribute note '
-                    'to current admin\n'.format(entry['user']))
-                author = None
-            yield {'body': body}, {'sudo_user': author}
+            add_note(body, entry['user'])
+        elif timeline and entry.get('details'):
+            if timeline == 'author' and run and \
+                    run[0]['user']['id'] != entry['user']['id']:
+                flush_run()
+            run.append(entry)
+    flush_run()
+    return notes
+
+
+# Labels of the issue attributes, in timeline notes
+TIMELINE_ATTRIBUTES = {
+    'subject': 'Subject',
+    'description': 'Description',
+    'tracker_id': 'Tracker',
+    'status_id': 'Status',
+    'priority_id': 'Priority',
+    'assigned_to_id': 'Assignee',
+    'category_id': 'Category',
+    'fixed_version_id': 'Target version',
+    'parent_id': 'Parent task',
+    'start_date': 'Start date',
+    'due_date': 'Due date',
+    'done_ratio': '% Done',
+    'estimated_hours': 'Estimated time',
+    'is_private': 'Private',
+}
+
+
+def format_detail(detail, users, field_values):
+    """ Describe a change of an issue property, as redmine displays it
+
+    :param detail: a redmine journal "detail"
+    :param users: table built by :func:`user_table`, to name assignees
+    :param field_values: dict of names, by value (str), for each attribute
+        whose values are ids (ex: ``{'status_id': {'1': 'New'}}``). Ids
+        without a name are displayed as is.
+    :rtype: str
+    """
+    prop, name = detail['property'], detail['name']
+    old, new = detail.get('old_value'), detail.get('new_value')
+    if prop == 'attr':
+        label = TIMELINE_ATTRIBUTES.get(name, name)
+        if name == 'description':
+            return '{} updated'.format(label)
+        if name == 'assigned_to_id':
+            old, new = (
+                users.get(int(i), (i,))[0] if i else i for i in (old, new))
+        elif name in field_values:
+            old, new = (field_values[name].get(i, i) for i in (old, new))
+    elif prop == 'attachment':
+        label = 'File'
+    elif prop == 'relation':
+        label = 'Relation {}'.format(name)
+        old, new = ('#{}'.format(i) if i else i for i in (old, new))
+    elif prop == 'cf':
+        label = 'Custom field #{}'.format(name)
+    else:
+        label = name
+
+    if not old:
+        return '{} set to {}'.format(label, new)
+    elif not new:
+        return '{} deleted ({})'.format(label, old)
+    return '{} changed from {} to {}'.format(label, old, new)
+
+
+def timeline_body(journals, users, field_values):
+    """ Body of a note listing the changes of redmine journal entries
+    """
+    lines = ['* {}, {}: {}'.format(
+        entry['created_on'][:10], entry['user']['name'], '; '.join(
+            format_detail(i, users, field_values) for i in entry['details']))
+        for entry in journals]
+    return '{}\n\n*(from redmine: issue history)*'.format('\n'.join(lines))
+
+
+UNKNOWN_USER_MESSAGES = {
+    'author': 'Redmine issue #{issue} is anonymous, gitlab issue is '
+              'attributed to current admin',
+    'note': 'Redmine user {user} is unknown, attribute note to current admin',
+    'assignee': 'Redmine issue #{issue} assignee {user} is unknown in '
+                'gitlab, issue is left unassigned',
+}
+
+
+def _log_unknown_users(unknown, level=logging.WARNING):
+    for kind, issue_id, user in unknown:
+        log.log(level, UNKNOWN_USER_MESSAGES[kind].format(
+            issue=issue_id, user=user))
 
 
 def relations_to_string(relations, issue_id):
@@ -69,10 +356,161 @@ def relations_to_string(relations, issue_id):
     return ', '.join(l)
 
 
+# Relation types kept as is in gitlab links, others become "relates_to"
+RELATION_LINK_TYPES = {
+    'blocks': 'blocks',
+    'blocked': 'is_blocked_by',
+}
+
+
+def convert_relations(redmine_issues, gitlab_issues_index, link_types=True):
+    """ Turns redmine issues relations into gitlab issue links
+
+    A relation is listed on both the issues it relates, it is converted
+    once.
+
+    :param gitlab_issues_index: migrated gitlab issues, by redmine issue id
+    :param link_types: keep blocking relations as such, else all links are
+        "relates_to" (the only type gitlab community edition supports)
+    :return: couple: list of (source gitlab issue, link type, target gitlab
+        issue) triplets, and list of the relations whose issues were not
+        migrated (ex: issue from another project)
+    """
+    links = []
+    unresolved = []
+    seen = set()
+    for issue in redmine_issues:
+        for i in issue.get('relations', []):
+            key = (i['issue_id'], i['issue_to_id'], i['relation_type'])
+            if key in seen:
+                continue
+            seen.add(key)
+
+            source = gitlab_issues_index.get(i['issue_id'])
+            target = gitlab_issues_index.get(i['issue_to_id'])
+            if source is None or target is None:
+                unresolved.append(i)
+                continue
+            link_type = 'relates_to'
+            if link_types:
+                link_type = RELATION_LINK_TYPES.get(
+                    i['relation_type'], link_type)
+            links.append((source, link_type, target))
+    return links, unresolved
+
+
 # Convertor
 
+REDMINE_TITLE_RE = re.compile(r'^-RM-(?P<id>\d+)-MR-')
+
+
+def redmine_id_from_title(title):
+    """ Redmine id of an issue, from the title of its migrated gitlab issue
+
+    :return: an int, or None for issues not coming from redmine
+    """
+    m = REDMINE_TITLE_RE.match(title)
+    return int(m.group('id')) if m else None
+
+
+def strip_redmine_id(title):
+    """ Title of a migrated gitlab issue, as the iid command leaves it
+    """
+    return REDMINE_TITLE_RE.sub('', title, count=1)
+
+
+def migrated_issues_index(gitlab_issues):
+    """ Index migrated gitlab issues by the id of their redmine original
+
+    Titles hold redmine ids until the iid command replaces gitlab iids with
+    redmine ids, removing them from titles: if no title holds one, issues
+    are indexed by iid.
+
+    :param gitlab_issues: all the issues of the gitlab project
+    :rtype: dict
+    """
+    index = {}
+    for i in gitlab_issues:
+        redmine_id = redmine_id_from_title(i['title'])
+        if redmine_id is not None:
+            index[redmine_id] = i
+    if index:
+        return index
+    log.info('No redmine id found in gitlab titles, issues iids are taken '
+             'as redmine ids (iid command run)')
+    return {i['iid']: i for i in gitlab_issues}
+
+
 def convert_issue(redmine_issue, redmine_user_index, gitlab_user_index,
-                  gitlab_milestones_index):
+                  gitlab_milestones_index, uploads=None, textile=True,
+                  timeline=None, field_values=None):
+    """ Turns a redmine issue into a gitlab issue
+
+    :param uploads: gitlab uploads of migrated attachments, indexed by
+        redmine attachment id. Attachments references are turned into links,
+        unreferenced attachments are listed in description.
+    :param textile: convert description and notes from textile to markdown
+    :param timeline: fold properties changes into notes, see
+        :func:`convert_notes`
+    :rtype: couple: dict, dict
+    :return: a dict describing gitlab-api-style issue and another for meta
+    """
+    user_ids = {i['user']['id'] for i in redmine_issue['journals']}
+    if timeline:
+        # Assignees changes
+        user_ids.update(
+            int(value) for entry in redmine_issue['journals']
+            for i in entry.get('details', [])
+            if i['name'] == 'assigned_to_id'
+            for value in (i.get('old_value'), i.get('new_value')) if value)
+    user_ids.add(redmine_issue['author']['id'])
+    if redmine_issue.get('assigned_to') is not None:
+        user_ids.add(redmine_issue['assigned_to']['id'])
+    users = user_table(redmine_user_index, gitlab_user_index, user_ids)
+
+    unknown = []
+    converted = _convert_issue(
+        redmine_issue, users, gitlab_milestones_index, uploads or {},
+        textile, unknown, timeline, field_values or {})
+    _log_unknown_users(unknown)
+    return converted
+
+
+def convert_issues(redmine_issues, redmine_user_index, gitlab_user_index,
+                   gitlab_milestones_index, uploads=None, textile=True,
+                   users=None, timeline=None, field_values=None):
+    """ Turns a batch of redmine issues into gitlab issues
+
+    Same as :func:`convert_issue`, users being translated through a single
+    table (see :func:`user_table`) and unknown ones reported once for the
+    whole batch.
+
+    :param users: table built by :func:`user_table`, if already known
+    :param timeline: fold properties changes into notes, see
+        :func:`convert_notes`
+    :return: list of (data, meta) couples
+    """
+    if users is None:
+        users = user_table(redmine_user_index, gitlab_user_index)
+    uploads = uploads or {}
+
+    unknown = []
+    converted = [
+        _convert_issue(i, users, gitlab_milestones_index, uploads, textile,
+                       unknown, timeline, field_values or {})
+        for i in redmine_issues]
+    if unknown:
+        log.warning(
+            '{} references to unknown users (anonymous...) in {} issues, '
+            'attributed to current admin'.format(
+                len(unknown), len(redmine_issues)))
+        if log.isEnabledFor(logging.DEBUG):
+            _log_unknown_users(unknown, logging.DEBUG)
+    return converted
+
+
+def _convert_issue(redmine_issue, users, gitlab_milestones_index, uploads,
+                   textile, unknown, timeline, field_values):
     if redmine_issue.get('closed_on', None):
         # quick'n dirty extract date
         close_text = ', closed on {}'.format(redmine_issue['closed_on'][:10])
@@ -86,11 +524,31 @@ def convert_issue(redmine_issue, redmine_user_index, gitlab_user_index,
     if len(relations_text) > 0:
         relations_text = ', ' + relations_text
 
+    attachment_links = {
+        i['filename']: uploads[i['id']]['markdown']
+        for i in redmine_issue.get('attachments', []) if i['id'] in uploads}
+    used_attachments = set()
+    notes = _convert_notes(
+        redmine_issue['journals'], users, attachment_links, used_attachments,
+        textile, unknown, redmine_issue['id'], timeline, field_values)
+
+    description = redmine_issue['description']
+    if textile:
+        description = textile_to_markdown(description)
+    description = convert_attachment_links(
+        description, attachment_links, used_attachments)
+    unused_attachments = [
+        v for k, v in sorted(attachment_links.items())
+        if k not in used_attachments]
+    if unused_attachments:
+        description = '{}\n\n{}'.format(description, '\n'.join(
+            '* {}'.format(i) for i in unused_attachments))
+
     data = {
         'title': '-RM-{}-MR-{}'.format(
             redmine_issue['id'], redmine_issue['subject']),
         'description': '{}\n\n*(from redmine: created on {}{}{})*'.format(
-            redmine_issue['description'],
+            description,
             redmine_issue['created_on'][:10],
             close_text,
             relations_text
@@ -102,27 +560,24 @@ def convert_issue(redmine_issue, redmine_user_index, gitlab_user_index,
     if version:
         data['milestone_id'] = gitlab_milestones_index[version['name']]['id']
 
-    try:
-        author_login = redmine_uid_to_login(
-            redmine_issue['author']['id'], redmine_user_index)
-
-    except KeyError:
-        log.warning(
-            'Redmine issue #{} is anonymous, gitlab issue is attributed '
-            'to current admin\n'.format(redmine_issue['id']))
-        author_login = None
+    author = users.get(redmine_issue['author']['id'])
+    if author is None:
+        unknown.append(
+            ('author', redmine_issue['id'], redmine_issue['author']))
 
     meta = {
-        'sudo_user': author_login,
-        'notes': list(convert_notes(redmine_issue['journals'],
-                                    redmine_user_index)),
+        'sudo_user': author and author[0],
+        'notes': notes,
         'must_close': closed
     }
 
     assigned_to = redmine_issue.get('assigned_to', None)
     if assigned_to is not None:
-        data['assignee_id'] = redmine_uid_to_gitlab_uid(
-            assigned_to['id'], redmine_user_index, gitlab_user_index)
+        assignee = users.get(assigned_to['id'], (None, None))[1]
+        if assignee is None:
+            unknown.append(('assignee', redmine_issue['id'], assigned_to))
+        else:
+            data['assignee_id'] = assignee
     return data, meta
 
 
@@ -148,3 +603,95 @@ def convert_version(redmine_version):
     must_close = redmine_version['status'] == 'closed'
 
     return milestone, {'must_close': must_close}
+
+
+def _random_password():
+    """ A url-safe random password, from 24 random bytes
+    """
+    return base64.urlsafe_b64encode(os.urandom(24)).decode()
+
+
+def convert_user(redmine_user):
+    """ Turns a redmine user into a gitlab user
+
+    The account gets a random password that nobody knows: its owner sets
+    one through the "forgot password" link.
+
+    :param redmine_user: a dict describing redmine-api-style user
+    :return: a dict describing gitlab-api-style user creation
+    """
+    name = '{} {}'.format(
+        redmine_user.get('firstname', ''),
+        redmine_user.get('lastname', '')).strip()
+    return {
+        'username': redmine_user['login'],
+        'name': name or redmine_user['login'],
+        'email': redmine_user['mail'],
+        'password': _random_password(),
+        'confirm': False,
+    }
+
+
+# [[Page]], [[Page#anchor]], [[Page|label]]; cross-project links
+# ([[project:Page]]) are left as is
+WIKI_LINK_RE = re.compile(r'\[\[([^\]|#:]+)(#[^\]|]*)?(?:\|([^\]]*))?\]\]')
+
+
+def wiki_page_paths(pages):
+    """ Gitlab path of each redmine wiki page, keeping pages hierarchy
+
+    Gitlab pages have no parent: a child page goes into the directory of
+    its parent (ex: "Parent/Child").
+
+    :param pages: redmine wiki index entries
+    :return: dict of paths, by page title
+    """
+    parents = {
+        i['title']: (i.get('parent') or {}).get('title') for i in pages}
+    paths = {}
+    for title in parents:
+        ancestors = [title]
+        parent = parents[title]
+        while parent in parents and parent not in ancestors:
+            ancestors.append(parent)
+            parent = parents[parent]
+        paths[title] = '/'.join(reversed(ancestors))
+    return paths
+
+
+def convert_wiki_links(text, paths):
+    """ Point links between redmine wiki pages to their gitlab path
+
+    Links to unknown pages are left untouched.
+
+    :param paths: dict of gitlab paths, by redmine page title
+    """
+    index = {k.lower(): v for k, v in paths.items()}
+
+    def replace(m):
+        title, anchor, label = m.groups()
+        title = title.strip()
+        path = index.get(title.replace(' ', '_').lower())
+        if path is None:
+            return m.group(0)
+        return '[{}](/{}{})'.format(label or title, path, anchor or '')
+
+    return WIKI_LINK_RE.sub(replace, text)
+
+
+def convert_wiki_page(redmine_page, paths, textile=True):
+    """ Turns a redmine wiki page into a gitlab one
+
+    :param redmine_page: a dict describing redmine-api-style wiki page
+    :param paths: gitlab paths of all wiki pages, by redmine title (see
+        :func:`wiki_page_paths`)
+    :return: a dict describing gitlab-api-style wiki page
+    """
+    content = redmine_page.get('text') or ''
+    if textile:
+        content = textile_to_markdown(content)
+    return {
+        'title': paths[redmine_page['title']],
+        'content': convert_wiki_links(content, paths),
+        'format': 'markdown',
+    }
@@ -0,0 +1,129 @@
+""" Persistent cache of GET responses, revalidated with the server
+
+Response bodies are stored in a SQLite file along with their validators
+(ETag, Last-Modified). On later runs, requests carry the matching
+conditional headers, and a "304 Not Modified" answer is served from disk.
+The total size of stored bodies is capped, least recently used ones are
+evicted first.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        body BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS responses_last_used
+        ON responses (last_used);
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        """
+        :param path: SQLite file path, created if missing. It should not be
+            used by several processes at once.
+        :param max_bytes: cap on the total size of stored bodies
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+
+        self.revalidated = 0
+        self.stored = 0
+        self.saved_bytes = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(self.SCHEMA)
+            self._size = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def key(url, kwargs):
+        """ Cache key of a request, ignoring its headers (auth...)
+        """
+        return json.dumps(
+            [url, kwargs.get('params') or {}], sort_keys=True, default=str)
+
+    def validators(self, key):
+        """ Conditional headers to send for a request
+
+        :rtype: dict
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT etag, last_modified FROM responses WHERE key = ?',
+                (key,)).fetchone()
+        if row is None:
+            return {}
+        headers = {}
+        if row[0]:
+            headers['If-None-Match'] = row[0]
+        if row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def load(self, key):
+        """ Stored body of a response the server reported as not modified
+
+        :rtype: bytes
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT body FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            self._conn.execute(
+                'UPDATE responses SET last_used = ? WHERE key = ?',
+                (time.time(), key))
+            self.revalidated += 1
+            self.saved_bytes += len(row[0])
+        return bytes(row[0])
+
+    def store(self, key, etag, last_modified, body):
+        """ Keep a response body, if it has validators and fits the cap
+        """
+        if not (etag or last_modified) or len(body) > self.max_bytes:
+            return
+        with self._lock, self._conn:
+            previous = self._conn.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if previous is not None:
+                self._size -= previous[0]
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, etag, last_modified, body, size, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, body, len(body), time.time()))
+            self._size += len(body)
+            self.stored += 1
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            oldest = self._conn.execute(
+                'SELECT key, size FROM responses ORDER BY last_used '
+                'LIMIT 100').fetchall()
+            for key, size in oldest:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute(
+                    'DELETE FROM responses WHERE key = ?', (key,))
+                self._size -= size
+
+    def stats(self):
+        return {
+            'revalidated': self.revalidated,
+            'stored': self.stored,
+            'saved_bytes': self.saved_bytes,
+        }
@@ -1,12 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from itertools import chain
 import re
+from urllib.parse import quote
+import uuid
 
-from . import APIClient, Project
+import requests
+
+from . import APIClient, CachedMixin, Project, jsonbackend
+
+
+def label_color(name):
+    """ Deterministic color for a label, derived from its name
+
+    :rtype: str
+    :return: a color in "#RRGGBB" notation
+    """
+    return '#{}'.format(hashlib.md5(name.encode()).hexdigest()[:6])
 
 
 class GitlabClient(APIClient):
     # see http://doc.gitlab.com/ce/api/#pagination
     MAX_PER_PAGE = 100
 
+    # Data that hardly changes during a migration, unless written by it
+    CACHE_TTLS = (
+        (r'/users$', 600),
+        (r'/projects/[^/]+$', 600),
+        (r'/projects/[^/]+/(milestones|labels|members)$', 60),
+    )
+
+    TIMEOUTS = (
+        (r'/uploads$', (10, 300)),
+    )
+
+    ENDPOINTS = (
+        r'/issues/\d+/notes$',
+        r'/issues$',
+        r'/(milestones|labels|members)$',
+        r'/users$',
+        r'/wikis',
+    )
+
     def get(self, *args, **kwargs):
         # Note that we do not handle pagination, but as we rely on list data
         # only for milestones, we assume that we have < 100 milestones. Could
@@ -15,6 +50,37 @@ class GitlabClient(APIClient):
         kwargs['params']['per_page'] = self.MAX_PER_PAGE
         return super().get(*args, **kwargs)
 
+    def iter_pages(self, url, params=None):
+        """ Iterates over the pages of a list resource
+
+        :return: a generator of lists (pages)
+        """
+        page = 1
+        while True:
+            items = self.get(url, params=dict(params or {}, page=page))
+            if items:
+                yield items
+            if len(items) < self.MAX_PER_PAGE:
+                return
+            page += 1
+
+    def get_total(self, url, params=None):
+        """ Count the items of a list resource, fetching a single item
+
+        Relies on the "X-Total" pagination header. If gitlab does not send it
+        (it may skip it on very large collections), only tells if the list is
+        empty (0) or not (1).
+
+        :rtype: int
+        """
+        params = dict(params or {})
+        params['per_page'] = 1
+        resp = self._request(requests.get, url, params=params)
+        total = resp.headers.get('X-Total')
+        if total:
+            return int(total)
+        return len(jsonbackend.loads(resp.content))
+
     def get_auth_headers(self):
         return {"PRIVATE-TOKEN": self.api_key}
 
@@ -22,23 +88,45 @@ class GitlabClient(APIClient):
         pass
 
 
-class GitlabInstance:
+class GitlabInstance(CachedMixin):
     def __init__(self, url, client):
         self.url = url.strip('/')  # normalize URL
         self.api = client
 
     def get_all_users(self):
-        return self.api.get('{}/users'.format(self.url))
+        return list(chain.from_iterable(
+            self.api.iter_pages('{}/users'.format(self.url))))
 
     def get_users_index(self):
         """ Returns dict index of users (by login)
         """
-        return {i['username']: i for i in self.get_all_users()}
+        return self._cached('users_by_username', lambda: {
+            i['username']: i for i in self.get_all_users()})
+
+    def set_users_index(self, users_index):
+        """ Use a known users index (ex: from a file) instead of fetching
+        users
+        """
+        self.invalidate_cache('users_by_username')
+        self._cached('users_by_username', lambda: users_index)
+
+    def create_user(self, data):
+        """ Create a user account
+
+        :param data: dict formatted as the gitlab API expects it
+        :return: the created user
+        """
+        user = self.api.post('{}/users'.format(self.url), data=data)
+        self.invalidate_cache('users_by_username')
+        return user
+
+    def block_user(self, user_id):
+        return self.api.put('{}/users/{}/block'.format(self.url, user_id))
 
     def check_users_exist(self, usernames):
         """ Returns True if all users exist
         """
-        gitlab_user_names = set([i['username'] for i in self.get_all_users()])
+        gitlab_user_names = self.get_users_index()
         return all((i in gitlab_user_names for i in usernames))
 
 
@@ -48,16 +136,27 @@ class GitlabProject(Project):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # May be set to share the GitlabInstance with other projects
+        self.instance = None
         self.api_url = (
             '{base_url}api/v3/projects/{namespace}%2F{project_name}'.format(
                 **self._url_match.groupdict()))
         self.instance_url = '{}/api/v3'.format(
             self._url_match.group('base_url'))
+        # Some features (ex: issue links) only exist in API v4
+        self.api_v4_url = (
+            '{base_url}api/v4/projects/{namespace}%2F{project_name}'.format(
+                **self._url_match.groupdict()))
+
+    def get_project(self):
+        """ Project metadata, fetched once per run
+        """
+        return self._cached('project', lambda: self.api.get(self.api_url))
 
     def is_repository_empty(self):
         """ Heuristic to check if repository is empty
         """
-        return self.api.get(self.api_url)['default_branch'] is None
+        return self.get_project()['default_branch'] is None
 
     def create_issue(self, data, meta):
         """ High-level issue creation
@@ -70,22 +169,127 @@ class GitlabProject(Project):
         issue = self.api.post(
             issues_url, data=data, headers={'SUDO': meta['sudo_user']})
 
-        issue_url = '{}/{}'.format(issues_url, issue['id'])
+        self.create_notes(issue, meta)
+
+        # Handle closed status (gitlab API does not allow to create an issue
+        # directly closed)
+        if meta['must_close']:
+            self.close_issue(issue['id'])
+
+        return issue
+
+    def reserve_issue(self, data, meta):
+        """ Create a placeholder issue, holding only title and author
+
+        Used to allocate iids in a given order, the issue being later
+        completed by :meth:`fill_issue`.
+
+        :param meta: dict with "sudo_user" key
+        :param data: dict formatted as the gitlab API expects it
+        :return: the created placeholder issue
+        """
+        return self.api.post(
+            '{}/issues'.format(self.api_url),
+            data={'title': data['title']},
+            headers={'SUDO': meta['sudo_user']})
+
+    def fill_issue(self, issue, data, meta):
+        """ Complete a placeholder issue created by :meth:`reserve_issue`
+
+        Remaining fields are sent in a single write, then notes are created
+        and the issue is closed, as :meth:`create_issue` does. Without notes,
+        closed status is sent along with the fields.
 
-        # Handle issues notes
-        issue_notes_url = '{}/notes'.format(issue_url, 'notes')
+        :param issue: the placeholder issue, as returned by gitlab
+        :param meta: dict with "sudo_user", "should_close" and "notes" keys
+        :param data: dict formatted as the gitlab API expects it
+        :return: the placeholder issue
+        """
+        update = {k: v for k, v in data.items() if k != 'title'}
+        close_with_update = meta['must_close'] and not meta['notes']
+        if close_with_update:
+            update['state_event'] = 'close'
+        if update:
+            self.api.put(
+                '{}/issues/{}'.format(self.api_url, issue['id']),
+                data=update)
+
+        self.create_notes(issue, meta)
+        if meta['must_close'] and not close_with_update:
+            self.close_issue(issue['id'])
+        return issue
+
+    def finish_issue(self, issue, data, meta):
+        """ Complete an issue whose migration was interrupted
+
+        Placeholders (no description yet) are filled, other issues get
+        their missing notes (notes are created in order, the first ones
+        were created) and closed status.
+
+        :param issue: the issue, as listed by gitlab
+        :param meta: dict with "sudo_user", "should_close" and "notes" keys
+        :param data: dict formatted as the gitlab API expects it
+        :return: the issue
+        """
+        if not issue.get('description'):
+            return self.fill_issue(issue, data, meta)
+
+        if meta['notes']:
+            created = sum(1 for i in self.iter_notes(issue['id'])
+                          if not i.get('system'))
+            self.create_notes(issue, dict(meta, notes=meta['notes'][created:]))
+        if meta['must_close'] and issue['state'] != 'closed':
+            self.close_issue(issue['id'])
+        return issue
+
+    def create_notes(self, issue, meta):
+        """ Create the notes listed in meta on an existing issue
+        """
+        issue_notes_url = '{}/issues/{}/notes'.format(
+            self.api_url, issue['id'])
         for note_data, note_meta in meta['notes']:
             self.api.post(
                 issue_notes_url, data=note_data,
                 headers={'SUDO': note_meta['sudo_user']})
 
-        # Handle closed status
-        if meta['must_close']:
-            altered_issue = issue.copy()
-            altered_issue['state_event'] = 'close'
-            self.api.put(issue_url, data=altered_issue)
+    def close_issue(self, issue_id):
+        """ Close an existing issue, sending only the state change
 
-        return issue
+        :param issue_id: gitlab issue id (not iid)
+        :return: the updated issue
+        """
+        return self.api.put(
+            '{}/issues/{}'.format(self.api_url, issue_id),
+            data={'state_event': 'close'})
+
+    def create_issue_link(self, issue_iid, target_project_id,
+                          target_issue_iid, link_type='relates_to'):
+        """ Link two issues (requires gitlab API v4)
+
+        :param link_type: "relates_to", "blocks" or "is_blocked_by" (the two
+            latter are not available in gitlab community edition)
+        :return: the created link
+        """
+        return self.api.post(
+            '{}/issues/{}/links'.format(self.api_v4_url, issue_iid),
+            data={
+                'target_project_id': target_project_id,
+                'target_issue_iid': target_issue_iid,
+                'link_type': link_type,
+            })
+
+    def get_wiki_pages(self):
+        """ Wiki pages (slug, title), without their content (API v4)
+        """
+        return self.api.get('{}/wikis'.format(self.api_v4_url))
+
+    def create_wiki_page(self, data):
+        return self.api.post(
+            '{}/wikis'.format(self.api_v4_url), data=data)
+
+    def update_wiki_page(self, slug, data):
+        return self.api.put('{}/wikis/{}'.format(
+            self.api_v4_url, quote(slug, safe='')), data=data)
 
     def create_milestone(self, data, meta):
         """ High-level milestone creation
@@ -94,47 +298,188 @@ class GitlabProject(Project):
         :param data: dict formatted as the gitlab API expects it
         :return: the created milestone
         """
+        return self.create_milestones([(data, meta)])[0]
+
+    def create_milestones(self, milestones, jobs=1):
+        """ Create milestones concurrently, then close those to be closed
+
+        Created milestones are added to the cached ones, indexes are not
+        fetched again.
+
+        :param milestones: iterable of (data, meta) couples, as taken by
+            :meth:`create_milestone`
+        :param jobs: number of concurrent requests
+        :return: list of the created milestones, in the same order
+        """
+        milestones = list(milestones)
         milestones_url = '{}/milestones'.format(self.api_url)
-        milestone = self.api.post(milestones_url, data=data)
+        known = self.get_milestones()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            created = list(executor.map(
+                lambda i: self.api.post(milestones_url, data=i[0]),
+                milestones))
+            # Second pass, once all milestones exist
+            to_close = [i for i, (_, meta) in zip(created, milestones)
+                        if meta['must_close']]
+            for milestone, _ in zip(to_close, executor.map(
+                    self.close_milestone, [i['id'] for i in to_close])):
+                milestone['state'] = 'closed'
+
+        self.invalidate_milestones()
+        self._cached('milestones', lambda: known + created)
+        return created
+
+    def close_milestone(self, milestone_id):
+        """ Close an existing milestone, sending only the state change
+
+        :return: the updated milestone
+        """
+        return self.api.put(
+            '{}/milestones/{}'.format(self.api_url, milestone_id),
+            data={'state_event': 'close'})
 
-        if meta['must_close']:
-            milestone_url = '{}/{}'.format(milestones_url, milestone['id'])
-            altered_milestone = milestone.copy()
-            altered_milestone['state_event'] = 'close'
+    def upload_file(self, filename, chunks, content_type=None):
+        """ Uploads a file to the project, streaming its content
 
-            self.api.put(milestone_url, data=altered_milestone)
-        return milestone
+        The multipart body is generated on the fly, so the file is never
+        held in memory.
+
+        :param chunks: iterable of bytes
+        :return: dict with "alt", "url" and "markdown" keys
+        """
+        boundary = uuid.uuid4().hex
+        # Percent-encoded as browsers do, so that the header stays one line
+        safe_filename = filename.replace('"', '%22').replace(
+            '\r', '%0D').replace('\n', '%0A')
+
+        def body():
+            yield (
+                '--{}\r\n'
+                'Content-Disposition: form-data; name="file"; '
+                'filename="{}"\r\n'
+                'Content-Type: {}\r\n\r\n'.format(
+                    boundary, safe_filename,
+                    content_type or 'application/octet-stream')
+            ).encode()
+            yield from chunks
+            yield '\r\n--{}--\r\n'.format(boundary).encode()
+
+        return self.api.post(
+            '{}/uploads'.format(self.api_url), data=body(),
+            headers={'Content-Type':
+                     'multipart/form-data; boundary={}'.format(boundary)})
 
     def get_issues(self):
         return self.api.get('{}/issues'.format(self.api_url))
 
+    def iter_issues(self, v4=False):
+        """ All the issues of the project, fetched page by page
+
+        :param v4: list them through gitlab API v4, along with the calls to
+            other API v4 features (ex: issue links)
+        """
+        return chain.from_iterable(self.api.iter_pages('{}/issues'.format(
+            self.api_v4_url if v4 else self.api_url)))
+
+    def iter_notes(self, issue_id):
+        """ All the notes of an issue, fetched page by page
+        """
+        return chain.from_iterable(self.api.iter_pages(
+            '{}/issues/{}/notes'.format(self.api_url, issue_id)))
+
+    def count_issues(self):
+        return self.api.get_total('{}/issues'.format(self.api_url))
+
+    def count_milestones(self):
+        return self.api.get_total('{}/milestones'.format(self.api_url))
+
     def get_members(self):
         return self.api.get('{}/members'.format(self.api_url))
 
+    def get_members_index(self):
+        """ Returns dict index of members (by login)
+        """
+        return self._cached('members_by_username', lambda: {
+            i['username']: i for i in self.get_members()})
+
     def get_milestones(self):
-        if not hasattr(self, '_cache_milestones'):
-            self._cache_milestones = self.api.get(
-                '{}/milestones'.format(self.api_url))
-        return self._cache_milestones
+        return self._cached('milestones', lambda: list(chain.from_iterable(
+            self.api.iter_pages('{}/milestones'.format(self.api_url)))))
 
     def get_milestones_index(self):
-        return {i['title']: i for i in self.get_milestones()}
+        """ Returns dict index of milestones (by title)
+        """
+        return self._cached('milestones_by_title', lambda: {
+            i['title']: i for i in self.get_milestones()})
 
     def get_milestone_by_id(self, _id):
-        milestones = self.get_milestones()
-        for i in milestones:
-            if i['id'] == _id:
-                return i
-        raise ValueError('Could not get milestone')
+        milestones = self._cached('milestones_by_id', lambda: {
+            i['id']: i for i in self.get_milestones()})
+        try:
+            return milestones[_id]
+        except KeyError:
+            raise ValueError('Could not get milestone')
+
+    def invalidate_milestones(self):
+        """ To be called once milestones are altered
+        """
+        self.invalidate_cache(
+            'milestones', 'milestones_by_title', 'milestones_by_id')
+
+    def get_labels(self):
+        return self._cached('labels', lambda: list(chain.from_iterable(
+            self.api.iter_pages('{}/labels'.format(self.api_url)))))
+
+    def get_labels_index(self):
+        """ Returns dict index of labels (by name)
+        """
+        return self._cached('labels_by_name', lambda: {
+            i['name']: i for i in self.get_labels()})
+
+    def create_label(self, name, color=None):
+        """ Create a label, with a color derived from its name by default
+
+        A label created meanwhile by someone else (ex: another worker of a
+        sharded migration) is not an error.
+
+        :return: the created (or already existing) label
+        """
+        try:
+            label = self.api.post(
+                '{}/labels'.format(self.api_url),
+                data={'name': name, 'color': color or label_color(name)})
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 409:
+                raise
+            self.invalidate_cache('labels', 'labels_by_name')
+            label = self.get_labels_index().get(name)
+            if label is None:
+                raise
+            return label
+        self.get_labels().append(label)
+        self.get_labels_index()[label['name']] = label
+        return label
+
+    def ensure_labels(self, names):
+        """ Create the labels that do not exist yet on the project
+
+        :param names: iterable of label names
+        :return: list of the created labels
+        """
+        existing = self.get_labels_index()
+        return [self.create_label(i)
+                for i in sorted(set(names)) if i not in existing]
 
     def has_members(self, usernames):
-        gitlab_user_names = set([i['username'] for i in self.get_members()])
+        gitlab_user_names = self.get_members_index()
         return all((i in gitlab_user_names for i in usernames))
 
     def get_id(self):
-        return self.api.get(self.api_url)['id']
+        return self.get_project()['id']
 
     def get_instance(self):
-        """ Return a GitlabInstance
+        """ Return a GitlabInstance, the same one on every call
         """
-        return GitlabInstance(self.instance_url, self.api)
+        if self.instance is None:
+            self.instance = GitlabInstance(self.instance_url, self.api)
+        return self.instance
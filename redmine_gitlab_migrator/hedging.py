@@ -0,0 +1,96 @@
+""" Hedged requests, cutting the latency tail of idempotent calls
+
+A request that takes longer than most recent ones to the same endpoint
+(live percentile of their latencies) is sent a second time, and the first
+answer wins. The slow one is left to finish (or time out) in background.
+"""
+
+from collections import defaultdict, deque
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import threading
+import time
+
+
+class Hedger:
+    def __init__(self, percentile=95, min_samples=20, window=500,
+                 max_workers=32):
+        """
+        :param percentile: requests slower than this percentile of recent
+            latencies are hedged
+        :param min_samples: no hedging until that many latencies are known
+        :param window: number of recent latencies considered, per endpoint
+        :param max_workers: max requests in flight through the hedger
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+        self._latencies = defaultdict(partial(deque, maxlen=window))
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def delay(self, endpoint=None):
+        """ Seconds after which a request is hedged, None if unknown yet
+
+        :param endpoint: key of the endpoint the request is sent to
+        """
+        with self._lock:
+            if len(self._latencies[endpoint]) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies[endpoint])
+        return latencies[
+            min(len(latencies) - 1, len(latencies) * self.percentile // 100)]
+
+    def _timed(self, func, endpoint, started=None):
+        if started is not None:
+            started.set()
+        start = time.monotonic()
+        ret = func()
+        with self._lock:
+            self._latencies[endpoint].append(time.monotonic() - start)
+        return ret
+
+    def run(self, func, endpoint=None):
+        """ Call func (an idempotent request), hedging it if it is slow
+
+        :param endpoint: key of the endpoint the request is sent to,
+            latencies are compared among requests with the same key
+        :return: the first successful result
+        :raises: the exception of the first attempt, if all attempts fail
+        """
+        with self._lock:
+            self.requests += 1
+        delay = self.delay(endpoint)
+        started = threading.Event()
+        primary = self._executor.submit(self._timed, func, endpoint, started)
+        if delay is None:
+            return primary.result()
+        # Time spent waiting for a free worker is not request latency
+        started.wait()
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        hedge = self._executor.submit(self._timed, func, endpoint)
+        with self._lock:
+            self.hedged += 1
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda i: i is hedge):
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+        return primary.result()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+        }
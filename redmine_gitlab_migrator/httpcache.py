@@ -0,0 +1,130 @@
+""" In-run cache of GET responses
+
+Concurrent identical GET requests are merged into a single HTTP call, whose
+response is handed to all the callers. Responses of some endpoints are
+also kept for a while (per-endpoint TTL), in a bounded LRU cache. Writes
+to an URL forget what was cached under it.
+
+Cached responses are shared between callers, which must not modify them.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+import json
+import re
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, ttls=(), max_entries=1024, clock=time.monotonic):
+        """
+        :param ttls: list of (URL regex, seconds) couples. Responses of URLs
+            matching none of them are not kept (concurrent identical
+            requests are still merged).
+        :param max_entries: least recently used responses are dropped
+            beyond that count
+        """
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        # key -> (url, expiration time, response)
+        self._entries = OrderedDict()
+        # key -> Future of the response
+        self._in_flight = {}
+        # In-flight requests whose URL was invalidated meanwhile: their
+        # response may be stale, it is not kept
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def ttl(self, url):
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    @staticmethod
+    def key(url, kwargs):
+        return url, json.dumps(kwargs, sort_keys=True, default=str)
+
+    def get(self, url, kwargs, fetch):
+        """ Cached response for a request, calling fetch() if needed
+
+        :param kwargs: other request parameters (params, headers...)
+        """
+        key = self.key(url, kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                del self._entries[key]
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                # Another thread performs the request
+                owner = False
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+                owner = True
+
+        if owner:
+            return self._fetch(key, url, future, fetch)
+        return future.result()
+
+    def _fetch(self, key, url, future, fetch):
+        try:
+            response = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+                self._stale.discard(key)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            stale = key in self._stale
+            self._stale.discard(key)
+            ttl = self.ttl(url)
+            if ttl and not stale:
+                self._entries[key] = (url, self.clock() + ttl, response)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(response)
+        return response
+
+    def invalidate(self, url):
+        """ Forget responses of an URL, of its sub-resources, and of its
+        collection if it is an item (ex: ".../milestones/12")
+        """
+        prefixes = [url]
+        collection, _, item = url.rpartition('/')
+        if item.isdigit():
+            prefixes.append(collection)
+        prefixes = tuple(prefixes)
+        with self._lock:
+            self._stale.update(
+                k for k in self._in_flight if k[0].startswith(prefixes))
+            for key in [k for k, v in self._entries.items()
+                        if v[0].startswith(prefixes)]:
+                del self._entries[key]
+
+    def stats(self):
+        """ Counts of cache hits, misses (actual requests) and requests
+        merged into an in-flight one
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
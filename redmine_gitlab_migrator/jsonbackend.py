@@ -0,0 +1,52 @@
+""" JSON decoding, using the fastest available library
+
+orjson (or else ujson) is used to decode bodies when installed, the
+standard json module otherwise. Lists can also be parsed incrementally,
+item by item, with ijson when installed.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    loads = orjson.loads
+elif ujson is not None:
+    BACKEND = 'ujson'
+    loads = ujson.loads
+else:
+    BACKEND = 'json'
+
+    def loads(data):
+        # json.loads() only accepts bytes since python 3.6
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+def iter_items(fileobj, key):
+    """ Yields the items of the list under ``key`` of a JSON object
+
+    Without ijson, the whole document is decoded first.
+
+    :param fileobj: binary file-like object holding the document
+    """
+    if ijson is None:
+        yield from loads(fileobj.read())[key]
+    else:
+        yield from ijson.items(fileobj, '{}.item'.format(key), use_float=True)
@@ -0,0 +1,253 @@
+""" Serialized operation plans, and their parallel execution
+
+A plan lists every gitlab write of a migration (milestones, labels, issues,
+notes...) with its payload. Values only known at execution time (ex: the
+id of a created milestone) are references to other operations results:
+``{"$ref": "<operation id>.<result field>"}``. An operation runs once the
+operations it refers to, or explicitly depends on, are done.
+
+Plans are built once from redmine data, then can be applied (and re-applied
+after a failure) without touching redmine anymore.
+"""
+
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlencode
+
+log = logging.getLogger(__name__)
+
+PLAN_FORMAT_VERSION = 1
+
+# Result fields kept for references
+RESULT_FIELDS = ('id', 'iid')
+
+
+class PlanError(Exception):
+    pass
+
+
+def ref(operation_id, field='id'):
+    """ Reference to a field of another operation result
+    """
+    return {'$ref': '{}.{}'.format(operation_id, field)}
+
+
+def iter_refs(value):
+    """ Yields operation ids referenced in a value (path, data...)
+    """
+    if isinstance(value, dict):
+        if '$ref' in value:
+            yield value['$ref'].rsplit('.', 1)[0]
+        else:
+            for i in value.values():
+                yield from iter_refs(i)
+    elif isinstance(value, list):
+        for i in value:
+            yield from iter_refs(i)
+
+
+def resolve(value, results):
+    """ Replace references by actual values from operations results
+    """
+    if isinstance(value, dict):
+        if '$ref' in value:
+            operation_id, field = value['$ref'].rsplit('.', 1)
+            return results[operation_id][field]
+        return {k: resolve(v, results) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [resolve(i, results) for i in value]
+    return value
+
+
+class Plan:
+    def __init__(self, gitlab_project_url, operations=None, **meta):
+        """
+        :param gitlab_project_url: project the plan applies to
+        :param meta: other informations, stored as is in plan file
+        """
+        self.gitlab_project_url = gitlab_project_url
+        self.operations = operations or []
+        self.meta = meta
+        self._ids = {i['id'] for i in self.operations}
+
+    def add(self, operation_id, kind, method, path, data=None,
+            sudo_user=None, depends_on=()):
+        """ Append an operation to the plan
+
+        :param path: list of URL segments, relative to gitlab project API
+            URL, possibly containing references
+        :param depends_on: ids of operations to wait for, besides the
+            referenced ones
+        """
+        if operation_id in self._ids:
+            raise PlanError('Duplicate operation {}'.format(operation_id))
+        depends_on = list(depends_on)
+        for i in iter_refs([path, data]):
+            if i not in depends_on:
+                depends_on.append(i)
+        unknown = set(depends_on) - self._ids
+        if unknown:
+            raise PlanError('{} depends on unknown {}'.format(
+                operation_id, ', '.join(sorted(unknown))))
+
+        self._ids.add(operation_id)
+        self.operations.append({
+            'id': operation_id,
+            'kind': kind,
+            'method': method,
+            'path': path,
+            'data': data or {},
+            'sudo_user': sudo_user,
+            'depends_on': depends_on,
+        })
+
+    def stats(self):
+        """ Expected requests count (total and by kind) and uploaded bytes
+        """
+        return {
+            'requests': len(self.operations),
+            'requests_by_kind': dict(Counter(
+                i['kind'] for i in self.operations)),
+            'bytes': sum(
+                len(urlencode(i['data'], doseq=True))
+                for i in self.operations),
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'version': PLAN_FORMAT_VERSION,
+                'gitlab_project_url': self.gitlab_project_url,
+                'meta': self.meta,
+                'stats': self.stats(),
+                'operations': self.operations,
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != PLAN_FORMAT_VERSION:
+            raise PlanError('Unsupported plan format in {}'.format(path))
+        return cls(data['gitlab_project_url'], data['operations'],
+                   **data['meta'])
+
+
+class PlanExecutor:
+    """ Runs plan operations, concurrently as soon as dependencies allow
+
+    Among runnable operations, those coming first in the plan are started
+    first. Results are journaled in a state file, so that an interrupted
+    run can be resumed.
+    """
+    def __init__(self, plan, gitlab_project, jobs=1, state_path=None):
+        self.plan = plan
+        self.gitlab_project = gitlab_project
+        self.jobs = jobs
+        self.state_path = state_path
+        self._lock = threading.Lock()
+
+    def load_state(self):
+        results = {}
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        results[entry['id']] = entry['result']
+        return results
+
+    def _save_result(self, operation_id, result):
+        if self.state_path:
+            with self._lock, open(self.state_path, 'a') as f:
+                f.write(json.dumps({'id': operation_id, 'result': result}))
+                f.write('\n')
+
+    def execute(self, operation, results):
+        """ Performs a single operation
+
+        :return: the result fields to keep
+        """
+        path = '/'.join(str(i) for i in resolve(operation['path'], results))
+        url = '{}/{}'.format(self.gitlab_project.api_url, path)
+        kwargs = {'data': resolve(operation['data'], results)}
+        if operation['sudo_user']:
+            kwargs['headers'] = {'SUDO': operation['sudo_user']}
+
+        if operation['method'] == 'POST':
+            response = self.gitlab_project.api.post(url, **kwargs)
+        elif operation['method'] == 'PUT':
+            response = self.gitlab_project.api.put(url, **kwargs)
+        else:
+            raise PlanError('Unsupported method {}'.format(
+                operation['method']))
+
+        if isinstance(response, dict):
+            return {k: response[k] for k in RESULT_FIELDS if k in response}
+        return {}
+
+    def run(self):
+        """ Apply the plan
+
+        :return: count of operations performed by this run
+        :raises PlanError: if an operation failed (operations already
+            running are completed first)
+        """
+        results = self.load_state()
+        operations = {i['id']: i for i in self.plan.operations}
+        # Plan order, dicts being unordered before python 3.6
+        order = {i['id']: n for n, i in enumerate(self.plan.operations)}
+
+        waiting_for = {}
+        dependents = defaultdict(list)
+        ready = []
+        for operation in self.plan.operations:
+            op_id = operation['id']
+            if op_id in results:
+                continue
+            deps = [i for i in operation['depends_on'] if i not in results]
+            waiting_for[op_id] = len(deps)
+            for i in deps:
+                dependents[i].append(op_id)
+            if not deps:
+                heapq.heappush(ready, (order[op_id], op_id))
+
+        done = 0
+        failure = None
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while ready or running:
+                while ready and len(running) < self.jobs and not failure:
+                    op_id = heapq.heappop(ready)[1]
+                    running[executor.submit(
+                        self.execute, operations[op_id], results)] = op_id
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    op_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        log.error('Operation {} failed: {}'.format(op_id, e))
+                        failure = failure or (op_id, e)
+                        continue
+
+                    results[op_id] = result
+                    self._save_result(op_id, result)
+                    done += 1
+                    log.info('{} done'.format(op_id))
+                    for i in dependents[op_id]:
+                        waiting_for[i] -= 1
+                        if waiting_for[i] == 0:
+                            heapq.heappush(ready, (order[i], i))
+
+        if failure:
+            raise PlanError('Operation {} failed: {}'.format(*failure))
+        return done
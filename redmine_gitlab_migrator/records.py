@@ -0,0 +1,161 @@
+""" Compact in-memory representation of redmine data
+
+Redmine API responses carry many fields the migration never reads. These
+records keep only the useful ones, in ``__slots__`` classes, and share
+repeated values (users, trackers, dates...) among all issues.
+
+Records offer the read-only dict-like access of the API responses they
+replace (``record['id']``, ``record.get('journals', [])``), so that
+converters work on both.
+"""
+
+import sys
+
+
+class Record:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def as_dict(self):
+        """ Plain data, as in the API response the record comes from
+        """
+        return {
+            i: _as_plain(getattr(self, i)) for i in self.__slots__
+            if getattr(self, i) is not None}
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(i, getattr(self, i)) for i in self.__slots__))
+
+
+def _as_plain(value):
+    if isinstance(value, Record):
+        return value.as_dict()
+    elif isinstance(value, tuple):
+        return [_as_plain(i) for i in value]
+    return value
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Ref(Record):
+    """ Reference to a named redmine object (user, tracker, version...)
+    """
+    __slots__ = ('id', 'name')
+
+    _instances = {}
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    @classmethod
+    def from_api(cls, data):
+        """ Returns a shared instance for each distinct (id, name)
+        """
+        if data is None:
+            return None
+        key = (data.get('id'), data.get('name'))
+        try:
+            return cls._instances[key]
+        except KeyError:
+            return cls._instances.setdefault(
+                key, cls(key[0], _intern(key[1])))
+
+
+class DetailRecord(Record):
+    """ Change of an issue property, in a journal entry
+    """
+    __slots__ = ('property', 'name', 'old_value', 'new_value')
+
+    def __init__(self, data):
+        self.property = _intern(data['property'])
+        self.name = _intern(data['name'])
+        if self.property == 'attr' and self.name == 'description':
+            # Whole texts, never displayed
+            self.old_value = self.new_value = None
+        else:
+            self.old_value = _intern(data.get('old_value'))
+            self.new_value = _intern(data.get('new_value'))
+
+
+class JournalRecord(Record):
+    __slots__ = ('id', 'user', 'notes', 'created_on', 'details')
+
+    def __init__(self, data, details=False):
+        """
+        :param details: keep properties changes, only needed for timeline
+            notes
+        """
+        self.id = data['id']
+        self.user = Ref.from_api(data.get('user'))
+        self.notes = data.get('notes') or ''
+        self.created_on = _intern(data['created_on'])
+        self.details = tuple(
+            DetailRecord(i) for i in data.get('details', [])
+        ) if details else ()
+
+
+class RelationRecord(Record):
+    __slots__ = ('issue_id', 'issue_to_id', 'relation_type')
+
+    def __init__(self, data):
+        self.issue_id = data['issue_id']
+        self.issue_to_id = data['issue_to_id']
+        self.relation_type = _intern(data['relation_type'])
+
+
+class AttachmentRecord(Record):
+    __slots__ = (
+        'id', 'filename', 'filesize', 'content_type', 'content_url', 'digest')
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.filename = data['filename']
+        self.filesize = data.get('filesize')
+        self.content_type = _intern(data.get('content_type'))
+        self.content_url = data.get('content_url')
+        self.digest = data.get('digest')
+
+
+class IssueRecord(Record):
+    __slots__ = (
+        'id', 'subject', 'description', 'created_on', 'updated_on',
+        'closed_on', 'tracker', 'author', 'assigned_to', 'fixed_version',
+        'journals', 'relations', 'attachments', 'watchers')
+
+    def __init__(self, data, details=False):
+        """
+        :param data: a redmine issue, as returned by API
+        :param details: keep journals properties changes, only needed for
+            timeline notes
+        """
+        self.id = data['id']
+        self.subject = data['subject']
+        self.description = data.get('description') or ''
+        self.created_on = _intern(data['created_on'])
+        self.updated_on = _intern(data.get('updated_on'))
+        self.closed_on = _intern(data.get('closed_on'))
+        self.tracker = Ref.from_api(data['tracker'])
+        self.author = Ref.from_api(data['author'])
+        self.assigned_to = Ref.from_api(data.get('assigned_to'))
+        self.fixed_version = Ref.from_api(data.get('fixed_version'))
+        self.journals = tuple(
+            JournalRecord(i, details) for i in data.get('journals', []))
+        self.relations = tuple(
+            RelationRecord(i) for i in data.get('relations', []))
+        self.attachments = tuple(
+            AttachmentRecord(i) for i in data.get('attachments', []))
+        self.watchers = tuple(
+            Ref.from_api(i) for i in data.get('watchers', []))
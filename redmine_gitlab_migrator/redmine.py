@@ -1,13 +1,45 @@
 from itertools import chain
+import posixpath
 import re
+from urllib.parse import quote, urlsplit
 
-from . import APIClient, Project
+from . import APIClient, CachedMixin, Project
+from .records import IssueRecord
 
 ANONYMOUS_USER_ID = 2
 
 class RedmineClient(APIClient):
     PAGE_MAX_SIZE = 100
 
+    # Redmine data is only read: users, project and versions are kept for
+    # the whole run
+    CACHE_TTLS = (
+        (r'/users/\d+\.json$', 3600),
+        (r'/projects/[^/]+(/versions)?\.json$', 3600),
+    )
+
+    TIMEOUTS = (
+        (r'/attachments/download/', (10, 300)),
+        # Pages of 100 issues, with their relations and attachments
+        (r'/issues\.json', (10, 120)),
+    )
+
+    ENDPOINTS = (
+        r'/attachments/download/',
+        r'/issues\.json',
+        r'/issues/\d+\.json',
+        r'/users/\d+\.json',
+        r'/wiki/',
+    )
+
+    def __init__(self, *args, stream_lists=False, **kwargs):
+        """
+        :param stream_lists: parse list pages while downloading them
+            (see :meth:`unpaginated_get`)
+        """
+        super().__init__(*args, **kwargs)
+        self.stream_lists = stream_lists
+
     def get_auth_headers(self):
         return {"X-Redmine-API-Key": self.api_key}
 
@@ -15,15 +47,20 @@ class RedmineClient(APIClient):
         # In detail views, redmine encapsulate "foo" typed objects under a
         # "foo" key on the JSON.
         ret = super().get(*args, **kwargs)
-        values = ret.values()
-        if len(values) == 1:
-            return list(values)[0]
+        if len(ret) == 1:
+            return next(iter(ret.values()))
         else:
             return ret
 
     def unpaginated_get(self, *args, **kwargs):
         """ Iterates over API pagination for a given resource list
+
+        With ``stream_lists``, items are yielded as they are parsed, pages
+        are never held whole in memory.
         """
+        if self.stream_lists:
+            return self._streamed_unpaginated_get(*args, **kwargs)
+
         kwargs['params'] = kwargs.get('params', {})
         kwargs['params']['limit'] = self.PAGE_MAX_SIZE
 
@@ -38,6 +75,9 @@ class RedmineClient(APIClient):
 
         result_pages = [resp[res_list_key]]
         if 'offset' not in resp:
+            # Some lists (ex: versions) ignore pagination, they come whole
+            if resp.get('total_count') == len(resp[res_list_key]):
+                return iter(resp[res_list_key])
             raise ValueError('HTTP response data is not paginated')
 
         while (resp['total_count'] - resp['offset'] - resp['limit']) > 0:
@@ -47,8 +87,64 @@ class RedmineClient(APIClient):
             result_pages.append(resp[res_list_key])
         return chain.from_iterable(result_pages)
 
+    def _streamed_unpaginated_get(self, url, params=None, **kwargs):
+        # Items come before pagination data in redmine responses: pages are
+        # requested until a partial one.
+        key = posixpath.basename(urlsplit(url).path).rsplit('.', 1)[0]
+        params = dict(params or {}, limit=self.PAGE_MAX_SIZE)
+        offset = params.pop('offset', 0)
+        previous_first = None
+        while True:
+            count = 0
+            for item in self.stream_list(
+                    url, key, params=dict(params, offset=offset), **kwargs):
+                if count == 0:
+                    # Lists ignoring pagination come whole, again and again
+                    # at each offset
+                    if item == previous_first:
+                        return
+                    previous_first = item
+                count += 1
+                yield item
+            # Lists ignoring pagination may also come in a longer page
+            if count != self.PAGE_MAX_SIZE:
+                return
+            offset += self.PAGE_MAX_SIZE
+
+
+class RedmineInstance(CachedMixin):
+    def __init__(self, url, client):
+        self.url = url.strip('/')  # normalize URL
+        self.api = client
+
+    def get_user(self, user_id):
+        """ Get a user, fetched once whatever the number of projects
+        """
+        return self._cached(('user', user_id), lambda: self.api.get(
+            '{}/users/{}.json'.format(self.url, user_id)))
+
+    def get_issue_statuses(self):
+        return self._cached('issue_statuses', lambda: self.api.get(
+            '{}/issue_statuses.json'.format(self.url)))
+
+    def get_trackers(self):
+        return self._cached('trackers', lambda: self.api.get(
+            '{}/trackers.json'.format(self.url)))
+
+    def get_issue_priorities(self):
+        return self._cached('issue_priorities', lambda: self.api.get(
+            '{}/enumerations/issue_priorities.json'.format(self.url)))
+
 
 class RedmineProject(Project):
+    # Associated data that can be requested along with issue details
+    ISSUE_INCLUDES = (
+        'journals', 'relations', 'attachments', 'watchers', 'children')
+    # Those that can also be requested on issues list
+    ISSUE_LIST_INCLUDES = ('relations', 'attachments')
+    # Keeps URLs reasonably short when filtering issues by id
+    ISSUE_IDS_PER_REQUEST = 100
+
     REGEX_PROJECT_URL = re.compile(
         r'^(?P<base_url>https?://.*)/projects/(?P<project_name>[\w_-]+)$')
 
@@ -58,8 +154,15 @@ class RedmineProject(Project):
     def __init__(self, url, *args, **kwargs):
         normalized_url = self._canonicalize_url(url)
         super().__init__(normalized_url, *args, **kwargs)
+        # May be set to share the RedmineInstance with other projects
+        self.instance = None
         self.api_url = '{}.json'.format(self.public_url)
         self.instance_url = self._url_match.group('base_url')
+        # Only what is actually converted is worth fetching
+        self.issue_includes = ('journals', 'relations')
+        # Journals properties changes are dropped, unless converted to
+        # timeline notes
+        self.journal_details = False
 
     @classmethod
     def _canonicalize_url(cls, url):
@@ -78,29 +181,81 @@ class RedmineProject(Project):
             return url
 
     def get_all_issues(self):
-        issues = self.api.unpaginated_get(
-            '{}/issues.json?status_id=*'.format(self.public_url))
-        detailed_issues = []
-        # It's impossible to get issue history from list view, so get it from
-        # detail view...
+        """ Fetch all issues of the project, with their details
+
+        Associated data fetched with each issue is set by ``issue_includes``
+        (a subset of ``ISSUE_INCLUDES``). Issues are fetched once per run.
+
+        :return: list of compact issue records
+        :rtype: list of :class:`IssueRecord`
+        """
+        includes = tuple(self.issue_includes)
+        return self._cached(
+            ('issues', includes, self.journal_details),
+            lambda: self._fetch_issues(includes))
+
+    def get_issues(self, issue_ids):
+        """ Fetch some issues of the project, with their details
 
-        for issue_id in (i['id'] for i in issues):
-            issue_url = '{}/issues/{}.json?include=journals,watchers,relations,childrens,attachments'.format(
-                self.instance_url, issue_id)
-            detailed_issues.append(self.api.get(issue_url))
+        Same as :meth:`get_all_issues`, but restricted to some issue ids and
+        not cached.
+
+        :rtype: list of :class:`IssueRecord`
+        """
+        issues = []
+        step = self.ISSUE_IDS_PER_REQUEST
+        for i in range(0, len(issue_ids), step):
+            issues.extend(self._fetch_issues(
+                tuple(self.issue_includes), issue_ids[i:i + step]))
+        return issues
+
+    def _fetch_issues(self, includes, issue_ids=None):
+        list_includes = [i for i in includes if i in self.ISSUE_LIST_INCLUDES]
+        detail_includes = [
+            i for i in includes if i not in self.ISSUE_LIST_INCLUDES]
+
+        issues_url = '{}/issues.json?status_id=*'.format(self.public_url)
+        if list_includes:
+            issues_url += '&include={}'.format(','.join(list_includes))
+        if issue_ids is not None:
+            issues_url += '&issue_id={}'.format(
+                ','.join(str(i) for i in issue_ids))
+
+        detailed_issues = []
+        for issue in self.api.unpaginated_get(issues_url):
+            # It's impossible to get issue history from list view, so get it
+            # from detail view, unless issue never changed since creation.
+            untouched = issue.get('updated_on') == issue['created_on']
+            if detail_includes and not (
+                    untouched and detail_includes == ['journals']):
+                issue_url = '{}/issues/{}.json?include={}'.format(
+                    self.instance_url, issue['id'], ','.join(detail_includes))
+                issue.update(self.api.get(issue_url))
+            detailed_issues.append(
+                IssueRecord(issue, details=self.journal_details))
 
         return detailed_issues
 
-    def get_participants(self):
+    def get_issue_ids(self):
+        """ Ids of all the issues of the project, fetched from issues list
+
+        :rtype: list
+        """
+        return [i['id'] for i in self.api.unpaginated_get(
+            '{}/issues.json?status_id=*'.format(self.public_url))]
+
+    def get_participants(self, issues=None):
         """Get participating users (issues authors/owners)
 
+        :param issues: issues to look at, defaults to all project issues
         :return: list of all users participating on issues
         :rtype: list
         """
         user_ids = set()
         users = []
-        # FIXME: cache
-        for i in self.get_all_issues():
+        if issues is None:
+            issues = self.get_all_issues()
+        for i in issues:
             for i in chain(i.get('watchers', []),
                            [i['author'], i.get('assigned_to', None)]):
 
@@ -111,15 +266,59 @@ class RedmineProject(Project):
         for i in user_ids:
             # The anonymous user is not really part of the project...
             if i != ANONYMOUS_USER_ID:
-                users.append(self.api.get('{}/users/{}.json'.format(
-                    self.instance_url, i)))
+                users.append(self.get_instance().get_user(i))
         return users
 
-    def get_users_index(self):
+    def get_users_index(self, issues=None):
         """ Returns dict index of users (by user id)
+
+        :param issues: issues to look at, defaults to all project issues
         """
-        return {i['id']: i for i in self.get_participants()}
+        return {i['id']: i for i in self.get_participants(issues)}
+
+    def get_instance(self):
+        """ Return a RedmineInstance, the same one on every call
+        """
+        if self.instance is None:
+            self.instance = RedmineInstance(self.instance_url, self.api)
+        return self.instance
 
     def get_versions(self):
-        response = self.api.get('{}/versions.json'.format(self.public_url))
-        return response['versions']
+        """ Versions of the project, shared ones included, fetched once per
+        run
+        """
+        return self._cached('versions', lambda: list(self.api.unpaginated_get(
+            '{}/versions.json'.format(self.public_url))))
+
+    def get_wiki_index(self):
+        """ List of the wiki pages (title, parent...), without their text
+        """
+        return self.api.get('{}/wiki/index.json'.format(self.public_url))
+
+    def get_wiki_page(self, title):
+        """ Last version of a wiki page, with its text
+        """
+        return self.api.get('{}/wiki/{}.json'.format(
+            self.public_url, quote(title)))
+
+    def get_issue_categories(self):
+        response = self.api.get(
+            '{}/issue_categories.json'.format(self.public_url))
+        return response['issue_categories']
+
+    def get_field_values(self):
+        """ Names of the values of issue attributes referring to other
+        objects, as found in journals details
+
+        :return: dict of names, by value (id as str), by attribute
+        """
+        instance = self.get_instance()
+        named = {
+            'status_id': instance.get_issue_statuses(),
+            'tracker_id': instance.get_trackers(),
+            'priority_id': instance.get_issue_priorities(),
+            'category_id': self.get_issue_categories(),
+            'fixed_version_id': self.get_versions(),
+        }
+        return {attribute: {str(i['id']): i['name'] for i in values}
+                for attribute, values in named.items()}
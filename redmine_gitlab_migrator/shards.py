@@ -0,0 +1,243 @@
+""" Work queue splitting a migration in shards of issues
+
+The queue is a SQLite file, shared by a coordinator and workers (possibly
+on other hosts, through a shared filesystem supporting locks). Workers
+claim shards for a limited time (lease) that they renew while working;
+the coordinator gives back to the queue the shards whose lease expired, as
+their worker is considered dead.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class LeaseLost(Exception):
+    """ The worker does not own its shard anymore
+    """
+
+
+class ShardQueue:
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS shards (
+        id INTEGER PRIMARY KEY,
+        issue_ids TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        report TEXT
+    );
+    """
+
+    def __init__(self, path, lease_duration=300, max_attempts=3):
+        """
+        :param path: SQLite file path
+        :param lease_duration: seconds a worker owns a shard without
+            renewing its lease
+        :param max_attempts: a shard failing that many times is not
+            dispatched anymore
+        """
+        self.path = path
+        self.lease_duration = lease_duration
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        # autocommit mode, transactions are explicit
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Connection(conn)
+
+    def create(self, issue_ids, shard_size):
+        """ Split issue ids in shards and queue them
+
+        :param issue_ids: redmine issue ids, in migration order
+        :return: number of created shards
+        """
+        issue_ids = list(issue_ids)
+        shards = [issue_ids[i:i + shard_size]
+                  for i in range(0, len(issue_ids), shard_size)]
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT COUNT(*) FROM shards').fetchone()[0]:
+                conn.execute('ROLLBACK')
+                raise ValueError('{} is already populated'.format(self.path))
+            conn.executemany(
+                'INSERT INTO shards (issue_ids) VALUES (?)',
+                ((json.dumps(i),) for i in shards))
+            conn.execute('COMMIT')
+        return len(shards)
+
+    def claim(self, worker):
+        """ Lease the next pending shard
+
+        :return: (shard id, list of issue ids) or None if nothing is pending
+        """
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, issue_ids FROM shards WHERE state = ? '
+                'ORDER BY id LIMIT 1', (PENDING,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE shards SET state = ?, worker = ?, '
+                    'lease_expires = ?, attempts = attempts + 1 '
+                    'WHERE id = ?',
+                    (LEASED, worker, time.time() + self.lease_duration,
+                     row['id']))
+            conn.execute('COMMIT')
+        if row is None:
+            return None
+        return row['id'], json.loads(row['issue_ids'])
+
+    def _update_leased(self, shard_id, worker, sql, params):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                sql + ' WHERE id = ? AND state = ? AND worker = ?',
+                tuple(params) + (shard_id, LEASED, worker))
+            return cursor.rowcount == 1
+
+    def owns(self, shard_id, worker):
+        """ Whether the worker still holds the lease of a shard
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT COUNT(*) FROM shards WHERE id = ? AND state = ? '
+                'AND worker = ?', (shard_id, LEASED, worker)).fetchone()[0]
+
+    def attempts(self, shard_id):
+        """ Number of times a shard was claimed, the current claim included
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT attempts FROM shards WHERE id = ?',
+                (shard_id,)).fetchone()[0]
+
+    def renew(self, shard_id, worker):
+        """ Extend the lease of a shard
+
+        :return: False if the worker does not own the shard anymore
+        """
+        return self._update_leased(
+            shard_id, worker, 'UPDATE shards SET lease_expires = ?',
+            (time.time() + self.lease_duration,))
+
+    def complete(self, shard_id, worker, report):
+        """ Mark a shard as done, with its report (a JSON-able dict)
+        """
+        return self._update_leased(
+            shard_id, worker, 'UPDATE shards SET state = ?, report = ?',
+            (DONE, json.dumps(report)))
+
+    def fail(self, shard_id, worker, error):
+        """ Give a shard back to the queue, unless it failed too often
+        """
+        return self._update_leased(
+            shard_id, worker,
+            'UPDATE shards SET report = ?, worker = NULL, '
+            'state = CASE WHEN attempts >= ? THEN ? ELSE ? END',
+            (json.dumps({'error': error}), self.max_attempts,
+             FAILED, PENDING))
+
+    def expire_leases(self):
+        """ Re-dispatch the shards of dead workers
+
+        :return: ids of the shards given back to the queue
+        """
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = [i['id'] for i in conn.execute(
+                'SELECT id FROM shards WHERE state = ? AND lease_expires < ?',
+                (LEASED, time.time()))]
+            conn.executemany(
+                'UPDATE shards SET state = ?, worker = NULL WHERE id = ?',
+                ((PENDING, i) for i in expired))
+            conn.execute('COMMIT')
+        return expired
+
+    def progress(self):
+        """ Count shards by state
+
+        :rtype: dict
+        """
+        counts = dict.fromkeys((PENDING, LEASED, DONE, FAILED), 0)
+        with self._connect() as conn:
+            counts.update(conn.execute(
+                'SELECT state, COUNT(*) FROM shards GROUP BY state'))
+        return counts
+
+    def reports(self):
+        """ Reports of all the finished (done or failed) shards
+
+        :return: list of (shard id, state, report dict)
+        """
+        with self._connect() as conn:
+            return [
+                (i['id'], i['state'], json.loads(i['report']))
+                for i in conn.execute(
+                    'SELECT id, state, report FROM shards '
+                    'WHERE state IN (?, ?) ORDER BY id', (DONE, FAILED))]
+
+
+class _Connection:
+    """ sqlite3 connection closed when leaving the "with" block
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        if self.conn.in_transaction:
+            self.conn.execute('ROLLBACK')
+        self.conn.close()
+
+
+class LeaseKeeper:
+    """ Renews a shard lease in background, while the worker processes it
+
+    The worker calls :meth:`check` before each write, to stop working on a
+    shard re-dispatched to another worker.
+    """
+    def __init__(self, queue, shard_id, worker):
+        self.queue = queue
+        self.shard_id = shard_id
+        self.worker = worker
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_duration / 3):
+            if not self.queue.renew(self.shard_id, self.worker):
+                log.warning('Lost lease on shard {}'.format(self.shard_id))
+                self.lost.set()
+                return
+
+    def check(self):
+        """ :raises LeaseLost: if the shard is not owned anymore
+        """
+        if self.lost.is_set() or \
+                not self.queue.owns(self.shard_id, self.worker):
+            self.lost.set()
+            raise LeaseLost('Lost lease on shard {}'.format(self.shard_id))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
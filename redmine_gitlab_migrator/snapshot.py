@@ -0,0 +1,217 @@
+""" Local snapshots of the data an issues migration reads, and offline
+validation of the migration against them
+
+A snapshot holds the redmine issues (with journals and relations), their
+participants and the project versions, along with the gitlab users,
+milestones and labels. Validating a migration from a snapshot needs no
+network access, so it can run repeatedly (ex: in CI).
+"""
+
+from collections import defaultdict
+import gzip
+import json
+import logging
+
+from .converters import convert_issues, user_table
+from .records import IssueRecord
+from .redmine import ANONYMOUS_USER_ID
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+SNAPSHOT_ISSUE_INCLUDES = ('journals', 'relations')
+
+# Max sizes (in chars) accepted by gitlab
+GITLAB_LIMITS = {
+    'title': 255,
+    'description': 1048576,
+    'note': 1000000,
+    'label': 255,
+}
+
+
+def take_snapshot(redmine_project, gitlab_project):
+    """ Fetch everything an issues migration reads
+
+    :rtype: dict
+    """
+    redmine_project.issue_includes = SNAPSHOT_ISSUE_INCLUDES
+    issues = redmine_project.get_all_issues()
+    return {
+        'version': SNAPSHOT_FORMAT_VERSION,
+        'redmine': {
+            'project_url': redmine_project.public_url,
+            'issues': [i.as_dict() for i in issues],
+            'users': list(redmine_project.get_users_index(issues).values()),
+            'versions': redmine_project.get_versions(),
+        },
+        'gitlab': {
+            'project_url': gitlab_project.public_url,
+            'users': gitlab_project.get_instance().get_all_users(),
+            'milestones': gitlab_project.get_milestones(),
+            'labels': gitlab_project.get_labels(),
+        },
+    }
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def dump_snapshot(snapshot, path):
+    """ Write a snapshot as JSON, gzipped if path ends with ".gz"
+    """
+    with _open(path, 'w') as f:
+        json.dump(snapshot, f)
+
+
+def load_snapshot(path):
+    with _open(path, 'r') as f:
+        snapshot = json.load(f)
+    if snapshot.get('version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError('Unsupported snapshot format in {}'.format(path))
+    return snapshot
+
+
+class SnapshotValidator:
+    """ Checks, from a snapshot, everything an issues migration relies on
+
+    Each check returns a list of problems (strings), empty if the check
+    passed.
+    """
+    # Issues converted at once when checking payloads
+    BATCH_SIZE = 1000
+
+    def __init__(self, snapshot, textile=True):
+        self.textile = textile
+        redmine, gitlab = snapshot['redmine'], snapshot['gitlab']
+        self.issues = [IssueRecord(i) for i in redmine['issues']]
+        self.redmine_users_index = {i['id']: i for i in redmine['users']}
+        self.gitlab_users_index = {i['username']: i for i in gitlab['users']}
+        self.labels = {i['name'] for i in gitlab['labels']}
+
+        # Versions not migrated yet will be, by the roadmap migration
+        self.milestones_index = {i['title']: i for i in gitlab['milestones']}
+        self.planned_milestones = {
+            i['name'] for i in redmine['versions']
+            if i['name'] not in self.milestones_index}
+        for i in self.planned_milestones:
+            self.milestones_index[i] = {'id': None, 'title': i}
+
+    def check_users(self):
+        """ Issues participants must exist, with the same login, in gitlab
+        """
+        missing = defaultdict(list)
+        for issue in self.issues:
+            participants = [issue['author'], issue.get('assigned_to')]
+            participants.extend(issue.get('watchers', []))
+            for user in participants:
+                if user is None or user['id'] == ANONYMOUS_USER_ID:
+                    continue
+                redmine_user = self.redmine_users_index.get(user['id'])
+                if redmine_user is None:
+                    key = 'redmine user #{} ({})'.format(
+                        user['id'], user['name'])
+                elif redmine_user['login'] not in self.gitlab_users_index:
+                    key = 'gitlab user {}'.format(redmine_user['login'])
+                else:
+                    continue
+                missing[key].append(issue['id'])
+
+        return ['Missing {}, used by {} issue(s), ex: #{}'.format(
+            k, len(v), v[0]) for k, v in sorted(missing.items())]
+
+    def check_milestones(self):
+        """ Issues versions must exist in gitlab or in redmine roadmap
+        """
+        missing = defaultdict(list)
+        for issue in self.issues:
+            version = issue.get('fixed_version')
+            if version and version['name'] not in self.milestones_index:
+                missing[version['name']].append(issue['id'])
+
+        return ['Unknown version {}, used by {} issue(s), ex: #{}'.format(
+            k, len(v), v[0]) for k, v in sorted(missing.items())]
+
+    def check_labels(self):
+        """ Labels to create must have acceptable names
+        """
+        labels = {i['tracker']['name'] for i in self.issues}
+        return ['Label {} is too long'.format(i) for i in sorted(labels)
+                if len(i) > GITLAB_LIMITS['label']]
+
+    def labels_to_create(self):
+        return sorted({i['tracker']['name'] for i in self.issues} -
+                      self.labels)
+
+    def _convertible_issues(self):
+        """ Issues that check_users and check_milestones did not reject
+        """
+        for issue in self.issues:
+            version = issue.get('fixed_version')
+            if version and version['name'] not in self.milestones_index:
+                continue
+            assigned_to = issue.get('assigned_to')
+            if assigned_to is not None:
+                user = self.redmine_users_index.get(assigned_to['id'])
+                if user is None or \
+                        user['login'] not in self.gitlab_users_index:
+                    continue
+            yield issue
+
+    def _converted_issues(self):
+        """ Yields (issue, (data, meta)) for convertible issues, converted
+        by batches
+        """
+        issues = list(self._convertible_issues())
+        users = user_table(self.redmine_users_index, self.gitlab_users_index)
+        for i in range(0, len(issues), self.BATCH_SIZE):
+            batch = issues[i:i + self.BATCH_SIZE]
+            yield from zip(batch, convert_issues(
+                batch, self.redmine_users_index, self.gitlab_users_index,
+                self.milestones_index, textile=self.textile, users=users))
+
+    def check_payloads(self):
+        """ Converted issues and notes must fit in gitlab limits
+        """
+        problems = []
+        for issue, (data, meta) in self._converted_issues():
+            for field in ('title', 'description'):
+                if len(data[field]) > GITLAB_LIMITS[field]:
+                    problems.append(
+                        'Issue #{} {} is too long ({} chars)'.format(
+                            issue['id'], field, len(data[field])))
+            for n, (note, _) in enumerate(meta['notes']):
+                if len(note['body']) > GITLAB_LIMITS['note']:
+                    problems.append(
+                        'Issue #{} note {} is too long ({} chars)'.format(
+                            issue['id'], n, len(note['body'])))
+        return problems
+
+    def validate(self):
+        """ Run all checks, logging their outcome
+
+        :return: list of all problems
+        """
+        checks = [
+            (self.check_users, 'Required users presence'),
+            (self.check_milestones, 'Issues versions presence'),
+            (self.check_labels, 'Labels names'),
+            (self.check_payloads, 'Payloads sizes'),
+        ]
+        problems = []
+        for func, message in checks:
+            found = func()
+            log.info('{}... {}'.format(message, 'FAILED' if found else 'OK'))
+            for i in found:
+                log.error(i)
+            problems.extend(found)
+
+        log.info('{} issues checked; would create {} milestone(s) and '
+                 'labels: {}'.format(
+                     len(self.issues), len(self.planned_milestones),
+                     ', '.join(self.labels_to_create()) + ' '))
+        return problems
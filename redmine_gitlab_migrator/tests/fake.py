@@ -1,3 +1,6 @@
+import threading
+
+
 JOHN = {
     "id": 1,
     "username": "john_smith",
@@ -159,6 +162,12 @@ REDMINE_ISSUE_1439 = {
 
 
 class FakeGitlabClient:
+    def get_total(self, url, params=None):
+        return len(self.get(url))
+
+    def iter_pages(self, url):
+        yield self.get(url)
+
     def get(self, url):
         if url.endswith('/users'):
             return [JOHN, JACK]
@@ -287,6 +296,16 @@ class FakeGitlabClient:
                 '/projects/diaspora%2Fdiaspora-project-site/members'):
             return [JACK, JOHN]
 
+        elif url.endswith('/projects/diaspora%2Fdiaspora-project-site/labels'):
+            return [{'name': 'feature', 'color': '#d9534f'}]
+
+        elif url.endswith(
+                '/projects/diaspora%2Fdiaspora-project-site/milestones'):
+            return [
+                {'id': 12, 'iid': 1, 'title': 'v0.5', 'state': 'closed'},
+                {'id': 13, 'iid': 2, 'title': 'v0.11', 'state': 'active'},
+            ]
+
         elif (url.endswith('/projects/6') or
               url.endswith('/projects/brightbox%2Fpuppet')):
             return {
@@ -340,6 +359,32 @@ class FakeGitlabClient:
             raise ValueError('No test data for {}'.format(url))
 
 
+class RecordingGitlabClient(FakeGitlabClient):
+    """ Fake client also accepting writes, keeping track of them
+    """
+    def __init__(self):
+        self.requests = []
+        self._next_id = 100
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        self.requests.append(('GET', url, None))
+        return super().get(url)
+
+    def post(self, url, data=None, headers=None):
+        with self._lock:
+            self.requests.append(('POST', url, data))
+            self._next_id += 1
+            next_id = self._next_id
+        created = dict(data) if isinstance(data, dict) else {}
+        created.update({'id': next_id, 'iid': next_id})
+        return created
+
+    def put(self, url, data=None, headers=None):
+        self.requests.append(('PUT', url, data))
+        return dict(data or {})
+
+
 class FakeRedmineClient:
     def unpaginated_get(self, url):
         if '/projects/puppet/issues.json' in url:
@@ -426,6 +471,9 @@ class FakeRedmineClient:
                 },
             ]
 
+        elif url.endswith('/versions.json'):
+            return self.get(url)['versions']
+
         else:
             raise ValueError('{} is unknown data test'.format(url))
 
@@ -534,3 +582,46 @@ class FakeRedmineClient:
 
         else:
             raise ValueError('{} is unknown data test'.format(url))
+
+
+class IssuesGitlabClient(RecordingGitlabClient):
+    """ Fake client keeping the issues and notes created through it
+    """
+    def __init__(self):
+        super().__init__()
+        self.issues = []
+        self.notes = {}
+
+    def _issue(self, url):
+        issue_id = int(url.split('/issues/')[1].split('/')[0])
+        return next(i for i in self.issues if i['id'] == issue_id)
+
+    def get(self, url):
+        if url.endswith('/issues'):
+            self.requests.append(('GET', url, None))
+            return [dict(i) for i in self.issues]
+        elif url.endswith('/notes'):
+            self.requests.append(('GET', url, None))
+            return list(self.notes.get(self._issue(url)['id'], []))
+        return super().get(url)
+
+    def post(self, url, data=None, headers=None):
+        created = super().post(url, data, headers)
+        if url.endswith('/issues'):
+            created.setdefault('description', '')
+            created['state'] = 'opened'
+            self.issues.append(created)
+        elif url.endswith('/notes'):
+            self.notes.setdefault(self._issue(url)['id'], []).append(created)
+        return created
+
+    def put(self, url, data=None, headers=None):
+        updated = super().put(url, data, headers)
+        if '/issues/' in url:
+            issue = self._issue(url)
+            issue.update(
+                (k, v) for k, v in updated.items() if k != 'state_event')
+            if updated.get('state_event') == 'close':
+                issue['state'] = 'closed'
+            return dict(issue)
+        return updated
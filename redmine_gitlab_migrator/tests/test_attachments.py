@@ -0,0 +1,85 @@
+import unittest
+
+from redmine_gitlab_migrator.attachments import AttachmentMigrator
+
+
+FILES = {
+    'http://redmine/attachments/download/1/screen.png': b'PNG' * 1000,
+    'http://redmine/attachments/download/2/screen.png': b'PNG' * 1000,
+    'http://redmine/attachments/download/3/other.png': b'GIF' * 1000,
+    'http://redmine/attachments/download/4/log.txt': b'hello',
+}
+
+
+def attachment(_id, filename):
+    url = 'http://redmine/attachments/download/{}/{}'.format(_id, filename)
+    return {'id': _id, 'filename': filename, 'content_url': url,
+            'filesize': len(FILES[url]), 'content_type': 'image/png'}
+
+
+class FakeStreamingRedmineClient:
+    def __init__(self):
+        self.downloads = []
+
+    def stream_get(self, url, chunk_size):
+        self.downloads.append(url)
+        content = FILES[url]
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+
+class FakeUploadProject:
+    def __init__(self):
+        self.uploaded = []
+
+    def upload_file(self, filename, chunks, content_type=None):
+        self.uploaded.append((filename, b''.join(chunks)))
+        url = '/uploads/{}/{}'.format(len(self.uploaded), filename)
+        return {'alt': filename, 'url': url,
+                'markdown': '![{}]({})'.format(filename, url)}
+
+
+class AttachmentMigratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.redmine = FakeStreamingRedmineClient()
+        self.project = FakeUploadProject()
+        self.migrator = AttachmentMigrator(
+            self.redmine, self.project, jobs=2, chunk_size=100)
+
+    def test_duplicates_uploaded_once(self):
+        issues = [
+            {'attachments': [attachment(1, 'screen.png'),
+                             attachment(4, 'log.txt')]},
+            {'attachments': [attachment(2, 'screen.png'),
+                             attachment(3, 'other.png')]},
+            {'attachments': [attachment(1, 'screen.png')]},
+        ]
+        uploads = self.migrator.migrate(issues)
+
+        self.assertEqual(sorted(uploads), [1, 2, 3, 4])
+        self.assertEqual(uploads[1], uploads[2])
+        self.assertNotEqual(uploads[1], uploads[3])
+        self.assertEqual(len(self.project.uploaded), 3)
+        self.assertIn(('log.txt', b'hello'), self.project.uploaded)
+
+    def test_unique_sizes_not_hashed(self):
+        self.migrator.migrate([{'attachments': [attachment(4, 'log.txt')]}])
+        self.assertEqual(len(self.redmine.downloads), 1)
+
+    def test_redmine_digest_used(self):
+        first, second = attachment(1, 'screen.png'), attachment(3, 'other.png')
+        first['digest'] = second['digest'] = 'abc'
+        uploads = self.migrator.migrate([{'attachments': [first, second]}])
+
+        self.assertEqual(uploads[1], uploads[3])
+        self.assertEqual(len(self.redmine.downloads), 1)
+
+    def test_partial_redmine_digests(self):
+        # Same content, but only one digest known to redmine
+        first, second = (attachment(1, 'screen.png'),
+                         attachment(2, 'screen.png'))
+        first['digest'] = 'abc'
+        uploads = self.migrator.migrate([{'attachments': [first, second]}])
+
+        self.assertEqual(uploads[1], uploads[2])
+        self.assertEqual(len(self.project.uploaded), 1)
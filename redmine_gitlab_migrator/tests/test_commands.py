@@ -0,0 +1,221 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from .fake import (
+    REDMINE_ISSUE_1439, REDMINE_ISSUE_1732, FakeRedmineClient,
+    IssuesGitlabClient, RecordingGitlabClient)
+from redmine_gitlab_migrator.commands import (
+    CommandError, _bounded_map, convert_issues_data, create_gitlab_user,
+    issue_includes, migrate_issues, migrate_wiki_page, read_manifest,
+    timeline_stats)
+from redmine_gitlab_migrator.gitlab import GitlabInstance, GitlabProject
+from redmine_gitlab_migrator.redmine import RedmineProject
+
+
+class ManifestTestCase(unittest.TestCase):
+    def write(self, content):
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_read_manifest(self):
+        path = self.write(
+            '# redmine  gitlab\n'
+            'http://redmine/projects/a http://git/g/a\n'
+            '\n'
+            '  http://redmine/projects/b\thttp://git/g/b  # later\n')
+        self.assertEqual(read_manifest(path), [
+            ('http://redmine/projects/a', 'http://git/g/a'),
+            ('http://redmine/projects/b', 'http://git/g/b'),
+        ])
+
+    def test_read_invalid_manifest(self):
+        path = self.write('http://redmine/projects/a\n')
+        with self.assertRaises(CommandError):
+            read_manifest(path)
+
+
+class CreateGitlabUserTestCase(unittest.TestCase):
+    REDMINE_USER = {'id': 5, 'login': 'jdoe', 'firstname': 'John',
+                    'lastname': 'Doe', 'mail': 'jdoe@example.com'}
+
+    def setUp(self):
+        self.client = RecordingGitlabClient()
+        self.instance = GitlabInstance('http://localhost:3000', self.client)
+
+    def test_create_blocked(self):
+        user = create_gitlab_user(
+            self.instance, self.REDMINE_USER, block=True)
+        self.assertEqual(user['username'], 'jdoe')
+        self.assertEqual([i[:2] for i in self.client.requests], [
+            ('POST', 'http://localhost:3000/users'),
+            ('PUT', 'http://localhost:3000/users/101/block'),
+        ])
+
+    def test_failure(self):
+        with mock.patch.object(self.client, 'post',
+                               side_effect=requests.HTTPError('409')):
+            self.assertIsNone(
+                create_gitlab_user(self.instance, self.REDMINE_USER))
+
+
+class MigrateWikiPageTestCase(unittest.TestCase):
+    PATHS = {'Wiki': 'Wiki', 'Install': 'Wiki/Install'}
+
+    def setUp(self):
+        self.redmine_project = mock.Mock()
+        self.redmine_project.get_wiki_page.side_effect = lambda title: {
+            'title': title, 'text': 'h1. {}'.format(title)}
+        self.client = RecordingGitlabClient()
+        self.gitlab_project = GitlabProject(
+            'http://localhost:3000/diaspora/diaspora-project-site',
+            self.client)
+
+    def migrate(self, title, existing=()):
+        return migrate_wiki_page(
+            self.redmine_project, self.gitlab_project, self.PATHS,
+            set(existing), title)
+
+    def test_create(self):
+        self.assertTrue(self.migrate('Install'))
+        method, url, data = self.client.requests[-1]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(data['title'], 'Wiki/Install')
+        self.assertEqual(data['content'], '# Install')
+
+    def test_update_existing(self):
+        self.assertTrue(self.migrate('Install', ['Wiki/Install']))
+        method, url, data = self.client.requests[-1]
+        self.assertEqual(method, 'PUT')
+        self.assertTrue(url.endswith('/wikis/Wiki%2FInstall'))
+
+    def test_failure(self):
+        self.redmine_project.get_wiki_page.side_effect = \
+            requests.HTTPError('404')
+        self.assertFalse(self.migrate('Install'))
+        self.assertEqual(self.client.requests, [])
+
+
+class TimelineStatsTestCase(unittest.TestCase):
+    def test_timeline_stats(self):
+        # One comment (with changes) and one bare change on issue 1732,
+        # folded into a single note per issue
+        self.assertEqual(
+            timeline_stats([REDMINE_ISSUE_1439, REDMINE_ISSUE_1732], 2),
+            {'history': 1, 'timeline_notes': 1})
+
+
+class IssueIncludesTestCase(unittest.TestCase):
+    def includes(self, redmine_includes, attachments):
+        return issue_includes(argparse.Namespace(
+            redmine_includes=redmine_includes, attachments=attachments))
+
+    def test_default(self):
+        self.assertEqual(self.includes(None, False), ['journals', 'relations'])
+        self.assertEqual(self.includes(None, True),
+                         ['journals', 'relations', 'attachments'])
+
+    def test_attachments_always_included(self):
+        self.assertEqual(self.includes(['journals'], True),
+                         ['journals', 'attachments'])
+        self.assertEqual(self.includes(['attachments'], True),
+                         ['attachments'])
+
+
+class ConvertIssuesDataTestCase(unittest.TestCase):
+    def test_processes(self):
+        redmine_project = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site',
+            FakeRedmineClient())
+        gitlab_project = GitlabProject(
+            'http://localhost:3000/diaspora/diaspora-project-site',
+            RecordingGitlabClient())
+        issues = redmine_project.get_all_issues() * 100
+
+        def convert(processes):
+            args = argparse.Namespace(
+                processes=processes, timeline=None, textile=True)
+            return list(convert_issues_data(
+                args, issues, redmine_project.get_users_index(issues),
+                gitlab_project.get_instance().get_users_index(),
+                gitlab_project.get_milestones_index()))
+
+        converted = convert(1)
+        self.assertEqual(len(converted), 200)
+        self.assertEqual(convert(2), converted)
+
+
+class BoundedMapTestCase(unittest.TestCase):
+    def test_lazy(self):
+        consumed = []
+
+        def items():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = _bounded_map(executor, lambda i: i * 2, items(), 3)
+            self.assertEqual(next(results), 0)
+            # The awaited call, and 3 ahead
+            self.assertEqual(consumed, [0, 1, 2, 3])
+            self.assertEqual(list(results), [i * 2 for i in range(1, 10)])
+
+
+class Interrupted(Exception):
+    pass
+
+
+class RetryMigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = IssuesGitlabClient()
+        self.gitlab_project = GitlabProject(
+            'http://localhost:3000/diaspora/diaspora-project-site',
+            self.client)
+
+    def migrate(self, jobs, **kwargs):
+        args = argparse.Namespace(
+            redmine_includes=None, attachments=False, gitlab_users_index=None,
+            jobs=jobs, check=False, timeline=None, processes=1, textile=True)
+        redmine_project = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site',
+            FakeRedmineClient())
+        return migrate_issues(
+            args, redmine_project, self.gitlab_project, [1439, 1732],
+            **kwargs)
+
+    def assertMigrated(self):
+        self.assertEqual(len(self.client.issues), 2)
+        for issue in self.client.issues:
+            self.assertIn('from redmine', issue['description'])
+            self.assertEqual(issue['state'], 'closed')
+        # Redmine #1732 has a note
+        self.assertEqual(sum(len(i) for i in self.client.notes.values()), 1)
+
+    def test_interrupted_between_reserve_and_fill(self):
+        with mock.patch.object(GitlabProject, 'fill_issue',
+                               side_effect=Interrupted):
+            with self.assertRaises(Interrupted):
+                self.migrate(2)
+        # Both issues reserved, none filled
+        self.assertEqual(
+            [i['description'] for i in self.client.issues], ['', ''])
+
+        self.migrate(2, skip_migrated=True)
+        self.assertMigrated()
+
+    def test_interrupted_before_close(self):
+        with mock.patch.object(GitlabProject, 'close_issue',
+                               side_effect=Interrupted):
+            with self.assertRaises(Interrupted):
+                self.migrate(1)
+        self.migrate(1, skip_migrated=True)
+        self.assertMigrated()
@@ -1,8 +1,13 @@
+import time
 import unittest
 
 from .fake import JOHN, JACK, REDMINE_ISSUE_1439, REDMINE_ISSUE_1732
+from redmine_gitlab_migrator.records import IssueRecord
 from redmine_gitlab_migrator.converters import (
-    convert_issue, convert_version, relations_to_string)
+    convert_attachment_links, convert_issue, convert_issues,
+    convert_notes, convert_relations, convert_user, convert_version,
+    convert_wiki_page, format_detail, migrated_issues_index,
+    redmine_id_from_title, relations_to_string, textile_to_markdown, user_table, wiki_page_paths)
 
 
 class ConvertorTestCase(unittest.TestCase):
@@ -74,6 +79,180 @@ class ConvertorTestCase(unittest.TestCase):
             'must_close': False
         })
 
+    def test_issue_records(self):
+        milestone_index = {'v0.11': {'id': 3, 'title': 'v0.11'}}
+        for issue in (REDMINE_ISSUE_1439, REDMINE_ISSUE_1732):
+            for timeline in (None, 'issue'):
+                self.assertEqual(
+                    convert_issue(
+                        IssueRecord(issue, details=bool(timeline)),
+                        self.redmine_user_index,
+                        self.gitlab_users_idx, milestone_index,
+                        timeline=timeline),
+                    convert_issue(
+                        issue, self.redmine_user_index,
+                        self.gitlab_users_idx, milestone_index,
+                        timeline=timeline))
+
+    def test_user_table(self):
+        gitlab_users_idx = {'john_smith': JOHN}
+        self.assertEqual(
+            user_table(self.redmine_user_index, gitlab_users_idx),
+            {83: ('john_smith', 1), 3: ('jack_smith', None)})
+        self.assertEqual(
+            user_table(self.redmine_user_index, gitlab_users_idx, [83, 2]),
+            {83: ('john_smith', 1)})
+
+    def test_convert_issues(self):
+        issues = [REDMINE_ISSUE_1439, REDMINE_ISSUE_1732]
+        milestone_index = {'v0.11': {'id': 3, 'title': 'v0.11'}}
+        self.assertEqual(
+            convert_issues(issues, self.redmine_user_index,
+                           self.gitlab_users_idx, milestone_index),
+            [convert_issue(i, self.redmine_user_index,
+                           self.gitlab_users_idx, milestone_index)
+             for i in issues])
+
+    def test_convert_issues_unknown_users(self):
+        # Only jack is known: john (author, assignee, note author) is not
+        redmine_user_index = {3: self.redmine_user_index[3]}
+        with self.assertLogs('redmine_gitlab_migrator.converters',
+                             'WARNING') as logs:
+            [(data, meta)] = convert_issues(
+                [REDMINE_ISSUE_1732], redmine_user_index,
+                self.gitlab_users_idx, {})
+        self.assertEqual(meta['sudo_user'], 'jack_smith')
+        self.assertEqual(meta['notes'][0][1], {'sudo_user': None})
+        self.assertNotIn('assignee_id', data)
+        # Reported once for the batch
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('2 references to unknown users', logs.output[0])
+
+    def test_convert_issues_throughput(self):
+        # Half of the issues are anonymous
+        anonymous = {'id': 2, 'name': 'Anonymous'}
+        issues = [
+            IssueRecord(dict(i, id=n, author=anonymous) if n % 2 else i)
+            for n, i in enumerate(
+                [REDMINE_ISSUE_1439, REDMINE_ISSUE_1732] * 10000)]
+        redmine_user_index = dict(self.redmine_user_index)
+        redmine_user_index.update(
+            (n, {'id': n, 'login': 'user{}'.format(n)})
+            for n in range(1000, 6000))
+        milestone_index = {'v0.11': {'id': 3, 'title': 'v0.11'}}
+
+        start = time.perf_counter()
+        convert_issues(issues, redmine_user_index, self.gitlab_users_idx,
+                       milestone_index, textile=False)
+        rate = len(issues) / (time.perf_counter() - start)
+
+        print('\nissues conversion: {:.0f} issues/s'.format(rate))
+        self.assertGreater(rate, 1000)
+
+    def journal(self, id, user_id, notes='', details=()):
+        users = {83: 'John Smith', 3: 'Jack Smith'}
+        return {
+            'id': id, 'user': {'id': user_id, 'name': users[user_id]},
+            'notes': notes, 'created_on': '2015-09-0{}T10:00:00Z'.format(id),
+            'details': [
+                {'property': 'attr', 'name': name, 'old_value': old,
+                 'new_value': new} for name, old, new in details]}
+
+    def test_issue_records_details(self):
+        issue = dict(REDMINE_ISSUE_1439, journals=[
+            self.journal(1, 83, details=[('status_id', '1', '2')])])
+        self.assertEqual(IssueRecord(issue)['journals'][0]['details'], ())
+        self.assertEqual(
+            len(IssueRecord(issue, details=True)['journals'][0]['details']),
+            1)
+
+    def test_timeline(self):
+        journals = [
+            self.journal(1, 83, details=[('status_id', '1', '2')]),
+            self.journal(2, 83, details=[('assigned_to_id', None, '3')]),
+            self.journal(3, 3, 'Done', [('status_id', '2', '3')]),
+            self.journal(4, 3, details=[('done_ratio', '50', '100')]),
+        ]
+        field_values = {'status_id': {'1': 'New', '2': 'Assigned'}}
+
+        notes = list(convert_notes(journals, self.redmine_user_index))
+        self.assertEqual(len(notes), 1)
+
+        notes = list(convert_notes(
+            journals, self.redmine_user_index, timeline='issue',
+            field_values=field_values))
+        self.assertEqual(len(notes), 2)
+        self.assertEqual(notes[1], ({'body': (
+            '* 2015-09-01, John Smith: Status changed from New to Assigned\n'
+            '* 2015-09-02, John Smith: Assignee set to jack_smith\n'
+            '* 2015-09-04, Jack Smith: % Done changed from 50 to 100\n\n'
+            '*(from redmine: issue history)*')}, {'sudo_user': None}))
+
+        notes = list(convert_notes(
+            journals, self.redmine_user_index, timeline='author',
+            field_values=field_values))
+        self.assertEqual(
+            [(meta['sudo_user'], data['body'].count('\n* ') + 1)
+             for data, meta in notes],
+            [('john_smith', 2), ('jack_smith', 1), ('jack_smith', 1)])
+        self.assertTrue(notes[1][0]['body'].startswith('Done'))
+
+    def test_format_detail(self):
+        users = {3: ('jack_smith', 2)}
+        cases = [
+            ({'property': 'attr', 'name': 'status_id', 'old_value': '3',
+              'new_value': '5'}, 'Status changed from 3 to Closed'),
+            ({'property': 'attr', 'name': 'assigned_to_id',
+              'old_value': '3', 'new_value': None},
+             'Assignee deleted (jack_smith)'),
+            ({'property': 'attr', 'name': 'description', 'old_value': None,
+              'new_value': None}, 'Description updated'),
+            ({'property': 'attachment', 'name': '12', 'old_value': None,
+              'new_value': 'trace.log'}, 'File set to trace.log'),
+            ({'property': 'relation', 'name': 'blocks', 'old_value': None,
+              'new_value': '1430'}, 'Relation blocks set to #1430'),
+            ({'property': 'cf', 'name': '4', 'old_value': 'a',
+              'new_value': 'b'}, 'Custom field #4 changed from a to b'),
+        ]
+        for detail, expected in cases:
+            self.assertEqual(
+                format_detail(detail, users, {'status_id': {'5': 'Closed'}}),
+                expected)
+
+    def test_issue_attachments(self):
+        redmine_issue = dict(
+            REDMINE_ISSUE_1439,
+            description='See !screen.png!',
+            attachments=[
+                {'id': 7, 'filename': 'screen.png'},
+                {'id': 8, 'filename': 'trace.log'},
+                {'id': 9, 'filename': 'not-migrated.txt'}])
+        uploads = {
+            7: {'markdown': '![screen.png](/uploads/a/screen.png)'},
+            8: {'markdown': '[trace.log](/uploads/b/trace.log)'},
+        }
+        gitlab_issue, meta = convert_issue(
+            redmine_issue, self.redmine_user_index, self.gitlab_users_idx,
+            {'v0.11': {'id': 3, 'title': 'v0.11'}}, uploads)
+        self.assertEqual(
+            gitlab_issue['description'],
+            'See ![screen.png](/uploads/a/screen.png)\n\n'
+            '* [trace.log](/uploads/b/trace.log)\n\n'
+            '*(from redmine: created on 2015-04-03, relates #1430)*')
+
+    def test_convert_attachment_links(self):
+        links = {'a.log': '[a.log](/u/a.log)', 'b c.png': '![b](/u/b.png)'}
+        used = set()
+        self.assertEqual(
+            convert_attachment_links(
+                'see attachment:a.log, attachment:a.logs '
+                'and !>b c.png(title)!', links, used),
+            'see [a.log](/u/a.log), attachment:a.logs and ![b](/u/b.png)')
+        self.assertEqual(used, {'a.log', 'b c.png'})
+        self.assertEqual(
+            convert_attachment_links('attachment:"b c.png"', links),
+            '![b](/u/b.png)')
+
     def test_open_version(self):
         redmine_version = {
             "id": 66,
@@ -123,3 +302,155 @@ class ConvertorTestCase(unittest.TestCase):
         self.assertEqual(
             relations_to_string([simple_oneway, simple_otherway], 2),
             'relates #3, ref #3')
+
+    def test_convert_relations(self):
+        relates = {'issue_id': 2, 'issue_to_id': 3, 'relation_type': 'relates'}
+        blocks = {'issue_id': 3, 'issue_to_id': 4, 'relation_type': 'blocks'}
+        foreign = {
+            'issue_id': 4, 'issue_to_id': 99, 'relation_type': 'relates'}
+        issues = [
+            {'id': 2, 'relations': [relates]},
+            {'id': 3, 'relations': [relates, blocks]},
+            {'id': 4, 'relations': [blocks, foreign]},
+        ]
+        index = {i: {'iid': i + 10} for i in (2, 3, 4)}
+
+        links, unresolved = convert_relations(issues, index)
+        # Each relation is converted once, from its own issue
+        self.assertEqual(links, [
+            (index[2], 'relates_to', index[3]),
+            (index[3], 'blocks', index[4]),
+        ])
+        self.assertEqual(unresolved, [foreign])
+
+        links, _ = convert_relations(issues, index, link_types=False)
+        self.assertEqual({i[1] for i in links}, {'relates_to'})
+
+    def test_redmine_id_from_title(self):
+        self.assertEqual(redmine_id_from_title('-RM-1439-MR-Support SSL'),
+                         1439)
+        self.assertIsNone(redmine_id_from_title('Support SSL'))
+
+    def test_migrated_issues_index(self):
+        issues = [{'iid': 1, 'title': '-RM-1439-MR-Support SSL'},
+                  {'iid': 2, 'title': 'Created in gitlab'}]
+        self.assertEqual(migrated_issues_index(issues), {1439: issues[0]})
+        # After the iid command
+        issues = [{'iid': 1430, 'title': 'Support TLS'},
+                  {'iid': 1439, 'title': 'Support SSL'}]
+        index = migrated_issues_index(issues)
+        self.assertEqual(index, {1430: issues[0], 1439: issues[1]})
+        links, unresolved = convert_relations([REDMINE_ISSUE_1439], index)
+        self.assertEqual(len(links), 1)
+        self.assertEqual(unresolved, [])
+
+    def test_convert_user(self):
+        redmine_user = {'id': 5, 'login': 'jdoe', 'firstname': 'John',
+                        'lastname': 'Doe', 'mail': 'jdoe@example.com'}
+        data = convert_user(redmine_user)
+        self.assertEqual(data['username'], 'jdoe')
+        self.assertEqual(data['name'], 'John Doe')
+        self.assertEqual(data['email'], 'jdoe@example.com')
+        self.assertFalse(data['confirm'])
+        # Nobody knows it, two accounts never share it
+        self.assertNotEqual(
+            data['password'], convert_user(redmine_user)['password'])
+
+    def test_wiki_page_paths(self):
+        paths = wiki_page_paths([
+            {'title': 'Wiki'},
+            {'title': 'Install', 'parent': {'title': 'Wiki'}},
+            {'title': 'Debian', 'parent': {'title': 'Install'}},
+            # Parent deleted
+            {'title': 'Orphan', 'parent': {'title': 'Gone'}},
+        ])
+        self.assertEqual(paths, {
+            'Wiki': 'Wiki',
+            'Install': 'Wiki/Install',
+            'Debian': 'Wiki/Install/Debian',
+            'Orphan': 'Orphan',
+        })
+
+    def test_convert_wiki_page(self):
+        paths = {'Wiki': 'Wiki', 'Install': 'Wiki/Install'}
+        page = {'title': 'Install', 'version': 12, 'text': (
+            'h1. Install\n\nBack to [[wiki|home]], see [[Install#debian]]'
+            ', [[Missing]] and [[other:Wiki]].')}
+        self.assertEqual(convert_wiki_page(page, paths), {
+            'title': 'Wiki/Install',
+            'content': (
+                '# Install\n\nBack to [home](/Wiki), see '
+                '[Install](/Wiki/Install#debian), [[Missing]] and '
+                '[[other:Wiki]].'),
+            'format': 'markdown',
+        })
+
+
+TEXTILE_SAMPLE = """h2. Crash on startup
+
+When starting with *--verbose* the _daemon_ crashes, see @run_app()@ and
+"the logs":http://example.com/logs/my_app_log.txt or !screen.png!.
+
+* first step
+** sub step
+# numbered
+
+bq. quoted text
+
+|_. Version |_. Result |
+| 1.2 | -broken- |
+
+<pre><code class="python">
+# not a list *nor bold*
+</code></pre>
+"""
+
+MARKDOWN_SAMPLE = """## Crash on startup
+
+When starting with **--verbose** the *daemon* crashes, see `run_app()` and
+[the logs](http://example.com/logs/my_app_log.txt) or ![](screen.png).
+
+* first step
+  * sub step
+1. numbered
+
+> quoted text
+
+| Version | Result |
+|---|---|
+| 1.2 | ~~broken~~ |
+
+```python
+# not a list *nor bold*
+```
+"""
+
+
+class TextileTestCase(unittest.TestCase):
+    def test_textile_to_markdown(self):
+        self.assertEqual(textile_to_markdown(TEXTILE_SAMPLE), MARKDOWN_SAMPLE)
+
+    def test_plain_text_untouched(self):
+        text = ('mail john_smith@example.com, see http://x.org/a_b_c_d, '
+                '2*3*4, a - b - c, my_file_name, Hello! World!')
+        self.assertEqual(textile_to_markdown(text), text)
+        self.assertEqual(textile_to_markdown(''), '')
+
+    def test_inline_pre(self):
+        self.assertEqual(
+            textile_to_markdown('see <pre>a = 1</pre> then *run*'),
+            'see \n```\na = 1\n```\n then **run**')
+        self.assertEqual(
+            textile_to_markdown('<pre>a = 1</pre>\n'), '```\na = 1\n```\n')
+
+    def test_throughput(self):
+        texts = [TEXTILE_SAMPLE] * 5000
+        size = sum(len(i.encode()) for i in texts) / 1024 / 1024
+
+        start = time.perf_counter()
+        for i in texts:
+            textile_to_markdown(i)
+        rate = size / (time.perf_counter() - start)
+
+        print('\ntextile conversion: {:.1f} MB/s'.format(rate))
+        self.assertGreater(rate, 0.5)
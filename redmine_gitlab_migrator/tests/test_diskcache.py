@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from redmine_gitlab_migrator.diskcache import DiskCache
+from redmine_gitlab_migrator.redmine import RedmineClient
+
+ISSUE_URL = 'http://redmine/issues/1.json'
+ISSUE = {'issue': {'id': 1, 'subject': 'Support SSL'}}
+
+
+def response(status_code=200, body=None, headers=None):
+    resp = mock.Mock(status_code=status_code, headers=headers or {})
+    resp.content = json.dumps(body).encode()
+    return resp
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'cache.sqlite')
+
+    def test_revalidation(self):
+        client = RedmineClient('key', disk_cache=DiskCache(self.path))
+        with mock.patch('requests.get', return_value=response(
+                body=ISSUE, headers={'ETag': '"abc"'})):
+            self.assertEqual(client.get(ISSUE_URL), ISSUE['issue'])
+
+        # Next run
+        client = RedmineClient('key', disk_cache=DiskCache(self.path))
+        with mock.patch('requests.get',
+                        return_value=response(304)) as get:
+            self.assertEqual(client.get(ISSUE_URL), ISSUE['issue'])
+        self.assertEqual(get.call_args[1]['headers']['If-None-Match'],
+                         '"abc"')
+        self.assertEqual(client.disk_cache.stats()['revalidated'], 1)
+
+    def test_no_validator(self):
+        cache = DiskCache(self.path)
+        cache.store('key', None, None, b'{}')
+        self.assertEqual(cache.validators('key'), {})
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.path, max_bytes=25)
+        for key in ('a', 'b', 'c'):
+            cache.store(key, 'etag', None, b'x' * 10)
+        # Oldest one did not fit
+        self.assertEqual(cache.validators('a'), {})
+        self.assertEqual(cache.validators('b'), {'If-None-Match': 'etag'})
+
+        cache.load('b')
+        cache.store('d', None, 'Mon, 19 Oct 2026 10:00:00 GMT', b'x' * 10)
+        self.assertEqual(cache.validators('c'), {})
+        self.assertNotEqual(cache.validators('b'), {})
+
+        # Size is known again on next run
+        cache = DiskCache(self.path, max_bytes=25)
+        cache.store('e', 'etag', None, b'x' * 10)
+        self.assertEqual(cache.validators('b'), {})
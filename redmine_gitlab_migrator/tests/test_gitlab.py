@@ -1,7 +1,37 @@
 import unittest
+from unittest import mock
 
-from .fake import FakeGitlabClient
-from redmine_gitlab_migrator.gitlab import GitlabInstance, GitlabProject
+import requests
+
+from .fake import FakeGitlabClient, RecordingGitlabClient
+from redmine_gitlab_migrator.gitlab import (
+    GitlabClient, GitlabInstance, GitlabProject, label_color)
+
+
+class GitlabClientTestCase(unittest.TestCase):
+    def test_get_total(self):
+        resp = mock.Mock(headers={'X-Total': '4242'})
+        client = GitlabClient('key')
+        with mock.patch('requests.get', return_value=resp) as get:
+            self.assertEqual(client.get_total('http://x/issues'), 4242)
+        self.assertEqual(get.call_args[1]['params'], {'per_page': 1})
+
+    def test_get_total_without_header(self):
+        resp = mock.Mock(headers={}, content=b'[]')
+        client = GitlabClient('key')
+        with mock.patch('requests.get', return_value=resp):
+            self.assertEqual(client.get_total('http://x/issues'), 0)
+
+    def test_iter_pages(self):
+        pages = [list(range(100)), list(range(100, 142))]
+        client = GitlabClient('key')
+        with mock.patch.object(
+                client, '_get', side_effect=pages) as get:
+            self.assertEqual(
+                [len(i) for i in client.iter_pages('http://x/issues')],
+                [100, 42])
+        self.assertEqual(
+            [i[1]['params']['page'] for i in get.call_args_list], [1, 2])
 
 
 class GitlabinstanceTestCase(unittest.TestCase):
@@ -20,6 +50,28 @@ class GitlabinstanceTestCase(unittest.TestCase):
         self.assertEqual(
             gitlab.check_users_exist([]), True)
 
+    def test_set_users_index(self):
+        gitlab = GitlabInstance('http://localhost:3000', self.client)
+        gitlab.set_users_index({'jdoe': {'id': 7, 'username': 'jdoe'}})
+        self.assertEqual(gitlab.check_users_exist(['jdoe']), True)
+        self.assertEqual(gitlab.check_users_exist(['john_smith']), False)
+
+    def test_create_user(self):
+        client = RecordingGitlabClient()
+        gitlab = GitlabInstance('http://localhost:3000', client)
+        self.assertNotIn('jdoe', gitlab.get_users_index())
+        user = gitlab.create_user({'username': 'jdoe'})
+        gitlab.block_user(user['id'])
+        self.assertEqual(client.requests[-2], (
+            'POST', 'http://localhost:3000/users',
+            {'username': 'jdoe'}))
+        self.assertEqual(client.requests[-1], (
+            'PUT', 'http://localhost:3000/users/101/block', None))
+        # The index is fetched again
+        gitlab.get_users_index()
+        self.assertEqual(client.requests[-1][:2], (
+            'GET', 'http://localhost:3000/users'))
+
 
 class GitlabprojectTestCase(unittest.TestCase):
     def setUp(self):
@@ -41,6 +93,16 @@ class GitlabprojectTestCase(unittest.TestCase):
         self.assertEqual(len(self.project_1.get_issues()), 2)
         self.assertEqual(len(self.project_2.get_issues()), 0)
 
+    def test_count_issues(self):
+        self.assertEqual(self.project_1.count_issues(), 2)
+        self.assertEqual(self.project_2.count_issues(), 0)
+
+    def test_project_metadata_cached(self):
+        self.assertEqual(self.project_1.get_id(), 3)
+        self.project_1.api = None
+        self.assertEqual(self.project_1.get_id(), 3)
+        self.assertEqual(self.project_1.is_repository_empty(), False)
+
     def test_members(self):
         self.assertEqual(
             self.project_1.has_members(['john_smith', 'jack_smith']),
@@ -52,3 +114,173 @@ class GitlabprojectTestCase(unittest.TestCase):
         self.assertEqual(
             self.project_1.has_members([]),
             True)
+
+
+class GitlabprojectWriteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = RecordingGitlabClient()
+        self.project = GitlabProject(
+            'http://localhost:3000/diaspora/diaspora-project-site',
+            self.client)
+
+    def test_create_issue_link(self):
+        self.project.create_issue_link(4, 3, 7, 'blocks')
+        method, url, data = self.client.requests[-1]
+        self.assertEqual(
+            url, 'http://localhost:3000/api/v4/projects/'
+                 'diaspora%2Fdiaspora-project-site/issues/4/links')
+        self.assertEqual(data, {
+            'target_project_id': 3, 'target_issue_iid': 7,
+            'link_type': 'blocks'})
+
+    def test_iter_issues_v4(self):
+        list(self.project.iter_issues(v4=True))
+        self.assertEqual(
+            self.client.requests[-1][1],
+            'http://localhost:3000/api/v4/projects/'
+            'diaspora%2Fdiaspora-project-site/issues')
+
+    def test_wiki_pages(self):
+        self.project.create_wiki_page({'title': 'Wiki/Install'})
+        self.project.update_wiki_page('Wiki/Install', {'content': 'x'})
+        self.assertEqual([i[:2] for i in self.client.requests[-2:]], [
+            ('POST', 'http://localhost:3000/api/v4/projects/'
+                     'diaspora%2Fdiaspora-project-site/wikis'),
+            ('PUT', 'http://localhost:3000/api/v4/projects/'
+                    'diaspora%2Fdiaspora-project-site/wikis/Wiki%2FInstall'),
+        ])
+
+    def test_close_issue_sends_only_state(self):
+        self.project.create_issue(
+            {'title': 'foo', 'description': 'x' * 1000},
+            {'sudo_user': None, 'notes': [], 'must_close': True})
+        method, url, data = self.client.requests[-1]
+        self.assertEqual(method, 'PUT')
+        self.assertTrue(url.endswith('/issues/101'))
+        self.assertEqual(data, {'state_event': 'close'})
+
+    def test_close_milestone_sends_only_state(self):
+        self.project.create_milestone(
+            {'title': 'v1', 'description': 'x' * 1000}, {'must_close': True})
+        method, url, data = self.client.requests[-1]
+        self.assertEqual(method, 'PUT')
+        self.assertTrue(url.endswith('/milestones/101'))
+        self.assertEqual(data, {'state_event': 'close'})
+
+    def test_ensure_labels(self):
+        created = self.project.ensure_labels(['Evolution', 'feature', 'Bug'])
+        self.assertEqual([i['name'] for i in created], ['Bug', 'Evolution'])
+        self.assertEqual(created[0]['color'], label_color('Bug'))
+
+        # Index is kept up to date, no further creation
+        self.assertEqual(self.project.ensure_labels(['Bug', 'feature']), [])
+        self.assertEqual(
+            [i[0] for i in self.client.requests], ['GET', 'POST', 'POST'])
+
+    def test_label_created_meanwhile(self):
+        self.project.get_labels_index()
+        conflict = requests.HTTPError(response=mock.Mock(status_code=409))
+        with mock.patch.object(self.client, 'post', side_effect=conflict):
+            label = self.project.create_label('feature')
+        self.assertEqual(label['name'], 'feature')
+        # Labels fetched again
+        self.assertEqual(
+            [i[0] for i in self.client.requests], ['GET', 'GET'])
+
+        conflict.response.status_code = 500
+        with mock.patch.object(self.client, 'post', side_effect=conflict):
+            with self.assertRaises(requests.HTTPError):
+                self.project.create_label('feature')
+
+    def test_milestones_lookups_fetch_once(self):
+        self.assertEqual(
+            self.project.get_milestone_by_id(13)['title'], 'v0.11')
+        self.assertEqual(self.project.get_milestones_index()['v0.5']['id'], 12)
+        with self.assertRaises(ValueError):
+            self.project.get_milestone_by_id(42)
+        self.assertEqual(len(self.client.requests), 1)
+
+    def test_milestones_index_kept_on_creation(self):
+        self.project.get_milestones_index()
+        self.project.create_milestone({'title': 'v1'}, {'must_close': False})
+        self.assertEqual(self.project.get_milestones_index()['v1']['id'], 101)
+        self.assertEqual(self.project.get_milestone_by_id(101)['title'], 'v1')
+        self.assertEqual(
+            [i[0] for i in self.client.requests], ['GET', 'POST'])
+
+    def test_create_milestones(self):
+        created = self.project.create_milestones([
+            ({'title': 'v1'}, {'must_close': True}),
+            ({'title': 'v2'}, {'must_close': False}),
+            ({'title': 'v3'}, {'must_close': True}),
+        ], jobs=3)
+        self.assertEqual([i['title'] for i in created], ['v1', 'v2', 'v3'])
+        self.assertEqual(
+            [i.get('state') for i in created], ['closed', None, 'closed'])
+        # Closing comes after all creations
+        self.assertEqual(
+            [i[0] for i in self.client.requests],
+            ['GET', 'POST', 'POST', 'POST', 'PUT', 'PUT'])
+        index = self.project.get_milestones_index()
+        self.assertEqual(
+            sorted(index), ['v0.11', 'v0.5', 'v1', 'v2', 'v3'])
+        self.assertEqual(len(self.client.requests), 6)
+
+    def test_members_fetched_once(self):
+        self.project.has_members(['john_smith'])
+        self.project.has_members(['jack_smith', 'babar'])
+        self.assertEqual(len(self.client.requests), 1)
+
+        self.project.invalidate_cache()
+        self.project.has_members(['john_smith'])
+        self.assertEqual(len(self.client.requests), 2)
+
+    def test_label_color_is_deterministic(self):
+        self.assertEqual(label_color('Bug'), label_color('Bug'))
+        self.assertNotEqual(label_color('Bug'), label_color('Feature'))
+        self.assertRegex(label_color('Bug'), r'^#[0-9a-f]{6}$')
+
+    def test_upload_file_streams_multipart(self):
+        self.project.upload_file(
+            'screen.png', iter([b'abc', b'def']), 'image/png')
+        method, url, body = self.client.requests[-1]
+        self.assertTrue(url.endswith('/uploads'))
+        body = b''.join(body)
+        self.assertIn(b'filename="screen.png"', body)
+        self.assertIn(b'Content-Type: image/png\r\n\r\nabcdef\r\n--', body)
+
+    def test_upload_file_name_escaped(self):
+        self.project.upload_file('a"b\nc\rd.png', iter([b'abc']))
+        body = b''.join(self.client.requests[-1][2])
+        self.assertIn(b'filename="a%22b%0Ac%0Dd.png"\r\n', body)
+
+    def test_open_issue_is_not_updated(self):
+        self.project.create_issue(
+            {'title': 'foo'},
+            {'sudo_user': None, 'notes': [], 'must_close': False})
+        self.assertEqual(
+            [i[0] for i in self.client.requests], ['POST'])
+
+    def test_reserve_then_fill_issue(self):
+        data = {'title': 'foo', 'description': 'bar', 'labels': ['Bug']}
+        meta = {'sudo_user': 'john_smith', 'must_close': True,
+                'notes': [({'body': 'hello'}, {'sudo_user': None})]}
+
+        placeholder = self.project.reserve_issue(data, meta)
+        self.assertEqual(self.client.requests[-1][2], {'title': 'foo'})
+
+        self.project.fill_issue(placeholder, data, meta)
+        # Notes come before closing, as on issue creation
+        self.assertEqual(
+            [(i[0], i[2]) for i in self.client.requests[1:]],
+            [('PUT', {'description': 'bar', 'labels': ['Bug']}),
+             ('POST', {'body': 'hello'}),
+             ('PUT', {'state_event': 'close'})])
+
+    def test_fill_issue_without_notes(self):
+        data = {'title': 'foo', 'description': 'bar'}
+        meta = {'sudo_user': 'john_smith', 'must_close': True, 'notes': []}
+        self.project.fill_issue({'id': 101}, data, meta)
+        self.assertEqual(
+            [(i[0], i[2]) for i in self.client.requests],
+            [('PUT', {'description': 'bar', 'state_event': 'close'})])
@@ -0,0 +1,94 @@
+import itertools
+import threading
+import time
+import unittest
+from unittest import mock
+
+from redmine_gitlab_migrator.hedging import Hedger
+from redmine_gitlab_migrator.redmine import RedmineClient
+
+
+class HedgerTestCase(unittest.TestCase):
+    def warm_up(self, hedger, latency=0.001):
+        for _ in range(hedger.min_samples):
+            hedger.run(lambda: time.sleep(latency))
+
+    def test_no_hedging_before_enough_samples(self):
+        hedger = Hedger(min_samples=5)
+        self.assertIsNone(hedger.delay())
+        self.warm_up(hedger)
+        self.assertLess(hedger.delay(), 0.5)
+        self.assertEqual(hedger.stats(),
+                         {'requests': 5, 'hedged': 0, 'hedge_wins': 0})
+
+    def test_hedge_wins(self):
+        hedger = Hedger(min_samples=5)
+        self.warm_up(hedger)
+
+        calls = itertools.count()
+        released = threading.Event()
+        self.addCleanup(released.set)
+
+        def request():
+            if next(calls) == 0:
+                # Stuck until the end of the test
+                released.wait()
+                return 'slow'
+            return 'fast'
+
+        self.assertEqual(hedger.run(request), 'fast')
+        self.assertEqual(hedger.stats()['hedged'], 1)
+        self.assertEqual(hedger.stats()['hedge_wins'], 1)
+
+    def test_failed_attempt(self):
+        hedger = Hedger(min_samples=5)
+        self.warm_up(hedger)
+
+        calls = itertools.count()
+
+        def request():
+            if next(calls) == 0:
+                time.sleep(0.1)
+                raise IOError('boom')
+            time.sleep(0.2)
+            return 'ok'
+
+        # The duplicate succeeds, after the failed primary
+        self.assertEqual(hedger.run(request), 'ok')
+
+
+    def test_latencies_per_endpoint(self):
+        hedger = Hedger(min_samples=5)
+        for _ in range(5):
+            hedger.run(lambda: time.sleep(0.001), 'fast')
+        self.assertLess(hedger.delay('fast'), 0.5)
+        self.assertIsNone(hedger.delay('slow'))
+        self.assertIsNone(hedger.delay())
+
+    def test_queue_time_not_hedged(self):
+        hedger = Hedger(min_samples=5, max_workers=1)
+        self.warm_up(hedger)
+        # The only worker is busy for a while
+        hedger._executor.submit(time.sleep, 0.1)
+        self.assertEqual(hedger.run(lambda: 'ok'), 'ok')
+        self.assertEqual(hedger.stats()['hedged'], 0)
+
+    def test_client_endpoints(self):
+        client = RedmineClient('key')
+        self.assertEqual(
+            client.endpoint('http://redmine/projects/a/issues.json'),
+            client.endpoint('http://redmine/issues.json?offset=100'))
+        self.assertNotEqual(
+            client.endpoint('http://redmine/issues/3.json'),
+            client.endpoint('http://redmine/issues.json'))
+
+
+class TimeoutTestCase(unittest.TestCase):
+    def test_per_endpoint_timeouts(self):
+        resp = mock.Mock(status_code=200, content=b'{"a": 1, "b": 2}')
+        client = RedmineClient('key')
+        with mock.patch('requests.get', return_value=resp) as get:
+            client.get('http://redmine/users/3.json')
+            self.assertEqual(get.call_args[1]['timeout'], (10, 60))
+            client.get('http://redmine/projects/a/issues.json')
+            self.assertEqual(get.call_args[1]['timeout'], (10, 120))
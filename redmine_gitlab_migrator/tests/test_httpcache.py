@@ -0,0 +1,134 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from redmine_gitlab_migrator.gitlab import GitlabClient
+from redmine_gitlab_migrator.httpcache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.use_cache([(r'/users$', 10)])
+        self.fetched = []
+
+    def use_cache(self, ttls):
+        self.cache = ResponseCache(ttls, max_entries=2, clock=self.clock)
+
+    def get(self, url, **kwargs):
+        return self.cache.get(
+            url, kwargs, lambda: self.fetched.append(url) or url)
+
+    def test_ttl(self):
+        for _ in range(3):
+            self.get('http://x/users')
+        self.get('http://x/issues')
+        self.get('http://x/issues')
+        self.assertEqual(self.fetched, ['http://x/users'] + [
+            'http://x/issues'] * 2)
+        self.assertEqual(self.cache.stats(),
+                         {'hits': 2, 'misses': 3, 'coalesced': 0})
+
+        self.clock.now = 11
+        self.get('http://x/users')
+        self.assertEqual(len(self.fetched), 4)
+
+    def test_parameters_are_part_of_key(self):
+        self.get('http://x/users', params={'page': 1})
+        self.get('http://x/users', params={'page': 2})
+        self.get('http://x/users', params={'page': 1})
+        self.assertEqual(len(self.fetched), 2)
+
+    def test_lru(self):
+        self.use_cache([(r'/\d$', 10)])
+        for i in ('1', '2', '1', '3', '1', '2'):
+            self.get('http://x/' + i)
+        # "2" was the least recently used one when "3" came
+        self.assertEqual([i[-1] for i in self.fetched], ['1', '2', '3', '2'])
+
+    def test_invalidate(self):
+        self.use_cache([(r'milestones', 10)])
+        self.get('http://x/milestones')
+        self.get('http://x/milestones/12')
+        self.cache.invalidate('http://x/milestones/12')
+        self.get('http://x/milestones')
+        self.get('http://x/milestones/12')
+        self.assertEqual(len(self.fetched), 4)
+
+    def test_invalidate_in_flight(self):
+        self.use_cache([(r'/(users|labels)$', 10)])
+        calls = []
+
+        def fetch(url):
+            calls.append(url)
+            # Writes happen while the requests are in flight
+            self.cache.invalidate('http://x/labels')
+            return url
+
+        for url in ('http://x/users', 'http://x/labels'):
+            for _ in range(2):
+                self.cache.get(url, {}, lambda: fetch(url))
+        # Only the labels response is not kept
+        self.assertEqual(calls, [
+            'http://x/users', 'http://x/labels', 'http://x/labels'])
+
+    def test_coalescing(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 'response'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.get('http://x/issues', {}, fetch)))
+            for _ in range(5)]
+        threads[0].start()
+        started.wait()
+        for i in threads[1:]:
+            i.start()
+        while self.cache.coalesced < 4:
+            time.sleep(0.001)
+        release.set()
+        for i in threads:
+            i.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['response'] * 5)
+        self.assertEqual(self.cache.stats()['coalesced'], 4)
+
+    def test_errors_are_not_cached(self):
+        def fail():
+            raise IOError('boom')
+
+        with self.assertRaises(IOError):
+            self.cache.get('http://x/users', {}, fail)
+        self.assertEqual(self.get('http://x/users'), 'http://x/users')
+
+
+class ClientCacheTestCase(unittest.TestCase):
+    def test_writes_invalidate(self):
+        resp = mock.Mock(content=b'[]')
+        client = GitlabClient('key')
+        url = 'http://x/api/v3/projects/a%2Fb/milestones'
+        with mock.patch('requests.get', return_value=resp) as get, \
+                mock.patch('requests.post', return_value=resp):
+            client.get(url)
+            client.get(url)
+            self.assertEqual(get.call_count, 1)
+            client.post(url, data={'title': 'v1'})
+            client.get(url)
+            self.assertEqual(get.call_count, 2)
@@ -0,0 +1,52 @@
+import io
+import unittest
+from unittest import mock
+
+from redmine_gitlab_migrator import jsonbackend
+from redmine_gitlab_migrator.redmine import RedmineClient
+
+DOCUMENT = b'{"issues": [{"id": 1, "done": 0.5}, {"id": 2}], "total_count": 2}'
+
+
+class JSONBackendTestCase(unittest.TestCase):
+    def test_loads(self):
+        self.assertEqual(jsonbackend.loads(b'{"a": [1]}'), {'a': [1]})
+
+    def test_iter_items(self):
+        items = list(jsonbackend.iter_items(io.BytesIO(DOCUMENT), 'issues'))
+        self.assertEqual(items, [{'id': 1, 'done': 0.5}, {'id': 2}])
+        self.assertIsInstance(items[0]['done'], float)
+
+    def test_iter_items_without_ijson(self):
+        with mock.patch.object(jsonbackend, 'ijson', None):
+            self.assertEqual(
+                len(list(jsonbackend.iter_items(
+                    io.BytesIO(DOCUMENT), 'issues'))), 2)
+
+
+class StreamedPaginationTestCase(unittest.TestCase):
+    def test_unpaginated_get(self):
+        pages = {0: range(100), 100: range(100, 130)}
+        client = RedmineClient('key', stream_lists=True)
+        with mock.patch.object(
+                client, 'stream_list',
+                side_effect=lambda url, key, params: iter(
+                    pages[params['offset']])) as stream_list:
+            items = list(client.unpaginated_get(
+                'http://redmine/projects/a/issues.json?status_id=*'))
+        self.assertEqual(items, list(range(130)))
+        self.assertEqual(
+            [(i[0][1], i[1]['params']['offset'])
+             for i in stream_list.call_args_list],
+            [('issues', 0), ('issues', 100)])
+
+    def test_unpaginated_list_of_page_size(self):
+        # Versions lists ignore pagination parameters
+        versions = [{'id': i} for i in range(100)]
+        client = RedmineClient('key', stream_lists=True)
+        with mock.patch.object(
+                client, 'stream_list',
+                side_effect=lambda url, key, params: iter(versions)):
+            items = list(client.unpaginated_get(
+                'http://redmine/projects/a/versions.json'))
+        self.assertEqual(items, versions)
@@ -0,0 +1,143 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+from .fake import FakeRedmineClient, RecordingGitlabClient
+from redmine_gitlab_migrator.commands import build_plan
+from redmine_gitlab_migrator.gitlab import GitlabProject
+from redmine_gitlab_migrator.plan import (
+    Plan, PlanError, PlanExecutor, ref, resolve)
+from redmine_gitlab_migrator.redmine import RedmineProject
+
+GITLAB_URL = 'http://localhost:3000/diaspora/diaspora-project-site'
+
+
+class FailingGitlabClient(RecordingGitlabClient):
+    def __init__(self, fail_on):
+        super().__init__()
+        self.fail_on = fail_on
+
+    def put(self, url, data=None, headers=None):
+        if url.endswith(self.fail_on):
+            raise IOError('boom')
+        return super().put(url, data, headers)
+
+
+def sample_plan():
+    plan = Plan(GITLAB_URL)
+    plan.add('milestone-1', 'milestone', 'POST', ['milestones'],
+             {'title': 'v1'})
+    plan.add('issue-1', 'issue', 'POST', ['issues'], {'title': 'a'})
+    plan.add('issue-1-fill', 'issue_fill', 'PUT', ['issues', ref('issue-1')],
+             {'milestone_id': ref('milestone-1')})
+    plan.add('issue-2', 'issue', 'POST', ['issues'], {'title': 'b'},
+             depends_on=['issue-1'])
+    return plan
+
+
+class PlanTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.state_path = self.path + '.state'
+        self.addCleanup(
+            lambda: os.path.exists(self.state_path) and
+            os.remove(self.state_path))
+
+    def test_references_are_dependencies(self):
+        plan = sample_plan()
+        self.assertEqual(plan.operations[2]['depends_on'],
+                         ['issue-1', 'milestone-1'])
+        with self.assertRaises(PlanError):
+            plan.add('note', 'note', 'POST', ['issues', ref('issue-3')])
+        with self.assertRaises(PlanError):
+            plan.add('issue-1', 'issue', 'POST', ['issues'])
+
+    def test_resolve(self):
+        self.assertEqual(
+            resolve({'a': [ref('x', 'iid')], 'b': 1}, {'x': {'iid': 4}}),
+            {'a': [4], 'b': 1})
+
+    def test_dump_load(self):
+        plan = sample_plan()
+        plan.dump(self.path)
+        loaded = Plan.load(self.path)
+        self.assertEqual(loaded.gitlab_project_url, GITLAB_URL)
+        self.assertEqual(loaded.operations, plan.operations)
+        self.assertEqual(loaded.stats()['requests_by_kind'],
+                         {'milestone': 1, 'issue': 2, 'issue_fill': 1})
+
+    def test_execute(self):
+        client = RecordingGitlabClient()
+        executor = PlanExecutor(
+            sample_plan(), GitlabProject(GITLAB_URL, client), jobs=4)
+        self.assertEqual(executor.run(), 4)
+
+        # POST responses ids are attributed in requests order, from 101
+        posts = [(url.rsplit('/', 1)[1], data) for method, url, data
+                 in client.requests if method == 'POST']
+        ids = {data['title']: 101 + n for n, (_, data) in enumerate(posts)}
+        # Issues are created in plan order
+        self.assertEqual(
+            [data['title'] for kind, data in posts if kind == 'issues'],
+            ['a', 'b'])
+        method, url, data = next(
+            i for i in client.requests if i[0] == 'PUT')
+        self.assertTrue(url.endswith('/issues/{}'.format(ids['a'])))
+        self.assertEqual(data, {'milestone_id': ids['v1']})
+
+    def test_resume_after_failure(self):
+        plan = sample_plan()
+        client = FailingGitlabClient(fail_on='/issues/102')
+        executor = PlanExecutor(
+            plan, GitlabProject(GITLAB_URL, client),
+            state_path=self.state_path)
+        with self.assertRaises(PlanError):
+            executor.run()
+        self.assertEqual(set(executor.load_state()),
+                         {'milestone-1', 'issue-1'})
+
+        client = RecordingGitlabClient()
+        executor = PlanExecutor(
+            plan, GitlabProject(GITLAB_URL, client),
+            state_path=self.state_path)
+        self.assertEqual(executor.run(), 2)
+        method, url, data = client.requests[0]
+        self.assertTrue(url.endswith('/issues/102'))
+        self.assertEqual(data, {'milestone_id': 101})
+        self.assertEqual(client.requests[1][2], {'title': 'b'})
+
+
+class BuildPlanTestCase(unittest.TestCase):
+    def test_build_plan(self):
+        client = RecordingGitlabClient()
+        plan = build_plan(
+            argparse.Namespace(processes=1, timeline=None, textile=True),
+            RedmineProject('http://localhost:9000/projects/diaspora-site',
+                           FakeRedmineClient()),
+            GitlabProject(GITLAB_URL, client))
+
+        # Planning only reads gitlab
+        self.assertEqual({i[0] for i in client.requests}, {'GET'})
+        kinds = plan.stats()['requests_by_kind']
+        # Milestones already exist, "Evolution" label does not
+        self.assertNotIn('milestone', kinds)
+        self.assertEqual(kinds['label'], 1)
+        self.assertEqual(kinds['issue'], 2)
+        self.assertEqual(kinds['note'], 1)
+
+        issues = [i for i in plan.operations if i['kind'] == 'issue']
+        self.assertEqual([i['id'] for i in issues],
+                         ['issue-1439', 'issue-1732'])
+        self.assertEqual(issues[1]['depends_on'], ['issue-1439'])
+        fill = next(i for i in plan.operations if i['id'] == 'issue-1732-fill')
+        self.assertNotIn('state_event', fill['data'])
+        self.assertIn('label-Evolution', fill['depends_on'])
+        # Closed once its note is posted
+        close = next(
+            i for i in plan.operations if i['id'] == 'issue-1732-close')
+        self.assertEqual(close['data'], {'state_event': 'close'})
+        self.assertLessEqual({'issue-1732-note-0', 'issue-1732-fill'},
+                             set(close['depends_on']))
@@ -1,7 +1,9 @@
 import unittest
+from unittest import mock
 
 from .fake import FakeRedmineClient
-from redmine_gitlab_migrator.redmine import RedmineProject
+from redmine_gitlab_migrator.records import IssueRecord
+from redmine_gitlab_migrator.redmine import RedmineClient, RedmineProject
 
 
 class RedmineTestCase(unittest.TestCase):
@@ -17,6 +19,89 @@ class RedmineTestCase(unittest.TestCase):
         self.assertEqual(len(issues[0].get('journals', [])), 2)
         self.assertEqual(len(issues[1].get('journals', [])), 0)
 
+    def test_issues_are_compact_records(self):
+        project = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site',
+            self.client)
+        issues = project.get_all_issues()
+        self.assertIsInstance(issues[0], IssueRecord)
+        self.assertFalse(hasattr(issues[0], '__dict__'))
+        self.assertEqual(issues[0]['tracker']['name'], 'Evolution')
+        # Repeated values are shared
+        self.assertIs(issues[0]['tracker'], issues[1]['tracker'])
+        self.assertIs(issues[0]['journals'][0]['user'],
+                      issues[0]['assigned_to'])
+        with self.assertRaises(KeyError):
+            issues[0]['custom_fields']
+
+    def test_issue_includes(self):
+        requested = []
+
+        class RecordingClient(FakeRedmineClient):
+            def get(self, url):
+                requested.append(url)
+                return super().get(url)
+
+        project = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site',
+            RecordingClient())
+        project.get_all_issues()
+        # relations come with the issues list
+        self.assertTrue(
+            requested[0].endswith('/issues/1732.json?include=journals'))
+
+        # fetched once per set of includes
+        project.get_all_issues()
+        self.assertEqual(len(requested), 2)
+        project.issue_includes = ['journals', 'watchers', 'attachments']
+        project.get_all_issues()
+        self.assertEqual(len(requested), 4)
+        self.assertTrue(requested[-1].endswith('include=journals,watchers'))
+
+    def test_untouched_issues_details_skipped(self):
+        requested = []
+        untouched = {
+            "id": 1800, "subject": "Untouched", "description": "",
+            "created_on": "2015-10-01T10:00:00Z",
+            "updated_on": "2015-10-01T10:00:00Z",
+            "tracker": {"name": "Bug", "id": 1},
+            "author": {"name": "John Smith", "id": 83},
+            "relations": [{"issue_id": 1800, "issue_to_id": 1439,
+                           "relation_type": "relates"}],
+        }
+
+        class Client(FakeRedmineClient):
+            def unpaginated_get(self, url):
+                requested.append(url)
+                return super().unpaginated_get(url) + [dict(untouched)]
+
+            def get(self, url):
+                requested.append(url)
+                return super().get(url)
+
+        project = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site', Client())
+        issues = project.get_all_issues()
+
+        self.assertTrue(requested[0].endswith('&include=relations'))
+        self.assertEqual(len(requested), 3)
+        self.assertEqual(issues[2]['journals'], ())
+        self.assertEqual(issues[2]['relations'][0]['issue_to_id'], 1439)
+        self.assertEqual(issues[0]['subject'], 'Update doc for v1')
+
+    def test_get_issues_by_ids(self):
+        requested = []
+
+        class Client(FakeRedmineClient):
+            def unpaginated_get(self, url):
+                requested.append(url)
+                return super().unpaginated_get(url)
+
+        project = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site', Client())
+        self.assertEqual(len(project.get_issues([1732, 1439])), 2)
+        self.assertTrue(requested[0].endswith('&issue_id=1732,1439'))
+
     def test_get_participants(self):
         project_1 = RedmineProject(
             'http://localhost:9000/projects/diaspora-site',
@@ -30,12 +115,43 @@ class RedmineTestCase(unittest.TestCase):
         self.assertIn('@', project_1.get_participants()[0]['mail'])
         self.assertEqual(len(project_2.get_participants()), 0)
 
+    def test_users_shared_among_projects(self):
+        requested = []
+
+        class Client(FakeRedmineClient):
+            def get(self, url):
+                requested.append(url)
+                return super().get(url)
+
+        client = Client()
+        project_1 = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site', client)
+        project_2 = RedmineProject(
+            'http://localhost:9000/projects/diaspora-site', client)
+        project_2.instance = project_1.get_instance()
+
+        project_1.get_participants()
+        project_2.get_participants()
+        self.assertEqual(
+            len([i for i in requested if '/users/' in i]), 2)
+
     def test_get_versions(self):
         project = RedmineProject(
             'http://localhost:9000/projects/diaspora-site',
             self.client)
         self.assertEqual(len(project.get_versions()), 2)
 
+    def test_unpaginated_list(self):
+        # Versions lists ignore pagination parameters
+        client = RedmineClient('key')
+        resp = {'versions': [{'id': i} for i in range(150)],
+                'total_count': 150}
+        with mock.patch.object(client, '_get', return_value=resp) as get:
+            self.assertEqual(
+                len(list(client.unpaginated_get('http://x/versions.json'))),
+                150)
+        self.assertEqual(get.call_count, 1)
+
     def test_category_url_canonicalized(self):
         project = RedmineProject(
             'http://localhost:9000/project/diaspora/diaspora-site',
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+import unittest
+
+from redmine_gitlab_migrator.shards import LeaseKeeper, LeaseLost, ShardQueue
+
+
+class ShardQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.queue = ShardQueue(self.path, lease_duration=60)
+        self.queue.create(range(1, 11), shard_size=4)
+
+    def test_create(self):
+        self.assertEqual(self.queue.progress(), {
+            'pending': 3, 'leased': 0, 'done': 0, 'failed': 0})
+        with self.assertRaises(ValueError):
+            self.queue.create([1], shard_size=4)
+
+    def test_claim_complete(self):
+        self.assertEqual(self.queue.claim('w1'), (1, [1, 2, 3, 4]))
+        self.assertEqual(self.queue.claim('w2'), (2, [5, 6, 7, 8]))
+        # Only the owner can complete
+        self.assertFalse(self.queue.complete(1, 'w2', {}))
+        self.assertTrue(
+            self.queue.complete(1, 'w1', {'issues': 4, 'notes': 1}))
+
+        self.assertEqual(self.queue.progress(), {
+            'pending': 1, 'leased': 1, 'done': 1, 'failed': 0})
+        self.assertEqual(
+            self.queue.reports(), [(1, 'done', {'issues': 4, 'notes': 1})])
+
+    def test_queue_shared_between_instances(self):
+        other = ShardQueue(self.path)
+        self.queue.claim('w1')
+        self.assertEqual(other.claim('w2')[0], 2)
+
+    def test_fail(self):
+        queue = ShardQueue(self.path, max_attempts=2)
+        shard_id, _ = queue.claim('w1')
+        queue.fail(shard_id, 'w1', 'boom')
+        self.assertEqual(queue.claim('w2')[0], shard_id)
+        queue.fail(shard_id, 'w2', 'boom again')
+
+        self.assertEqual(queue.progress()['failed'], 1)
+        self.assertEqual(
+            queue.reports(), [(shard_id, 'failed', {'error': 'boom again'})])
+
+    def test_expired_leases_redispatched(self):
+        queue = ShardQueue(self.path, lease_duration=-1)
+        shard_id, _ = queue.claim('dead-worker')
+        self.assertEqual(self.queue.expire_leases(), [shard_id])
+        self.assertEqual(self.queue.claim('w2')[0], shard_id)
+        # The dead worker cannot complete it anymore
+        self.assertFalse(queue.complete(shard_id, 'dead-worker', {}))
+        self.assertEqual(self.queue.expire_leases(), [])
+
+    def test_lease_keeper(self):
+        queue = ShardQueue(self.path, lease_duration=0.3)
+        shard_id, _ = queue.claim('w1')
+        with LeaseKeeper(queue, shard_id, 'w1'):
+            time.sleep(0.5)
+            self.assertEqual(queue.expire_leases(), [])
+        self.assertTrue(queue.complete(shard_id, 'w1', {}))
+
+    def test_lease_keeper_lost(self):
+        queue = ShardQueue(self.path, lease_duration=-1)
+        shard_id, _ = queue.claim('w1')
+        self.assertEqual(queue.attempts(shard_id), 1)
+        with LeaseKeeper(queue, shard_id, 'w1') as lease:
+            lease.check()
+            queue.expire_leases()
+            self.assertEqual(queue.claim('w2')[0], shard_id)
+            self.assertEqual(queue.attempts(shard_id), 2)
+            with self.assertRaises(LeaseLost):
+                lease.check()
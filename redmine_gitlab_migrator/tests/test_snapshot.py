@@ -0,0 +1,74 @@
+import copy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from .fake import FakeGitlabClient, FakeRedmineClient
+from redmine_gitlab_migrator.gitlab import GitlabProject
+from redmine_gitlab_migrator.redmine import RedmineProject
+from redmine_gitlab_migrator.snapshot import (
+    GITLAB_LIMITS, SnapshotValidator, dump_snapshot, load_snapshot,
+    take_snapshot)
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.snapshot = take_snapshot(
+            RedmineProject('http://localhost:9000/projects/diaspora-site',
+                           FakeRedmineClient()),
+            GitlabProject(
+                'http://localhost:3000/diaspora/diaspora-project-site',
+                FakeGitlabClient()))
+
+    def test_dump_load(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name in ('snapshot.json', 'snapshot.json.gz'):
+            path = os.path.join(tmpdir, name)
+            dump_snapshot(self.snapshot, path)
+            self.assertEqual(load_snapshot(path), self.snapshot)
+
+    def test_valid_snapshot(self):
+        validator = SnapshotValidator(self.snapshot)
+        self.assertEqual(validator.validate(), [])
+        self.assertEqual(validator.labels_to_create(), ['Evolution'])
+
+    def test_missing_gitlab_user(self):
+        self.snapshot['gitlab']['users'] = [
+            i for i in self.snapshot['gitlab']['users']
+            if i['username'] != 'john_smith']
+        problems = SnapshotValidator(self.snapshot).check_users()
+        self.assertEqual(problems, [
+            'Missing gitlab user john_smith, used by 2 issue(s), ex: #1732'])
+
+    def test_unknown_version(self):
+        self.snapshot['gitlab']['milestones'] = []
+        validator = SnapshotValidator(self.snapshot)
+        # Still in redmine roadmap
+        self.assertEqual(validator.check_milestones(), [])
+
+        self.snapshot['redmine']['versions'] = []
+        problems = SnapshotValidator(self.snapshot).check_milestones()
+        self.assertEqual(problems, [
+            'Unknown version v0.11, used by 1 issue(s), ex: #1439'])
+
+    def test_payload_too_big(self):
+        issue = self.snapshot['redmine']['issues'][0]
+        issue['description'] = 'x' * GITLAB_LIMITS['description']
+        problems = SnapshotValidator(self.snapshot).check_payloads()
+        self.assertEqual(len(problems), 1)
+        self.assertIn('description is too long', problems[0])
+
+    def test_throughput(self):
+        issues = self.snapshot['redmine']['issues']
+        snapshot = copy.deepcopy(self.snapshot)
+        snapshot['redmine']['issues'] = [
+            dict(issues[n % len(issues)], id=n) for n in range(10000)]
+
+        start = time.perf_counter()
+        self.assertEqual(SnapshotValidator(snapshot).validate(), [])
+        elapsed = time.perf_counter() - start
+        print('\nSnapshot validation: {:.0f} issues/s'.format(
+            10000 / elapsed))
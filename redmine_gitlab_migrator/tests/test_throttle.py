@@ -0,0 +1,27 @@
+import time
+import unittest
+
+from redmine_gitlab_migrator.throttle import RateLimiter
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        start = time.monotonic()
+        for i in range(1000):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_rate(self):
+        limiter = RateLimiter(100, burst=1)
+        start = time.monotonic()
+        for i in range(11):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_amount_bigger_than_burst(self):
+        limiter = RateLimiter(1000)
+        start = time.monotonic()
+        limiter.acquire(1050)
+        limiter.acquire(50)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
@@ -0,0 +1,128 @@
+import unittest
+from unittest import mock
+
+from .fake import FakeGitlabClient, FakeRedmineClient
+from redmine_gitlab_migrator.converters import (
+    convert_issue, redmine_id_from_title, strip_redmine_id)
+from redmine_gitlab_migrator.records import AttachmentRecord
+from redmine_gitlab_migrator.gitlab import GitlabProject
+from redmine_gitlab_migrator.redmine import RedmineProject
+from redmine_gitlab_migrator.verify import ParityVerifier, normalize
+
+GITLAB_URL = 'http://localhost:3000/diaspora/diaspora-project-site'
+REDMINE_URL = 'http://localhost:9000/projects/diaspora-site'
+
+
+class MigratedGitlabClient(FakeGitlabClient):
+    """ Serves the issues of the diaspora project, as migrated
+    """
+    def __init__(self, issues, notes):
+        self.issues = issues
+        self.notes = notes
+
+    def iter_pages(self, url):
+        if url.endswith('/issues'):
+            yield self.issues
+        elif url.endswith('/notes'):
+            issue_id = int(url.rsplit('/', 2)[1])
+            yield self.notes.get(issue_id, [])
+        else:
+            yield from super().iter_pages(url)
+
+
+class VerifyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.issues = [
+            {'id': 1, 'title': '-RM-1439-MR-Support SSL', 'state': 'closed',
+             'description': 'Support SSL\r\n',
+             'assignee': None},
+            {'id': 2, 'title': '-RM-1732-MR-Update doc for v1',
+             'state': 'closed',
+             'description': 'Update doc for v1',
+             'assignee': {'id': 1, 'username': 'john_smith'}},
+            {'id': 3, 'title': 'Created in gitlab', 'state': 'opened',
+             'description': '', 'assignee': None},
+        ]
+        self.notes = {2: [{'body': 'Dont forget the cats!'},
+                          {'body': 'closed', 'system': True}]}
+
+        # Take descriptions and notes from the actual conversion
+        verifier = self.verifier()
+        project = verifier.redmine_project
+        project.issue_includes = ('journals', 'relations')
+        gitlab_project = verifier.gitlab_project
+        for issue in project.get_all_issues():
+            data, meta = convert_issue(
+                issue, project.get_users_index(),
+                gitlab_project.get_instance().get_users_index(),
+                gitlab_project.get_milestones_index())
+            migrated = next(
+                i for i in self.issues if i['title'] == data['title'])
+            migrated['description'] = data['description'] + '  \r\n'
+            if meta['notes']:
+                self.notes[migrated['id']][0]['body'] = \
+                    meta['notes'][0][0]['body']
+
+    def verifier(self, **kwargs):
+        return ParityVerifier(
+            RedmineProject(REDMINE_URL, FakeRedmineClient()),
+            GitlabProject(GITLAB_URL,
+                          MigratedGitlabClient(self.issues, self.notes)),
+            **kwargs)
+
+    def test_normalize(self):
+        self.assertEqual(normalize('a  \r\nb\n\n'), 'a\nb')
+        self.assertEqual(
+            normalize('see ![a](/uploads/0123abcd/a.png)'),
+            normalize('see [upload](/uploads/)'))
+
+    def test_identical(self):
+        report = self.verifier().run()
+        self.assertEqual(report, {
+            'checked': 2, 'missing': [], 'unexpected': [], 'mismatches': {}})
+
+    def test_after_iid_command(self):
+        # Issues created in gitlab cannot be told apart anymore
+        del self.issues[2]
+        for issue in self.issues:
+            issue['iid'] = redmine_id_from_title(issue['title'])
+            issue['title'] = strip_redmine_id(issue['title'])
+        report = self.verifier().run()
+        self.assertEqual(report, {
+            'checked': 2, 'missing': [], 'unexpected': [], 'mismatches': {}})
+
+        self.issues[0]['title'] = 'Support TLS'
+        self.assertEqual(self.verifier().run()['mismatches'],
+                         {1439: ['title']})
+
+    def test_mismatches(self):
+        self.issues[1]['state'] = 'opened'
+        self.notes[2][0]['body'] = 'Forget the cats'
+        del self.issues[0]
+        report = self.verifier().run()
+        self.assertEqual(report['missing'], [1439])
+        self.assertEqual(report['mismatches'], {1732: ['notes', 'state']})
+
+    def test_attachments(self):
+        get_issues = RedmineProject.get_issues
+
+        def get_issues_with_attachment(project, issue_ids):
+            issues = get_issues(project, issue_ids)
+            for i in issues:
+                if i['id'] == 1439:
+                    i.description = 'See attachment:a.log'
+                    i.attachments = (AttachmentRecord(
+                        {'id': 7, 'filename': 'a.log', 'filesize': 3}),)
+            return issues
+
+        with mock.patch.object(RedmineProject, 'get_issues',
+                               get_issues_with_attachment):
+            verifier = self.verifier(attachments=True)
+            description = self.issues[0]['description']
+            self.issues[0]['description'] = \
+                'See [a.log](/uploads/0a1b2c/a.log)' + description
+            self.assertEqual(verifier.run()['mismatches'], {})
+            # Attachment not linked
+            self.issues[0]['description'] = 'See a.log' + description
+            self.assertEqual(verifier.run()['mismatches'],
+                             {1439: ['description']})
@@ -0,0 +1,41 @@
+""" Rate limiting, shared among threads
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """ Token bucket limiting a rate of "units" (requests, bytes...) per second
+
+    Safe to share between threads. A rate of ``None`` (or 0) means no limit.
+    """
+    def __init__(self, rate=None, burst=None):
+        """
+        :param rate: units allowed per second
+        :param burst: max units that can be consumed at once after some
+            idle time, defaults to one second worth of units.
+        """
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """ Blocks until ``amount`` units can be consumed
+
+        An amount bigger than the burst size is allowed, the following
+        callers then wait for the debt to be paid back.
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
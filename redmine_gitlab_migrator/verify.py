@@ -0,0 +1,198 @@
+""" Post-migration parity check between redmine and gitlab issues
+
+Both sides are fetched concurrently, and each issue is reduced, as soon as
+fetched, to a few short digests of its normalized content (title,
+description, notes, state, assignee). Only those digests are kept, never
+the issues themselves.
+
+Redmine issues are converted as the migration does, so what is compared
+is what gitlab should contain. Titles are compared without the redmine id
+prefix, so that a migration can be verified after the iid command too. Links to attachments uploads are compared
+by position only, upload urls being only known to gitlab.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from itertools import islice
+import json
+import logging
+import re
+
+from .converters import (
+    convert_issues, redmine_id_from_title, strip_redmine_id)
+
+log = logging.getLogger(__name__)
+
+FIELDS = ('title', 'description', 'notes', 'state', 'assignee')
+
+# Markdown links to gitlab uploads, and what they are replaced with
+UPLOAD_LINK_RE = re.compile(r'!?\[[^\]\n]*\]\([^)\s]*/uploads/[^)\s]*\)')
+UPLOAD_LINK = '[upload](/uploads/)'
+
+
+def normalize(text):
+    """ Ignore differences gitlab may introduce: line endings, trailing
+    spaces, and upload urls
+    """
+    text = UPLOAD_LINK_RE.sub(UPLOAD_LINK, text or '')
+    return '\n'.join(
+        i.rstrip() for i in text.replace('\r\n', '\n').split('\n')
+    ).strip()
+
+
+def digest(value):
+    # 8 bytes are enough to compare a field, hashlib.blake2b() would need
+    # python 3.6
+    return hashlib.sha1(json.dumps(value).encode()).digest()[:8]
+
+
+def issue_digests(title, description, notes, closed, assignee_id):
+    """ Digests of an issue content, one per compared field
+
+    :param notes: bodies of the notes, in any order
+    :rtype: tuple
+    """
+    return (
+        digest(normalize(title)),
+        digest(normalize(description)),
+        digest(sorted(normalize(i) for i in notes)),
+        digest(closed),
+        digest(assignee_id),
+    )
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ParityVerifier:
+    def __init__(self, redmine_project, gitlab_project, jobs=4,
+                 timeline=None, textile=True, attachments=False):
+        """
+        :param jobs: concurrent requests, on each side
+        :param timeline: timeline notes mode of the migration, see
+            :func:`~redmine_gitlab_migrator.converters.convert_notes`
+        :param textile: whether the migration converted textile markup
+        :param attachments: whether the migration uploaded attachments
+        """
+        self.redmine_project = redmine_project
+        self.gitlab_project = gitlab_project
+        self.jobs = jobs
+        self.timeline = timeline
+        self.textile = textile
+        self.attachments = attachments
+        self.field_values = None
+
+    def _redmine_chunk_digests(self, issue_ids):
+        issues = self.redmine_project.get_issues(issue_ids)
+        redmine_users_index = self.redmine_project.get_users_index(issues)
+        gitlab_users_index = \
+            self.gitlab_project.get_instance().get_users_index()
+        milestones_index = self.gitlab_project.get_milestones_index()
+        uploads = None
+        if self.attachments:
+            # Same links as the migration, but for their urls
+            uploads = {
+                attachment['id']: {'markdown': UPLOAD_LINK}
+                for issue in issues
+                for attachment in issue.get('attachments', [])}
+
+        digests = {}
+        for issue, (data, meta) in zip(issues, convert_issues(
+                issues, redmine_users_index, gitlab_users_index,
+                milestones_index, uploads, textile=self.textile,
+                timeline=self.timeline,
+                field_values=self.field_values)):
+            digests[issue['id']] = issue_digests(
+                strip_redmine_id(data['title']), data['description'],
+                [note['body'] for note, _ in meta['notes']],
+                meta['must_close'], data.get('assignee_id'))
+        return digests
+
+    def redmine_digests(self):
+        """ Digests of the expected gitlab issues, by redmine issue id
+        """
+        self.redmine_project.issue_includes = ('journals', 'relations')
+        if self.attachments:
+            self.redmine_project.issue_includes += ('attachments',)
+        if self.timeline:
+            self.redmine_project.journal_details = True
+            self.field_values = self.redmine_project.get_field_values()
+        issue_ids = self.redmine_project.get_issue_ids()
+        step = self.redmine_project.ISSUE_IDS_PER_REQUEST
+        digests = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for i in executor.map(
+                    self._redmine_chunk_digests,
+                    (issue_ids[i:i + step]
+                     for i in range(0, len(issue_ids), step))):
+                digests.update(i)
+        log.info('{} redmine issues fetched'.format(len(digests)))
+        return digests
+
+    def _gitlab_issue_digests(self, issue):
+        notes = [i['body'] for i in self.gitlab_project.iter_notes(
+            issue['id']) if not i.get('system')]
+        assignee = issue.get('assignee')
+        return issue_digests(
+            strip_redmine_id(issue['title']), issue['description'], notes,
+            issue['state'] == 'closed', assignee and assignee['id'])
+
+    def gitlab_digests(self):
+        """ Digests of migrated gitlab issues, by redmine issue id
+
+        Issues not coming from redmine are ignored. Once the iid command
+        removed redmine ids from titles, iids are redmine ids.
+        """
+        by_iid = not any(
+            redmine_id_from_title(i['title']) is not None
+            for i in self.gitlab_project.iter_issues())
+        if by_iid:
+            log.info('No redmine id found in gitlab titles, issues iids are '
+                     'taken as redmine ids (iid command run)')
+        digests = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for batch in _batches(self.gitlab_project.iter_issues(), 100):
+                migrated = [
+                    (redmine_id, i) for redmine_id, i in (
+                        (i['iid'] if by_iid else
+                         redmine_id_from_title(i['title']), i)
+                        for i in batch)
+                    if redmine_id is not None]
+                digests.update(zip(
+                    (redmine_id for redmine_id, _ in migrated),
+                    executor.map(self._gitlab_issue_digests,
+                                 (i for _, i in migrated))))
+        log.info('{} gitlab issues fetched'.format(len(digests)))
+        return digests
+
+    def run(self):
+        """ Compare both sides
+
+        :return: a report dict: "missing" (redmine ids not found in gitlab),
+            "unexpected" (found in gitlab only) and "mismatches" (dict of the
+            differing fields, by redmine id)
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            redmine = executor.submit(self.redmine_digests)
+            gitlab = executor.submit(self.gitlab_digests)
+            expected, actual = redmine.result(), gitlab.result()
+
+        mismatches = {}
+        for redmine_id, digests in expected.items():
+            found = actual.get(redmine_id)
+            if found is not None and found != digests:
+                mismatches[redmine_id] = [
+                    field for field, a, b in zip(FIELDS, digests, found)
+                    if a != b]
+        return {
+            'checked': len(expected),
+            'missing': sorted(set(expected) - set(actual)),
+            'unexpected': sorted(set(actual) - set(expected)),
+            'mismatches': mismatches,
+        }
@@ -20,6 +20,10 @@ setup(
     url='https://github/oasiswork/migrate-redmine-to-gitlab/',
     packages=['redmine_gitlab_migrator'],
     install_requires=['requests'],
+    extras_require={
+        # Faster JSON decoding, and streamed parsing (--stream-json)
+        'fast': ['orjson', 'ijson'],
+    },
     entry_points={
         'console_scripts': [
             'migrate-rg = redmine_gitlab_migrator.commands:main'